@@ -0,0 +1,13 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Helpers shared by the TensorFlow Lite python application samples
+(image classification and object detection)
+"""
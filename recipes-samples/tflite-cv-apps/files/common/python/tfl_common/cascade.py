@@ -0,0 +1,162 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Detect then classify cascade
+
+The boxes found by the object detection model are cropped from the frame
+already prepared for the detector (no second capture nor resize of the
+camera frame) and classified by an image classification model in a single
+batched invocation.
+"""
+
+import threading
+from timeit import default_timer as timer
+
+import numpy as np
+
+from tfl_common.memory_stats import LazyModule
+from tfl_common.neural_network import DetectionPostProcess
+
+cv2 = LazyModule("cv2")
+
+class CascadePostProcess(DetectionPostProcess):
+    """
+    Post-processing of a SSD object detection model followed by the
+    classification of the detected objects
+
+    get_results() returns the detection results followed by the class index
+    (-1 when the object has not been classified) and the accuracy of each
+    detected object, all with the shape of the detection scores so that the
+    results keep a fixed layout (see shm_transport.output_specs).
+    """
+    def __init__(self, classifier, max_crops, threshold, min_size=8):
+        """
+        :param classifier: NeuralNetwork object using a ClassificationPostProcess
+        :param max_crops: maximum number of objects classified per frame
+        :param threshold: minimal detection score of the classified objects
+        :param min_size: minimal width and height, in pixels, of the crops
+        """
+        self.classifier = classifier
+        self.max_crops = max(1, int(max_crops))
+        self.threshold = threshold
+        self.min_size = min_size
+        # False once the classifier refused a batch size (Edge TPU, delegate)
+        self.batching = True
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def __getstate__(self):
+        return (self.classifier, self.max_crops, self.threshold, self.min_size)
+
+    def __setstate__(self, state):
+        self.classifier, self.max_crops, self.threshold, self.min_size = state
+        self.batching = True
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._crops = None
+        self.frames = 0
+        self.classified = 0
+        self.capped = 0
+        self.too_small = 0
+        self.invocations = 0
+        self.classify_time = 0.0
+
+    def get_labels(self):
+        return self.classifier.get_labels()
+
+    def warm_up(self, runs):
+        self.classifier.warm_up(runs)
+
+    def get_results(self, nn):
+        locations, classes, scores = DetectionPostProcess.get_results(self, nn)
+        crop_classes = np.full(np.shape(scores), -1, dtype=np.int32)
+        crop_scores = np.zeros(np.shape(scores), dtype=np.float32)
+        frame = nn.get_input_frame()
+        if frame is not None:
+            self.classify(frame, locations[0], scores[0], crop_classes[0], crop_scores[0])
+        return (locations, classes, scores, crop_classes, crop_scores)
+
+    def _crop_buffer(self):
+        height, width, channel = self.classifier.get_img_size()
+        if self._crops is None or self._crops.shape[1:] != (height, width, channel):
+            self._crops = np.empty((self.max_crops, height, width, channel), dtype=np.uint8)
+        return self._crops
+
+    def classify(self, frame, locations, scores, crop_classes, crop_scores):
+        """
+        classify the objects detected in frame, the best scores first
+        :param locations: (N, 4) array of normalized y0, x0, y1, x1 locations
+        :param scores: (N,) array of detection scores
+        :param crop_classes: (N,) array receiving the class indexes
+        :param crop_scores: (N,) array receiving the accuracies
+        """
+        with self._lock:
+            self.frames += 1
+            candidates = [i for i in np.argsort(-scores, kind="stable") if scores[i] > self.threshold]
+            if len(candidates) > self.max_crops:
+                # bound the second stage latency
+                self.capped += len(candidates) - self.max_crops
+                candidates = candidates[:self.max_crops]
+
+            crops = self._crop_buffer()
+            height, width = crops.shape[1:3]
+            frame_height, frame_width = frame.shape[:2]
+            selected = []
+            for i in candidates:
+                y0, x0, y1, x1 = np.clip(locations[i], 0.0, 1.0)
+                top, bottom = int(y0 * frame_height), int(y1 * frame_height)
+                left, right = int(x0 * frame_width), int(x1 * frame_width)
+                if bottom - top < self.min_size or right - left < self.min_size:
+                    self.too_small += 1
+                    continue
+                cv2.resize(frame[top:bottom, left:right], (width, height),
+                           dst=crops[len(selected)], interpolation=cv2.INTER_LINEAR)
+                selected.append(i)
+            if not selected:
+                return
+
+            # the batch only grows, re-allocating the tensors on every
+            # frame would cost more than the unused batch entries
+            if self.batching and self.classifier.get_batch_size() < len(selected):
+                try:
+                    self.classifier.set_batch_size(len(selected))
+                except (ValueError, RuntimeError) as error:
+                    print("WARNING: cascade classifier cannot be batched, crops classified one by one: " +
+                          (str(error).splitlines() or ["?"])[0])
+                    self.batching = False
+                    if self.classifier.get_batch_size() != 1:
+                        self.classifier.set_batch_size(1)
+            start_time = timer()
+            if self.batching:
+                self.classifier.launch_batch_inference(crops[:len(selected)])
+                accuracies, labels = self.classifier.get_postprocess().get_batch_results(self.classifier, len(selected))
+                self.invocations += 1
+            else :
+                accuracies = np.empty(len(selected), dtype=np.float32)
+                labels = np.empty(len(selected), dtype=np.int32)
+                for n in range(len(selected)):
+                    self.classifier.launch_inference(crops[n])
+                    accuracies[n], labels[n] = self.classifier.get_postprocess().get_results(self.classifier)
+                self.invocations += len(selected)
+            self.classify_time += timer() - start_time
+            self.classified += len(selected)
+            for n, i in enumerate(selected):
+                crop_classes[i] = labels[n]
+                crop_scores[i] = accuracies[n]
+
+    def summary(self):
+        with self._lock:
+            avg_time = self.classify_time / self.invocations * 1000 if self.invocations else 0.0
+            return ("cascade: {0} frames, {1} objects classified in {2} invocations "
+                    "(avg {3:.1f} ms), {4} capped, {5} too small").format(
+                    self.frames, self.classified, self.invocations, avg_time,
+                    self.capped, self.too_small)
@@ -0,0 +1,221 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Automatic selection of the fastest execution configuration of a model
+
+Each candidate configuration (CPU with several numbers of threads, the
+external delegates, the Coral Edge TPU when plugged) runs the actual model
+on a random input, the candidate with the lowest median latency is
+selected. The decision and the measurements are stored per model, the
+benchmark is run again when the model or the candidates change.
+"""
+
+import json
+import os
+import subprocess
+import time
+from timeit import default_timer as timer
+
+import numpy as np
+
+from tfl_common.neural_network import LIBTPU_STD_PATH, LIBTPU_MAX_PATH
+from tfl_common.neural_network import edgetpu_connected, interpreter_backend
+from tfl_common.prediction_cache import cache_key
+
+DEFAULT_STORE = os.path.join(os.path.expanduser("~"), ".cache", "tflite-cv-apps", "delegate_select.json")
+
+class Candidate:
+    """
+    Execution configuration of a model: an optional delegate library and a
+    number of interpreter threads
+    """
+    def __init__(self, name, delegate=None, num_threads=1, unavailable=None):
+        """
+        :param unavailable: reason why the candidate cannot be benchmarked,
+                            None if it can
+        """
+        self.name = name
+        self.delegate = delegate
+        self.num_threads = num_threads
+        self.unavailable = unavailable
+
+    def to_dict(self):
+        return {"name": self.name, "delegate": self.delegate, "num_threads": self.num_threads}
+
+def thread_counts(max_threads):
+    """
+    :return: 1, 2, 4... up to max_threads, max_threads included
+    """
+    counts = []
+    count = 1
+    while count < max_threads:
+        counts.append(count)
+        count *= 2
+    counts.append(max(1, max_threads))
+    return counts
+
+def list_candidates(ext_delegates=(), max_threads=None, edgetpu_paths=(LIBTPU_STD_PATH, LIBTPU_MAX_PATH)):
+    """
+    :param ext_delegates: paths of the external delegate libraries to try
+    :param max_threads: maximal number of interpreter threads, number of
+                        cores by default
+    :return: list of Candidate objects
+    """
+    if max_threads is None:
+        max_threads = os.cpu_count() or 1
+    candidates = [Candidate("cpu {0} thread{1}".format(n, "s" if n > 1 else ""), None, n)
+                  for n in thread_counts(max_threads)]
+    for library in ext_delegates:
+        unavailable = None if os.path.exists(library) else "library not found"
+        candidates.append(Candidate("delegate " + os.path.basename(library), library,
+                                    max_threads, unavailable))
+    try:
+        plugged = edgetpu_connected()
+    except (OSError, subprocess.CalledProcessError):
+        plugged = False
+    for library in edgetpu_paths:
+        if not plugged:
+            unavailable = "no Edge TPU plugged"
+        elif not os.path.exists(library):
+            unavailable = "library not found"
+        else:
+            unavailable = None
+        candidates.append(Candidate("edgetpu " + os.path.basename(library), library,
+                                    max_threads, unavailable))
+    return candidates
+
+def benchmark(model_file, candidate, runs=10, warmup=2):
+    """
+    :return: median latency in seconds of an inference of the model with the
+             configuration of candidate
+    """
+    backend = interpreter_backend(model_file)
+    if candidate.delegate is not None:
+        interpreter = backend.Interpreter(model_path=model_file,
+                                          num_threads=candidate.num_threads,
+                                          experimental_delegates=[backend.load_delegate(candidate.delegate)])
+    else:
+        interpreter = backend.Interpreter(model_path=model_file, num_threads=candidate.num_threads)
+    interpreter.allocate_tensors()
+    details = interpreter.get_input_details()[0]
+    if details["dtype"] == np.float32:
+        data = np.random.uniform(-1.0, 1.0, details["shape"]).astype(np.float32)
+    else:
+        data = np.random.randint(0, 256, details["shape"]).astype(details["dtype"])
+    interpreter.set_tensor(details["index"], data)
+    for _ in range(warmup):
+        interpreter.invoke()
+    durations = []
+    for _ in range(runs):
+        start_time = timer()
+        interpreter.invoke()
+        durations.append(timer() - start_time)
+    return float(np.median(durations))
+
+class DelegateSelection:
+    """
+    Result of the benchmark of the candidates of a model
+    """
+    def __init__(self, model_file, selected, results, date, cached=False):
+        """
+        :param selected: dictionary of the selected Candidate
+        :param results: list of (candidate name, latency in seconds or None,
+                        reason of the failure or None)
+        """
+        self.model_file = model_file
+        self.selected = selected
+        self.results = results
+        self.date = date
+        self.cached = cached
+
+    @property
+    def delegate(self):
+        return self.selected["delegate"]
+
+    @property
+    def num_threads(self):
+        return self.selected["num_threads"]
+
+    def explain(self):
+        """
+        :return: text explaining the selection
+        """
+        origin = "stored decision of " + time.strftime("%Y-%m-%d %H:%M", time.localtime(self.date)) \
+                 if self.cached else "benchmark"
+        lines = ["delegate auto-selection for {0} ({1}):".format(self.model_file, origin)]
+        for name, latency, reason in self.results:
+            if latency is None:
+                lines.append("  {0:32} {1}".format(name, reason))
+            else:
+                lines.append("  {0:32} {1:8.2f} ms".format(name, latency * 1000))
+        timed = sorted((latency, name) for name, latency, reason in self.results if latency is not None)
+        if len(timed) > 1:
+            lines.append("selected {0}: {1:.2f} ms median latency, {2:.2f}x faster than {3}".format(
+                         timed[0][1], timed[0][0] * 1000, timed[1][0] / timed[0][0], timed[1][1]))
+        else:
+            lines.append("selected {0}: only candidate which could run the model".format(self.selected["name"]))
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {"model": self.model_file, "selected": self.selected,
+                "results": self.results, "date": self.date}
+
+def _load_store(store_path):
+    try:
+        with open(store_path, "r") as store_file:
+            return json.load(store_file)
+    except (OSError, ValueError):
+        return {}
+
+def _save_store(store_path, store):
+    try:
+        os.makedirs(os.path.dirname(store_path), exist_ok=True)
+        tmp_path = store_path + ".tmp"
+        with open(tmp_path, "w") as store_file:
+            json.dump(store, store_file, indent=1)
+        os.replace(tmp_path, store_path)
+    except OSError as error:
+        print("WARNING: delegate selection not stored in " + store_path + ": " + str(error))
+
+def select_delegate(model_file, candidates, store_path=DEFAULT_STORE, runs=10):
+    """
+    benchmark the candidates on the model, or reuse the stored decision
+    :return: DelegateSelection object, None if no candidate could run the
+             model
+    """
+    # a decision taken without a candidate (Edge TPU unplugged, missing
+    # library) is not reused once it becomes available
+    key = cache_key([model_file], [dict(c.to_dict(), available=c.unavailable is None)
+                                   for c in candidates])[0]
+    store = _load_store(store_path)
+    entry = store.get(key)
+    if entry is not None:
+        return DelegateSelection(model_file, entry["selected"], entry["results"], entry["date"], cached=True)
+
+    results = []
+    best = None
+    for candidate in candidates:
+        if candidate.unavailable is not None:
+            results.append((candidate.name, None, "not available: " + candidate.unavailable))
+            continue
+        try:
+            latency = benchmark(model_file, candidate, runs)
+        except (OSError, ValueError, RuntimeError) as error:
+            results.append((candidate.name, None, "failed: " + (str(error).splitlines() or [type(error).__name__])[0]))
+            continue
+        results.append((candidate.name, latency, None))
+        if best is None or latency < best[0]:
+            best = (latency, candidate)
+    if best is None:
+        return None
+    selection = DelegateSelection(model_file, best[1].to_dict(), results, time.time())
+    store[key] = selection.to_dict()
+    _save_store(store_path, store)
+    return selection
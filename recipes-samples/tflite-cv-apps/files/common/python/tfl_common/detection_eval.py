@@ -0,0 +1,308 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Accuracy evaluation of an object detection model
+
+The raw predictions of each picture (all the detections, whatever their
+score) are stored with the ground truth of the picture, read from the
+"objects_info" list of its validation .json file. The predictions are
+matched once per IoU threshold, the average precision of each class, the
+mAP@.5 and the COCO style mAP@[.5:.95] and the precision and recall of any
+score threshold are then computed from these cached matches.
+
+The predictions can be saved to a .npz file and evaluated again later:
+
+    python3 -m tfl_common.detection_eval predictions.npz --thresholds 0.3 0.5 0.7
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+# IoU thresholds of the COCO mAP@[.5:.95]
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+# recall points of the COCO interpolated precision
+RECALL_POINTS = np.linspace(0.0, 1.0, 101)
+
+def load_ground_truth(json_path):
+    """
+    :return: (names, boxes) of the objects of a validation .json file, boxes
+             is a (N, 4) array of normalized x0, y0, x1, y1 locations
+    """
+    with open(json_path) as json_file:
+        data = json.load(json_file)
+    names = []
+    boxes = []
+    for obj in data['objects_info']:
+        names.append(obj['name'])
+        boxes.append((float(obj['x0']), float(obj['y0']), float(obj['x1']), float(obj['y1'])))
+    return names, np.array(boxes, dtype=np.float32).reshape(-1, 4)
+
+def box_iou(boxes_a, boxes_b):
+    """
+    :param boxes_a: (N, 4) array of x0, y0, x1, y1 boxes
+    :param boxes_b: (M, 4) array of x0, y0, x1, y1 boxes
+    :return: (N, M) array of the intersection over union of each pair
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(1, -1, 4)
+    width = np.clip(np.minimum(boxes_a[..., 2], boxes_b[..., 2]) -
+                    np.maximum(boxes_a[..., 0], boxes_b[..., 0]), 0.0, None)
+    height = np.clip(np.minimum(boxes_a[..., 3], boxes_b[..., 3]) -
+                     np.maximum(boxes_a[..., 1], boxes_b[..., 1]), 0.0, None)
+    intersection = width * height
+    area_a = (boxes_a[..., 2] - boxes_a[..., 0]) * (boxes_a[..., 3] - boxes_a[..., 1])
+    area_b = (boxes_b[..., 2] - boxes_b[..., 0]) * (boxes_b[..., 3] - boxes_b[..., 1])
+    union = area_a + area_b - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+def match_predictions(iou, pred_labels, gt_labels, iou_thresholds):
+    """
+    greedy matching of the predictions of a picture, in decreasing score
+    order, with the unmatched ground truth object of the same class having
+    the highest IoU
+    :param iou: (P, G) IoU of the predictions sorted by decreasing score
+    :return: (T, P) boolean array, True for the true positives at each IoU
+             threshold
+    """
+    true_positives = np.zeros((len(iou_thresholds), len(pred_labels)), dtype=bool)
+    if iou.size == 0:
+        return true_positives
+    same_class = np.asarray(pred_labels)[:, np.newaxis] == np.asarray(gt_labels)[np.newaxis, :]
+    iou = np.where(same_class, iou, -1.0)
+    for t, threshold in enumerate(iou_thresholds):
+        available = np.ones(len(gt_labels), dtype=bool)
+        for p in range(len(pred_labels)):
+            candidates = np.where(available, iou[p], -1.0)
+            best = int(np.argmax(candidates))
+            if candidates[best] >= threshold:
+                available[best] = False
+                true_positives[t, p] = True
+    return true_positives
+
+def average_precision(true_positives, num_objects):
+    """
+    :param true_positives: (T, P) boolean array of the predictions of a class
+                           sorted by decreasing score
+    :param num_objects: number of ground truth objects of the class
+    :return: (T,) array of the 101 points interpolated average precision
+    """
+    if true_positives.shape[1] == 0:
+        return np.zeros(true_positives.shape[0])
+    cum_tp = np.cumsum(true_positives, axis=1)
+    cum_fp = np.cumsum(~true_positives, axis=1)
+    recall = cum_tp / num_objects
+    precision = cum_tp / (cum_tp + cum_fp)
+    # precision envelope, the best precision at any higher recall
+    precision = np.maximum.accumulate(precision[:, ::-1], axis=1)[:, ::-1]
+    ap = np.zeros(true_positives.shape[0])
+    for t in range(true_positives.shape[0]):
+        index = np.searchsorted(recall[t], RECALL_POINTS, side='left')
+        valid = index < precision.shape[1]
+        ap[t] = precision[t, index[valid]].sum() / len(RECALL_POINTS)
+    return ap
+
+def _concat(items, index, shape, dtype):
+    """
+    :return: concatenation of the index-th array of each item
+    """
+    if not items:
+        return np.zeros(shape, dtype=dtype)
+    return np.concatenate([item[index] for item in items])
+
+class DetectionEvaluator:
+    """
+    Class that accumulates the raw predictions and the ground truth of the
+    evaluated pictures and computes the detection accuracy metrics
+    """
+    def __init__(self, iou_thresholds=IOU_THRESHOLDS):
+        self.iou_thresholds = np.asarray(iou_thresholds, dtype=np.float64)
+        self.sources = []
+        self.inference_times = []
+        # per picture (boxes, labels, scores) of the predictions, sorted by
+        # decreasing score, and (boxes, labels) of the ground truth
+        self._predictions = []
+        self._ground_truth = []
+        self._matches = []
+
+    def add(self, source, boxes, labels, scores, gt_boxes, gt_labels, inference_time=None):
+        """
+        add the predictions of a picture
+        :param boxes: (P, 4) array of x0, y0, x1, y1 predicted locations
+        :param labels: P predicted class names
+        :param scores: P prediction scores
+        :param gt_boxes: (G, 4) array of x0, y0, x1, y1 ground truth locations
+        :param gt_labels: G ground truth class names
+        :param inference_time: inference time in seconds of the picture
+        """
+        scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        order = np.argsort(-scores, kind="stable")
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)[order]
+        labels = np.asarray(labels, dtype=str).reshape(-1)[order]
+        gt_boxes = np.asarray(gt_boxes, dtype=np.float32).reshape(-1, 4)
+        gt_labels = np.asarray(gt_labels, dtype=str).reshape(-1)
+        self.sources.append(str(source))
+        self.inference_times.append(np.nan if inference_time is None else inference_time)
+        self._predictions.append((boxes, labels, scores[order]))
+        self._ground_truth.append((gt_boxes, gt_labels))
+        self._matches.append(match_predictions(box_iou(boxes, gt_boxes), labels,
+                                               gt_labels, self.iou_thresholds))
+
+    def __len__(self):
+        return len(self.sources)
+
+    def _gather(self):
+        """
+        :return: (labels, scores, true_positives) of all the predictions
+                 sorted by decreasing score and the ground truth labels
+        """
+        num_thresholds = len(self.iou_thresholds)
+        if not self._predictions:
+            return (np.zeros(0, dtype=str), np.zeros(0, dtype=np.float32),
+                    np.zeros((num_thresholds, 0), dtype=bool), np.zeros(0, dtype=str))
+        labels = np.concatenate([p[1] for p in self._predictions])
+        scores = np.concatenate([p[2] for p in self._predictions])
+        true_positives = np.concatenate(self._matches, axis=1)
+        gt_labels = np.concatenate([g[1] for g in self._ground_truth])
+        order = np.argsort(-scores, kind="stable")
+        return labels[order], scores[order], true_positives[:, order], gt_labels
+
+    def evaluate(self):
+        """
+        :return: dictionary of the (T,) average precision of each class
+                 having ground truth objects, by IoU threshold
+        """
+        labels, scores, true_positives, gt_labels = self._gather()
+        results = {}
+        for name in np.unique(gt_labels):
+            selected = labels == name
+            results[str(name)] = average_precision(true_positives[:, selected],
+                                                   int(np.count_nonzero(gt_labels == name)))
+        return results
+
+    def _iou_index(self, iou_threshold):
+        index = np.flatnonzero(np.isclose(self.iou_thresholds, iou_threshold))
+        if len(index) == 0:
+            raise ValueError("IoU threshold {0} is not evaluated".format(iou_threshold))
+        return int(index[0])
+
+    def mean_average_precision(self, iou_threshold=None):
+        """
+        :param iou_threshold: None for the mAP averaged over all the IoU
+                              thresholds
+        :return: mean over the classes of the average precision
+        """
+        results = self.evaluate()
+        if not results:
+            return 0.0
+        ap = np.array(list(results.values()))
+        if iou_threshold is None:
+            return float(ap.mean())
+        return float(ap[:, self._iou_index(iou_threshold)].mean())
+
+    def sweep(self, score_thresholds, iou_threshold=0.5):
+        """
+        precision and recall of the predictions with a score above each
+        threshold, the greedy matching being done in decreasing score order
+        the matches of a threshold are the first matches of the full list
+        :return: (N, 4) array of threshold, precision, recall, F1 score
+        """
+        labels, scores, true_positives, gt_labels = self._gather()
+        thresholds = np.asarray(score_thresholds, dtype=np.float64).reshape(-1)
+        cum_tp = np.concatenate(([0], np.cumsum(true_positives[self._iou_index(iou_threshold)])))
+        # number of predictions with a score strictly above each threshold
+        count = np.searchsorted(-scores, -thresholds, side='left')
+        tp = cum_tp[count]
+        precision = np.divide(tp, count, out=np.zeros(len(thresholds)), where=count > 0)
+        recall = tp / len(gt_labels) if len(gt_labels) else np.zeros(len(thresholds))
+        denominator = precision + recall
+        f1 = np.divide(2 * precision * recall, denominator,
+                       out=np.zeros(len(thresholds)), where=denominator > 0)
+        return np.stack((thresholds, precision, recall, f1), axis=1)
+
+    def report(self, score_thresholds=np.arange(0.1, 1.0, 0.1), iou_threshold=0.5):
+        """
+        :return: text report of the per class AP, the mAP and the score
+                 threshold sweep
+        """
+        results = self.evaluate()
+        gt_labels = self._gather()[3]
+        num_predictions = sum(len(p[2]) for p in self._predictions)
+        lines = ["detection evaluation: {0} pictures, {1} objects, {2} predictions".format(
+                 len(self), len(gt_labels), num_predictions)]
+        times = np.array(self.inference_times, dtype=np.float64)
+        if np.any(~np.isnan(times)):
+            lines.append("  avg inference time {0:.2f} ms".format(np.nanmean(times) * 1000))
+        index = self._iou_index(0.5)
+        lines.append("  {0:20} {1:>7} {2:>12} {3:>8}".format("class", "AP@.5", "AP@[.5:.95]", "objects"))
+        for name in sorted(results):
+            lines.append("  {0:20} {1:7.3f} {2:12.3f} {3:8d}".format(
+                         name, results[name][index], results[name].mean(),
+                         int(np.count_nonzero(gt_labels == name))))
+        if results:
+            ap = np.array(list(results.values()))
+            lines.append("  mAP@.5 {0:.3f}, mAP@[.5:.95] {1:.3f}".format(ap[:, index].mean(), ap.mean()))
+        lines.append("  score threshold sweep (IoU {0:.2f}):".format(iou_threshold))
+        lines.append("  {0:>9} {1:>9} {2:>7} {3:>7}".format("threshold", "precision", "recall", "F1"))
+        for threshold, precision, recall, f1 in self.sweep(score_thresholds, iou_threshold):
+            lines.append("  {0:9.2f} {1:9.3f} {2:7.3f} {3:7.3f}".format(threshold, precision, recall, f1))
+        return "\n".join(lines)
+
+    def save(self, path):
+        """
+        store the raw predictions and the ground truth in a .npz file
+        """
+        pred_counts = [len(p[2]) for p in self._predictions]
+        gt_counts = [len(g[1]) for g in self._ground_truth]
+        np.savez(path,
+                 iou_thresholds=self.iou_thresholds,
+                 sources=np.array(self.sources, dtype=str),
+                 inference_times=np.array(self.inference_times, dtype=np.float64),
+                 pred_counts=np.array(pred_counts, dtype=np.int64),
+                 pred_boxes=_concat(self._predictions, 0, (0, 4), np.float32),
+                 pred_labels=_concat(self._predictions, 1, (0,), str),
+                 pred_scores=_concat(self._predictions, 2, (0,), np.float32),
+                 gt_counts=np.array(gt_counts, dtype=np.int64),
+                 gt_boxes=_concat(self._ground_truth, 0, (0, 4), np.float32),
+                 gt_labels=_concat(self._ground_truth, 1, (0,), str))
+
+    @classmethod
+    def load(cls, path):
+        """
+        :return: DetectionEvaluator holding the predictions of a .npz file
+                 written by save()
+        """
+        with np.load(path) as npz:
+            data = {key: npz[key] for key in npz.files}
+        evaluator = cls(data["iou_thresholds"])
+        pred_offsets = np.concatenate(([0], np.cumsum(data["pred_counts"])))
+        gt_offsets = np.concatenate(([0], np.cumsum(data["gt_counts"])))
+        for i, source in enumerate(data["sources"]):
+            pred = slice(pred_offsets[i], pred_offsets[i + 1])
+            gt = slice(gt_offsets[i], gt_offsets[i + 1])
+            inference_time = float(data["inference_times"][i])
+            evaluator.add(source, data["pred_boxes"][pred], data["pred_labels"][pred],
+                          data["pred_scores"][pred], data["gt_boxes"][gt],
+                          data["gt_labels"][gt],
+                          None if np.isnan(inference_time) else inference_time)
+        return evaluator
+
+def main():
+    parser = argparse.ArgumentParser(description="evaluate the predictions stored by objdetect_tfl.py --evaluate")
+    parser.add_argument("predictions", help=".npz file of the raw predictions")
+    parser.add_argument("--thresholds", nargs='+', type=float, default=list(np.arange(0.1, 1.0, 0.1)),
+                        help="score thresholds of the precision / recall sweep")
+    parser.add_argument("--iou", default=0.5, type=float, help="IoU threshold of the sweep (default 0.5)")
+    args = parser.parse_args()
+    print(DetectionEvaluator.load(args.predictions).report(args.thresholds, args.iou))
+
+if __name__ == '__main__':
+    main()
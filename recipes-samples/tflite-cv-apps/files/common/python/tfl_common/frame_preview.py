@@ -0,0 +1,96 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Still picture preview painted with cairo
+
+The picture is converted once into the pixel buffer of a cairo image
+surface and painted on the drawing area, under the labels and the boxes,
+instead of going through PIL, GLib.Bytes and a GdkPixbuf copy.
+"""
+
+import sys
+
+import numpy as np
+
+from tfl_common.memory_stats import LazyModule
+
+cairo = LazyModule("cairo")
+
+# index of the red, green and blue bytes in a cairo FORMAT_RGB24 pixel,
+# which is a native endian 32 bits 0x00RRGGBB word
+if sys.byteorder == "little":
+    RGB24_CHANNELS = slice(2, None, -1)
+else:
+    RGB24_CHANNELS = slice(1, 4)
+
+def rgb24_stride(width):
+    """
+    :return: number of bytes per row of a cairo FORMAT_RGB24 surface
+    """
+    return cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_RGB24, width)
+
+def pack_rgb24(frame, out):
+    """
+    copy a frame in the cairo FORMAT_RGB24 pixel layout
+    :param frame: (height, width) gray, (height, width, 3) RGB or
+                  (height, width, 4) RGBA uint8 array
+    :param out: (height, stride / 4, 4) uint8 array receiving the pixels
+    :return: out
+    """
+    height, width = frame.shape[:2]
+    pixels = out[:height, :width, RGB24_CHANNELS]
+    if frame.ndim == 2:
+        pixels[...] = frame[:, :, np.newaxis]
+    else:
+        pixels[...] = frame[:, :, :3]
+    return out
+
+class FramePreview:
+    """
+    Cairo image surface holding the still picture displayed in the drawing
+    area
+
+    The surface and its pixel buffer are kept while the size of the
+    pictures does not change, each new picture costs a single copy.
+    """
+    def __init__(self):
+        self.width = 0
+        self.height = 0
+        self._pixels = None
+        self._surface = None
+
+    def set_frame(self, frame):
+        """
+        :param frame: uint8 array of the picture, see pack_rgb24
+        """
+        height, width = frame.shape[:2]
+        if self._surface is None or (width, height) != (self.width, self.height):
+            stride = rgb24_stride(width)
+            self._pixels = np.zeros((height, stride // 4, 4), dtype=np.uint8)
+            self._surface = cairo.ImageSurface.create_for_data(self._pixels, cairo.FORMAT_RGB24,
+                                                               width, height, stride)
+            self.width = width
+            self.height = height
+        else:
+            self._surface.flush()
+        pack_rgb24(frame, self._pixels)
+        self._surface.mark_dirty()
+
+    def is_empty(self):
+        return self._surface is None
+
+    def draw(self, cr, x, y):
+        """
+        paint the picture with its top left corner at (x, y)
+        """
+        if self._surface is None:
+            return
+        cr.set_source_surface(self._surface, x, y)
+        cr.paint()
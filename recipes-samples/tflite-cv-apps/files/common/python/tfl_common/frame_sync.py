@@ -0,0 +1,116 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Synchronization of the displayed frames with the inference results
+
+In the synchronized display mode the frames of the display branch are kept
+in a small ring instead of being displayed as they arrive. When the result
+of a frame is published, that frame is displayed so that the overlay
+matches the picture. The display then lags behind the camera by the
+inference latency, when this added latency exceeds the configured maximum
+the live frames are displayed until the results catch up again.
+"""
+
+import threading
+from collections import deque
+
+NANOSECONDS = 1000000000
+
+class FrameSynchronizer:
+    """
+    Ring of the recent display frames keyed by their presentation timestamp
+    (pts, in nanoseconds) deciding which frame is displayed
+
+    add_frame() and add_result() return the frame to display, or None. Their
+    now parameter is the pipeline running time in nanoseconds, the added
+    latency of a frame is the time elapsed since it entered the ring.
+    """
+    def __init__(self, max_latency, capacity=8):
+        """
+        :param max_latency: maximal added display latency in seconds
+        :param capacity: number of frames kept in the ring
+        """
+        self.max_latency = int(max_latency * NANOSECONDS)
+        self.capacity = max(2, capacity)
+        self._frames = deque()
+        self._lock = threading.Lock()
+        # live until the first result
+        self._synced = False
+        self._last_presented = -1
+        # statistics
+        self.synced_frames = 0
+        self.live_frames = 0
+        self.fallbacks = 0
+        self.added_latency = 0
+
+    def is_synced(self):
+        return self._synced
+
+    def add_frame(self, pts, frame, now):
+        """
+        new frame of the display branch
+        :return: frame to display now, None to hold it
+        """
+        with self._lock:
+            self._frames.append((pts, now, frame))
+            if len(self._frames) > self.capacity:
+                self._frames.popleft()
+            if self._synced:
+                held = [arrival for frame_pts, arrival, _ in self._frames
+                        if frame_pts > self._last_presented]
+                if not held or now - held[0] <= self.max_latency:
+                    return None
+                # no result in time, display the live frames
+                self._synced = False
+                self.fallbacks += 1
+            self._last_presented = pts
+            self.live_frames += 1
+            return frame
+
+    def add_result(self, pts, now):
+        """
+        new inference result of the frame with the given pts
+        :return: frame to display now, None if there is none
+        """
+        with self._lock:
+            if pts < 0 or not self._frames:
+                return None
+            match = None
+            for frame_pts, arrival, frame in reversed(self._frames):
+                if frame_pts <= pts:
+                    match = (frame_pts, frame)
+                    break
+            if match is None:
+                # the frame already left the ring
+                return None
+            added_latency = now - arrival
+            if added_latency > self.max_latency:
+                if self._synced:
+                    self._synced = False
+                    self.fallbacks += 1
+                return None
+            self._synced = True
+            if match[0] <= self._last_presented:
+                # a newer frame is already displayed
+                return None
+            while self._frames and self._frames[0][0] <= match[0]:
+                self._frames.popleft()
+            self._last_presented = match[0]
+            self.synced_frames += 1
+            self.added_latency += added_latency
+            return match[1]
+
+    def summary(self):
+        with self._lock:
+            avg_latency = self.added_latency / self.synced_frames / NANOSECONDS * 1000 \
+                          if self.synced_frames else 0.0
+            return ("display sync: {0} synchronized frames (avg added latency {1:.1f} ms), "
+                    "{2} live frames, {3} fallbacks to live").format(
+                    self.synced_frames, avg_latency, self.live_frames, self.fallbacks)
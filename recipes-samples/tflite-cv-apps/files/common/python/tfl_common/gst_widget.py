@@ -0,0 +1,512 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+import math
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+import gi
+gi.require_version('Gtk', '3.0')
+gi.require_version('Gst', '1.0')
+from gi.repository import Gtk
+from gi.repository import GLib
+from gi.repository import Gst
+import numpy as np
+
+from tfl_common.frame_sync import FrameSynchronizer
+from tfl_common.memory_stats import read_process_memory
+from tfl_common.pipeline_metrics import PipelineProbes
+from tfl_common.rate_controller import CpuLoadMonitor
+
+class GstWidget(Gtk.Box):
+    """
+    Class that handles Gstreamer pipeline using gtksink and appsink
+
+    The display sink wrapped by the fpsdisplaysink is selected by
+    --display_sink: gtksink embedded in the widget, waylandsink or kmssink
+    displaying the video outside of GTK, or fakesink for the headless
+    throughput measurements.
+
+    The window owning the widget provides the shared state of the
+    application: metrics, dcmipp_camera, inference_process, the result
+    hand-off, the optional rate controller, scene gate and telemetry, and
+    the task specific export_results(results, pts) callback.
+    The results are published from the streaming thread and applied by
+    window.results_ready_cb() on the GTK thread.
+
+    When an overlay is given (PipelineOverlay), the results are drawn on
+    the frames by a cairooverlay element of the display branch instead of a
+    GTK widget stacked over the video.
+    """
+    def __init__(self, window, nn, args, overlay=None):
+         super().__init__()
+         # connect the gtkwidget with the realize callback
+         self.connect('realize', self._on_realize)
+         self.instant_fps = 0
+         self.window = window
+         self.nn = nn
+         self.args = args
+         # frame buffer reused in low memory mode
+         self._frame = None
+         # capture time of the frames handed to the inference process, by pts
+         self._capture_times = OrderedDict()
+         # synchronized display mode, see frame_sync
+         self.frame_sync = None
+         # results drawn inside the pipeline
+         self.overlay = overlay
+         # CPU load and display fps averages comparing the rendering modes
+         self.cpu_monitor = CpuLoadMonitor()
+         self.cpu_load_sum = 0.0
+         self.cpu_load_count = 0
+         self.display_fps_sum = 0.0
+         self.display_fps_count = 0
+
+    def _on_realize(self, widget):
+            """
+            creation of the gstreamer pipeline when gstwidget is created
+            """
+            args = self.args
+            nn_input_height, nn_input_width, nn_input_channel = self.nn.get_img_size()
+
+            # gstreamer pipeline creation
+            self.pipeline = Gst.Pipeline()
+
+            # creation of the source v4l2src
+            if args.videotestsrc:
+                # test pattern source used to run the application without camera
+                self.v4lsrc1 = Gst.ElementFactory.make("videotestsrc", "source")
+                self.v4lsrc1.set_property("is-live", True)
+            else :
+                self.v4lsrc1 = Gst.ElementFactory.make("v4l2src", "source")
+                video_device = "/dev/video" + str(args.video_device)
+                self.v4lsrc1.set_property("device", video_device)
+
+            #creation of the v4l2src caps
+            if self.window.dcmipp_camera :
+                caps = "video/x-raw,format = RGB16, width=" + str(args.frame_width) +",height=" + str(args.frame_height) + ", framerate=" + str(args.framerate)+ "/1"
+            else:
+                caps = "video/x-raw, width=" + str(args.frame_width) +",height=" + str(args.frame_height) + ", framerate=" + str(args.framerate)+ "/1"
+            camera1caps = Gst.Caps.from_string(caps)
+            self.camerafilter1 = Gst.ElementFactory.make("capsfilter", "filter1")
+            self.camerafilter1.set_property("caps", camera1caps)
+
+            # creation of the videoconvert elements
+            self.videoformatconverter1 = Gst.ElementFactory.make("videoconvert", "video_convert1")
+            self.videoformatconverter2 = Gst.ElementFactory.make("videoconvert", "video_convert2")
+
+            self.tee = Gst.ElementFactory.make("tee", "tee")
+
+            # creation and configuration of the queue elements
+            self.queue1 = Gst.ElementFactory.make("queue", "queue-1")
+            self.queue2 = Gst.ElementFactory.make("queue", "queue-2")
+            self.queue1.set_property("max-size-buffers", 1)
+            self.queue1.set_property("leaky", 2)
+            self.queue2.set_property("max-size-buffers", 1)
+            self.queue2.set_property("leaky", 2)
+
+            # creation and configuration of the appsink element
+            self.appsink = Gst.ElementFactory.make("appsink", "appsink")
+            nn_caps = "video/x-raw, format = RGB, width=" + str(nn_input_width) + ",height=" + str(nn_input_height)
+            nncaps = Gst.Caps.from_string(nn_caps)
+            self.appsink.set_property("caps", nncaps)
+            self.appsink.set_property("emit-signals", True)
+            self.appsink.set_property("sync", False)
+            self.appsink.set_property("max-buffers", 1)
+            self.appsink.set_property("drop", True)
+            self.appsink.connect("new-sample", self.new_sample)
+
+            # creation of the sink element displaying the gstreamer video stream
+            self.video_sink = self.make_video_sink(args.display_sink)
+
+            # creation and configuration of the fpsdisplaysink element to measure display fps
+            self.fps_disp_sink = Gst.ElementFactory.make("fpsdisplaysink", "fpsmeasure1")
+            self.fps_disp_sink.set_property("signal-fps-measurements", True)
+            self.fps_disp_sink.set_property("fps-update-interval", 2000)
+            self.fps_disp_sink.set_property("text-overlay", False)
+            self.fps_disp_sink.set_property("video-sink", self.video_sink)
+            self.fps_disp_sink.connect("fps-measurements",self.get_fps_display)
+
+            if args.sync_display:
+                # the display frames go through an appsink holding them until
+                # the inference result of the same frame, then through an
+                # appsrc feeding the fpsdisplaysink
+                ring_size = int(math.ceil(args.max_display_latency / 1000 * float(args.framerate))) + 2
+                self.frame_sync = FrameSynchronizer(args.max_display_latency / 1000, ring_size)
+                self.display_appsink = Gst.ElementFactory.make("appsink", "display-appsink")
+                self.display_appsink.set_property("emit-signals", True)
+                self.display_appsink.set_property("sync", False)
+                self.display_appsink.connect("new-sample", self.new_display_sample)
+                # the held frames are converted to a format the display sink
+                # and cairo accept, the appsrc links straight to the sink
+                self.display_appsink.set_property("caps", Gst.Caps.from_string("video/x-raw, format=BGRx"))
+                self.display_src = Gst.ElementFactory.make("appsrc", "display-src")
+                self.display_src.set_property("format", Gst.Format.TIME)
+                self.display_src.set_property("is-live", True)
+                # the held frames are late by design
+                self.fps_disp_sink.set_property("sync", False)
+
+            if self.overlay is not None:
+                # the results are drawn on the frames just before the sink
+                self.cairo_overlay = Gst.ElementFactory.make("cairooverlay", "cairo-overlay")
+                self.cairo_overlay.connect("draw", self.draw_overlay)
+                self.cairo_overlay.connect("caps-changed", self.overlay_caps_changed)
+
+            # creation of the video rate and video scale elements
+            self.video_rate = Gst.ElementFactory.make("videorate", "video-rate")
+            self.video_scale = Gst.ElementFactory.make("videoscale", "video-scale")
+
+            # Add all elements to the pipeline
+            self.pipeline.add(self.v4lsrc1)
+            self.pipeline.add(self.camerafilter1)
+            self.pipeline.add(self.videoformatconverter1)
+            self.pipeline.add(self.videoformatconverter2)
+            self.pipeline.add(self.tee)
+            self.pipeline.add(self.queue1)
+            self.pipeline.add(self.queue2)
+            self.pipeline.add(self.appsink)
+            self.pipeline.add(self.fps_disp_sink)
+            self.pipeline.add(self.video_rate)
+            self.pipeline.add(self.video_scale)
+            if self.frame_sync is not None:
+                self.pipeline.add(self.display_appsink)
+                self.pipeline.add(self.display_src)
+            if self.overlay is not None:
+                self.pipeline.add(self.cairo_overlay)
+
+            # linking elements together
+            #                              -> queue 1 -> videoconvert -> fpsdisplaysink
+            # v4l2src -> video rate -> tee
+            #                              -> queue 2 -> videoconvert -> video scale -> appsink
+            self.v4lsrc1.link(self.video_rate)
+            self.video_rate.link(self.camerafilter1)
+            self.camerafilter1.link(self.tee)
+            #
+            # in synchronized display mode the first branch is split in
+            #   queue 1 -> videoconvert -> display appsink
+            #   display appsrc -> fpsdisplaysink
+            # and the cairooverlay drawing the results is inserted before the
+            # fpsdisplaysink
+            self.queue1.link(self.videoformatconverter1)
+            display_sink = self.fps_disp_sink
+            if self.overlay is not None:
+                self.cairo_overlay.link(self.fps_disp_sink)
+                display_sink = self.cairo_overlay
+            if self.frame_sync is not None:
+                self.videoformatconverter1.link(self.display_appsink)
+                self.display_src.link(display_sink)
+            else :
+                self.videoformatconverter1.link(display_sink)
+            self.queue2.link(self.videoformatconverter2)
+            self.videoformatconverter2.link(self.video_scale)
+            self.video_scale.link(self.appsink)
+            self.tee.link(self.queue1)
+            self.tee.link(self.queue2)
+
+            # pad probes measuring the capture latency, the queues fill level
+            # and the buffers dropped by the leaky queues
+            self.probes = PipelineProbes(self.window.metrics)
+            self.probes.watch_point("tee", self.tee.get_static_pad("sink"))
+            self.probes.watch_queue(self.queue1)
+            self.probes.watch_queue(self.queue2)
+            self.probes.watch_appsink(self.appsink)
+            # capture to display latency, including the latency added by the
+            # synchronized display mode
+            self.probes.watch_point("display", self.fps_disp_sink.get_static_pad("sink"))
+
+            # the streaming threads place themselves on their cores when
+            # they start
+            if self.window.thread_placement is not None:
+                bus = self.pipeline.get_bus()
+                bus.enable_sync_message_emission()
+                bus.connect("sync-message::stream-status", self.msg_stream_status_cb)
+
+            # set pipeline playing mode
+            self.pipeline.set_state(Gst.State.PLAYING)
+            # getting pipeline bus
+            self.bus = self.pipeline.get_bus()
+            self.bus.add_signal_watch()
+            self.bus.connect('message::error', self.msg_error_cb)
+            self.bus.connect('message::eos', self.msg_eos_cb)
+            self.bus.connect('message::info', self.msg_info_cb)
+
+            Gst.debug_bin_to_dot_file(self.pipeline, Gst.DebugGraphDetails.ALL,
+                                           "pipeline")
+
+    def make_video_sink(self, display_sink):
+        """
+        :param display_sink: gtk, wayland, kms or fake
+        :return: video sink element, fakesink if the requested sink is not
+                 available
+        """
+        if display_sink == "gtk":
+            sink = Gst.ElementFactory.make("gtksink")
+            if sink is not None:
+                # the video is displayed in the widget
+                self.pack_start(sink.props.widget, True, True, 0)
+                sink.props.widget.show()
+        elif display_sink == "wayland":
+            sink = Gst.ElementFactory.make("waylandsink")
+            if sink is not None and sink.find_property("fullscreen") is not None:
+                sink.set_property("fullscreen", True)
+        elif display_sink == "kms":
+            sink = Gst.ElementFactory.make("kmssink")
+        else :
+            sink = None
+        if sink is None:
+            if display_sink != "fake":
+                print("WARNING: " + display_sink + " display sink not available, the frames are not displayed")
+            sink = Gst.ElementFactory.make("fakesink")
+        return sink
+
+    def msg_stream_status_cb(self, bus, message):
+        """
+        called synchronously by the thread posting the message
+        """
+        status_type, owner = message.parse_stream_status()
+        if status_type == Gst.StreamStatusType.ENTER:
+            # the thread of the second queue runs the inferences of new_sample
+            role = "inference" if owner.get_name() == "queue-2" else "streaming"
+            self.window.thread_placement.place_current(role)
+
+    def msg_eos_cb(self, bus, message):
+        print('eos message -> {}'.format(message))
+
+    def msg_info_cb(self, bus, message):
+        print('info message -> {}'.format(message))
+
+    def msg_error_cb(self, bus, message):
+        print('error message -> {}'.format(message.parse_error()))
+
+    def gst_to_opencv(self,sample):
+        """
+        convertion of the gstreamer frame buffer into numpy array
+        """
+        buf = sample.get_buffer()
+        caps = sample.get_caps()
+        shape = (caps.get_structure(0).get_value('height'),
+                 caps.get_structure(0).get_value('width'),
+                 3)
+        if self.args.low_memory:
+            # copy the buffer in a frame allocated once rather than in a new
+            # bytes object for each frame
+            success, map_info = buf.map(Gst.MapFlags.READ)
+            if not success:
+                return None
+            try:
+                if self._frame is None or self._frame.shape != shape:
+                    self._frame = np.empty(shape, dtype=np.uint8)
+                self._frame[...] = np.frombuffer(map_info.data, dtype=np.uint8,
+                                                 count=self._frame.size).reshape(shape)
+            finally:
+                buf.unmap(map_info)
+            return self._frame
+        arr = np.ndarray(
+            shape,
+            buffer=buf.extract_dup(0, buf.get_size()),
+            dtype=np.uint8)
+        return arr
+
+    def new_sample(self,*data):
+        """
+        recover video frame from appsink
+        and run inference
+        """
+        sample = self.appsink.emit("pull-sample")
+        capture_time = timer()
+        self.window.metrics.record_pull("appsink")
+        if not self.window.nn_ready.is_set():
+            # warm-up in progress
+            return Gst.FlowReturn.OK
+        reloader = self.window.model_reloader
+        if reloader is not None:
+            # swap of a reloaded model between two frames
+            nn = reloader.take()
+            if nn is not None:
+                previous = self.nn
+                self.switch_model(nn)
+                self.window.release_nn(previous)
+                print("model reloaded")
+        buf = sample.get_buffer()
+        pts = buf.pts if buf.pts != Gst.CLOCK_TIME_NONE else -1
+        controller = self.window.rate_controller
+        if controller is not None and not controller.should_infer():
+            return self.skip_frame(pts)
+        arr = self.gst_to_opencv(sample)
+        if arr is not None and arr.shape[:2] != self.nn.get_img_size()[:2]:
+            # frame negotiated for the previous model of the ladder
+            return self.skip_frame(pts)
+        if arr is not None :
+            gate = self.window.scene_gate
+            if gate is not None:
+                infer = gate.should_infer(arr, capture_time)
+                self.window.metrics.set_value("scene_change", gate.last_change)
+                self.window.metrics.set_value("scene_gate_hit_rate", gate.hit_rate())
+                if not infer:
+                    # static scene, the published results are still valid
+                    # for this frame
+                    return self.skip_frame(pts)
+            if self.window.inference_process is not None:
+                # the inference runs in a separate process, hand it the frame
+                # and publish its last result
+                self.window.inference_process.push_frame(arr, pts)
+                self._capture_times[pts] = capture_time
+                if len(self._capture_times) > 16:
+                    self._capture_times.popitem(last=False)
+                result = self.window.inference_process.poll_result()
+                if result is None:
+                    return self.skip_frame(pts)
+                seq, results, frame_seq, pts, inference_time = result
+                capture_time = self._capture_times.get(pts)
+            else :
+                start_time = timer()
+                self.nn.launch_inference(arr)
+                stop_time = timer()
+                inference_time = stop_time - start_time
+                results = self.nn.get_results()
+                ladder = self.window.model_ladder
+                if ladder is not None:
+                    nn = ladder.record(inference_time, stop_time)
+                    if nn is not None:
+                        self.switch_model(nn)
+                        self.window.metrics.set_value("model_rung", ladder.current())
+                        print("model ladder: switch to " + ladder.model_files[ladder.current()])
+            if controller is not None:
+                controller.record_inference(inference_time)
+                num_threads = controller.take_num_threads()
+                if num_threads is not None and self.window.inference_process is None:
+                    self.nn.set_num_threads(num_threads)
+                self.window.metrics.set_value("inference_stride", controller.stride)
+                self.window.metrics.set_value("inference_threads", controller.num_threads)
+            self.window.metrics.set_value("inference_time_seconds", inference_time)
+            if self.window.telemetry is not None:
+                self.window.telemetry.record_inference(inference_time)
+            self.window.export_results(results, pts)
+            if self.frame_sync is not None:
+                self.present_frame(self.frame_sync.add_result(pts, self.running_time()))
+            if self.window.results.publish(results, pts, inference_time, capture_time):
+                GLib.idle_add(self.window.results_ready_cb)
+            self.window.first_result_done()
+        return Gst.FlowReturn.OK
+
+    def skip_frame(self, pts):
+        """
+        frame not inferred, in synchronized display mode it is displayed with
+        the last results instead of waiting for the next ones, which would
+        lower the display fps to the inference fps
+        """
+        if self.frame_sync is not None:
+            self.present_frame(self.frame_sync.add_result(pts, self.running_time()))
+        return Gst.FlowReturn.OK
+
+    def switch_model(self, nn):
+        """
+        infer the next frames with another neural network (model ladder, hot
+        reload), the pipeline scales the frames to its input size
+        """
+        previous_size = self.nn.get_img_size()
+        self.nn = nn
+        self.window.nn = nn
+        # the worker threads of the new interpreter were created by the
+        # thread which loaded it, with its placement
+        self.window.place_interpreter_threads()
+        if self.overlay is not None:
+            self.overlay.labels = nn.get_labels()
+        if nn.get_img_size() == previous_size:
+            return
+        nn_input_height, nn_input_width, nn_input_channel = nn.get_img_size()
+        nn_caps = "video/x-raw, format = RGB, width=" + str(nn_input_width) + ",height=" + str(nn_input_height)
+        self.appsink.set_property("caps", Gst.Caps.from_string(nn_caps))
+        # renegotiation of the video scale output
+        self.appsink.get_static_pad("sink").send_event(Gst.Event.new_reconfigure())
+
+    def new_display_sample(self, appsink):
+        """
+        synchronized display mode: hold the display frames until the result
+        of the same frame is published
+        """
+        sample = appsink.emit("pull-sample")
+        if sample is None:
+            return Gst.FlowReturn.OK
+        pts = sample.get_buffer().pts
+        if pts == Gst.CLOCK_TIME_NONE:
+            self.present_frame(sample)
+        else :
+            self.present_frame(self.frame_sync.add_frame(pts, sample, self.running_time()))
+        return Gst.FlowReturn.OK
+
+    def running_time(self):
+        """
+        :return: running time of the pipeline in nanoseconds, the clock of
+                 the buffer timestamps of a live source
+        """
+        clock = self.pipeline.get_clock()
+        if clock is None:
+            return 0
+        return clock.get_time() - self.pipeline.get_base_time()
+
+    def present_frame(self, sample):
+        if sample is not None:
+            self.display_src.emit("push-sample", sample)
+
+    def overlay_caps_changed(self, cairooverlay, caps):
+        structure = caps.get_structure(0)
+        self.overlay.set_frame_size(structure.get_value("width"), structure.get_value("height"))
+
+    def draw_overlay(self, cairooverlay, cr, timestamp, duration):
+        """
+        draw the last inference result on the frame, called by the
+        cairooverlay on the streaming thread
+        """
+        if self.window.nn_ready.is_set():
+            self.overlay.draw(cr)
+
+    def rendering_summary(self):
+        """
+        :return: CPU load and display fps averages of the run, comparing the
+                 overlay rendering modes and the display sinks
+        """
+        mode = "gtk" if self.overlay is None else "pipeline"
+        cpu_load = "unknown" if self.cpu_load_count == 0 else \
+                   "{0:.0f}%".format(self.cpu_load_sum / self.cpu_load_count * 100)
+        display_fps = self.display_fps_sum / self.display_fps_count if self.display_fps_count else 0.0
+        text = "{0} overlay rendering, {1}: avg cpu load {2}, avg display fps {3:.1f}".format(
+               mode, self.video_sink.get_factory().get_name(), cpu_load, display_fps)
+        if self.overlay is not None:
+            text += "\n" + self.overlay.summary()
+        return text
+
+    def get_fps_display(self,fpsdisplaysink,fps,droprate,avgfps):
+        """
+        measure and recover display fps
+        """
+        self.instant_fps = fps
+        self.window.metrics.set_value("display_fps", fps)
+        self.window.metrics.set_value("display_droprate", droprate)
+        self.window.metrics.set_value("rss_bytes", read_process_memory()[0])
+        if self.frame_sync is not None:
+            self.window.metrics.set_value("display_synced", 1 if self.frame_sync.is_synced() else 0)
+        if self.window.rate_controller is not None:
+            # the rate controller samples the CPU load itself
+            self.window.rate_controller.update(fps)
+            cpu_load = self.window.rate_controller.cpu_load
+        else :
+            cpu_load = self.cpu_monitor.sample()
+        if cpu_load is not None:
+            self.window.metrics.set_value("cpu_load", cpu_load)
+            self.cpu_load_sum += cpu_load
+            self.cpu_load_count += 1
+        self.display_fps_sum += fps
+        self.display_fps_count += 1
+        if self.window.telemetry is not None:
+            sample = self.window.telemetry.latest()
+            if sample is not None and sample.temperatures and sample.temperatures[0] is not None:
+                self.window.metrics.set_value("soc_temperature_celsius", sample.temperatures[0])
+            if sample is not None and sample.frequencies and sample.frequencies[0] is not None:
+                self.window.metrics.set_value("cpu_frequency_mhz", sample.frequencies[0])
+        return self.instant_fps
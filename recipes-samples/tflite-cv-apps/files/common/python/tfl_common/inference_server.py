@@ -0,0 +1,650 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Local inference server shared by several applications
+
+The server loads each model once and runs the inferences of all its
+clients, so that several applications can use the Edge TPU or share the
+cores of the CPU interpreter. It is started with
+
+    python3 -m tfl_common.inference_server [--socket PATH] [--model MODEL:LABELS ...]
+
+The requests are JSON lines on a Unix stream socket, the tensors are
+exchanged through a shared memory segment created by each client:
+
+    {"op": "open", "model": path, "labels": path, "input_mean": m, "input_std": s, "client": name}
+        -> {"ok": true, "input": [h, w, c], "outputs": [[shape, dtype], ...], "floating": bool}
+    {"op": "attach", "shm": name}   the client input and output tensors
+        -> {"ok": true}
+    {"op": "infer", "id": n}        the input frame is written in the segment
+        -> {"ok": true, "id": n, "inference_time": seconds, "batch": size}
+
+A failed request is answered with {"ok": false, "error": text}. The
+concurrent requests of a model received within a small time window are run
+as one batched inference, a batch takes at most one request per client and
+the clients are served round-robin.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import threading
+from collections import OrderedDict, deque
+from multiprocessing import shared_memory
+from timeit import default_timer as timer
+
+import numpy as np
+
+from tfl_common import mock_backend
+from tfl_common.model_reload import file_signature
+from tfl_common.neural_network import NeuralNetwork, load_labels
+from tfl_common.shm_transport import attach_shared_memory
+
+DEFAULT_SOCKET = "/tmp/tflite-inference.sock"
+
+def model_path(model_file):
+    """
+    :return: path of a model file for the server, which does not run in the
+             directory of the clients
+    """
+    if mock_backend.is_mock_model(model_file):
+        return model_file
+    return os.path.abspath(model_file)
+
+class RawPostProcess:
+    """
+    Post-processing of the server, the clients post-process the raw output
+    tensors themselves
+    """
+    def warm_up(self, runs):
+        pass
+
+    def get_results(self, nn):
+        return tuple(nn.get_output(i) for i in range(len(nn.get_output_specs())))
+
+class TensorBuffers:
+    """
+    Input and output tensors of one image in a shared memory segment, the
+    segment is created by the client and attached by the server
+    """
+    def __init__(self, name, specs, create=False):
+        """
+        :param specs: list of (shape, dtype) of the input then the outputs
+        """
+        specs = [(tuple(shape), np.dtype(dtype)) for shape, dtype in specs]
+        offsets = []
+        size = 0
+        for shape, dtype in specs:
+            offsets.append(size)
+            size += (int(np.prod(shape, dtype=np.int64)) * dtype.itemsize + 7) & ~7
+        self._owner = create
+        if create:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=max(1, size))
+        else:
+            # the segment belongs to the client
+            self._shm = attach_shared_memory(name)
+        self.name = self._shm.name
+        self.tensors = [np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)
+                        for (shape, dtype), offset in zip(specs, offsets)]
+
+    def close(self):
+        self.tensors = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+class FairBatcher:
+    """
+    Pending requests of the clients of a model grouped in batches
+
+    Each client has its own queue. A batch takes at most one request per
+    client, the clients of a batch move to the end of the round-robin
+    order, so that a client flooding the server cannot starve the others. A
+    batch is closed when it is full or when its oldest request has waited
+    for the batching window.
+    """
+    def __init__(self, max_batch, window):
+        """
+        :param max_batch: maximal number of requests per batch
+        :param window: batching window in seconds
+        """
+        self.max_batch = max_batch
+        self.window = window
+        self._queues = OrderedDict()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def submit(self, client, request):
+        with self._cond:
+            queue = self._queues.get(client)
+            if queue is None:
+                queue = self._queues[client] = deque()
+            queue.append((request, timer()))
+            self._cond.notify()
+
+    def remove(self, client):
+        with self._cond:
+            self._queues.pop(client, None)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def next_batch(self):
+        """
+        wait for the next batch
+        :return: list of (client, request, submit time), None once closed
+        """
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                ready = [client for client, queue in self._queues.items() if queue]
+                if not ready:
+                    self._cond.wait()
+                    continue
+                oldest = min(self._queues[client][0][1] for client in ready)
+                remaining = oldest + self.window - timer()
+                if len(ready) >= self.max_batch or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = []
+            for client in ready[:self.max_batch]:
+                request, submit_time = self._queues[client].popleft()
+                batch.append((client, request, submit_time))
+                self._queues.move_to_end(client)
+            return batch
+
+class ServedModel:
+    """
+    Neural network of the server and the thread running its batches
+    """
+    def __init__(self, name, nn, max_batch, window):
+        self.name = name
+        self.nn = nn
+        self.output_count = len(nn.get_output_specs())
+        self.batcher = FairBatcher(max_batch, window)
+        # held while a batch reads and writes the client tensors
+        self.lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="inference-server-model", daemon=True)
+        # number of connected clients, a model replaced by a newer version of
+        # its file is stopped once it has no client
+        self.clients = 0
+        self.replaced = False
+        # statistics
+        self.batches = 0
+        self.images = 0
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.batcher.close()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = self.batcher.next_batch()
+            if batch is None:
+                return
+            with self.lock:
+                # clients disconnected since their request was queued
+                batch = [entry for entry in batch if entry[0].buffers is not None]
+                if not batch:
+                    continue
+                try:
+                    replies = self._infer(batch)
+                except Exception as error:
+                    # the thread must keep serving the other clients
+                    message = (str(error).splitlines() or [type(error).__name__])[0]
+                    print("WARNING: inference of " + self.name + " failed: " + message)
+                    replies = [(client, {"ok": False, "id": request, "error": message})
+                               for client, request, _ in batch]
+            for client, reply in replies:
+                client.reply(reply)
+
+    def _infer(self, batch):
+        """
+        :return: list of (client, reply) of the batch
+        """
+        start_time = timer()
+        outputs = self._invoke([client.buffers.tensors[0] for client, _, _ in batch])
+        inference_time = timer() - start_time
+        self.batches += 1
+        self.images += len(batch)
+        replies = []
+        for idx, (client, request, submit_time) in enumerate(batch):
+            for tensor, output in zip(client.buffers.tensors[1:], outputs):
+                tensor[...] = output[idx:idx + 1]
+            client.record(start_time - submit_time, timer() - submit_time)
+            replies.append((client, {"ok": True, "id": request, "inference_time": inference_time,
+                                     "batch": len(batch)}))
+        return replies
+
+    def _invoke(self, frames):
+        """
+        :return: output tensors, the first dimension indexing the frames
+        """
+        nn = self.nn
+        count = len(frames)
+        if count == 1:
+            nn.launch_inference(frames[0])
+            return [nn.get_output(i) for i in range(self.output_count)]
+        try:
+            # the batch only grows, as in the cascade classifier
+            if nn.get_batch_size() < count:
+                nn.set_batch_size(count)
+            nn.launch_batch_inference(frames)
+            outputs = [nn.get_output(i) for i in range(self.output_count)]
+        except (ValueError, RuntimeError):
+            outputs = None
+        if outputs is not None and all(len(output) >= count for output in outputs):
+            return outputs
+        # the model cannot be batched (detection post-processing operator),
+        # infer the frames one by one from now on
+        print("model " + self.name + " cannot be batched, frames inferred one by one")
+        self.batcher.max_batch = 1
+        if nn.get_batch_size() != 1:
+            nn.set_batch_size(1)
+        results = []
+        for frame in frames:
+            nn.launch_inference(frame)
+            results.append([nn.get_output(i) for i in range(self.output_count)])
+        return [np.concatenate([result[i] for result in results]) for i in range(self.output_count)]
+
+    def summary(self):
+        avg_batch = self.images / self.batches if self.batches else 0.0
+        return "{0} images in {1} batches (avg batch {2:.2f})".format(self.images, self.batches, avg_batch)
+
+class ClientConnection:
+    """
+    Connection of a client, handled by its own thread
+    """
+    def __init__(self, server, sock, number):
+        self.server = server
+        self.sock = sock
+        self.name = "client-{0}".format(number)
+        self.model = None
+        self.buffers = None
+        self._send_lock = threading.Lock()
+        # statistics
+        self.requests = 0
+        self.total_wait = 0.0
+        self.total_latency = 0.0
+
+    def reply(self, message):
+        data = (json.dumps(message) + "\n").encode("utf-8")
+        with self._send_lock:
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                pass
+
+    def record(self, wait, latency):
+        """
+        :param wait: time in seconds spent in the batcher
+        :param latency: time in seconds from the request to the results
+        """
+        self.requests += 1
+        self.total_wait += wait
+        self.total_latency += latency
+
+    def run(self):
+        try:
+            for line in self.sock.makefile("r"):
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    self.reply({"ok": False, "error": "invalid request"})
+                    continue
+                self.handle(message)
+        except OSError:
+            pass
+        finally:
+            self.close()
+
+    def handle(self, message):
+        op = message.get("op")
+        if op == "open":
+            try:
+                self.model = self.server.get_model(message["model"], message.get("labels", ""),
+                                                   float(message.get("input_mean", 127.5)),
+                                                   float(message.get("input_std", 127.5)))
+            except (KeyError, ImportError, OSError, ValueError, RuntimeError) as error:
+                self.reply({"ok": False, "error": "model not loaded: " + (str(error).splitlines() or [type(error).__name__])[0]})
+                return
+            self.name = str(message.get("client", self.name))
+            nn = self.model.nn
+            self.reply({"ok": True, "input": list(nn.get_img_size()),
+                        "outputs": [[list(shape), dtype.str] for shape, dtype in nn.get_output_specs()],
+                        "floating": nn.is_floating_model()})
+        elif op == "attach" and self.model is not None:
+            nn = self.model.nn
+            try:
+                buffers = TensorBuffers(message["shm"], [(nn.get_img_size(), np.uint8)] + nn.get_output_specs())
+            except (KeyError, OSError, ValueError) as error:
+                self.reply({"ok": False, "error": "shared memory not attached: " + str(error)})
+                return
+            with self.model.lock:
+                self.buffers = buffers
+            self.reply({"ok": True})
+        elif op == "infer" and self.buffers is not None:
+            self.model.batcher.submit(self, message.get("id"))
+        else :
+            self.reply({"ok": False, "error": "unexpected request " + str(op)})
+
+    def close(self):
+        if self.model is not None:
+            self.model.batcher.remove(self)
+            # wait for the batch using the tensors
+            with self.model.lock:
+                if self.buffers is not None:
+                    self.buffers.close()
+                    self.buffers = None
+            self.server.release_model(self.model)
+        self.sock.close()
+        self.server.remove_client(self)
+
+    def summary(self):
+        if self.requests == 0:
+            return "{0}: no request".format(self.name)
+        return "{0}: {1} requests, avg batching wait {2:.2f} ms, avg latency {3:.2f} ms".format(
+               self.name, self.requests, self.total_wait / self.requests * 1000,
+               self.total_latency / self.requests * 1000)
+
+class InferenceServer:
+    """
+    Class that accepts the clients and runs the inferences of the models
+    """
+    def __init__(self, socket_path, factory, max_batch=4, window=0.005):
+        """
+        :param factory: function(model file, label file, input mean, input
+                        std) building the warmed up NeuralNetwork of a model
+        :param max_batch: maximal number of images per inference
+        :param window: batching window in seconds
+        """
+        self.socket_path = socket_path
+        self.factory = factory
+        self.max_batch = max_batch
+        self.window = window
+        self._models = {}
+        # lock of each model being loaded
+        self._loading = {}
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._count = 0
+        self._closed = False
+        if os.path.exists(socket_path):
+            # socket of a previous server
+            os.unlink(socket_path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(socket_path)
+        self._sock.listen(16)
+        # the summaries of the clients and of the replaced models outlive them
+        self._summaries = []
+
+    def get_model(self, model_file, label_file, input_mean, input_std):
+        """
+        :return: ServedModel of a model, loaded on the first request, a
+                 modified model file is loaded again, the caller is counted
+                 as a client of the model until release_model
+        """
+        config = (model_file, label_file, input_mean, input_std)
+        key = config + (file_signature(model_file),)
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+        # the model is loaded without blocking the accept loop and the other
+        # models, the clients of the same model wait for it
+        with loading:
+            with self._lock:
+                model = self._models.get(key)
+                if model is not None:
+                    model.clients += 1
+                    return model
+            print("loading " + model_file)
+            try:
+                nn = self.factory(model_file, label_file, input_mean, input_std)
+            except BaseException:
+                with self._lock:
+                    self._loading.pop(key, None)
+                raise
+            model = ServedModel(model_file, nn, self.max_batch, self.window)
+            model.start()
+            with self._lock:
+                self._loading.pop(key, None)
+                model.clients += 1
+                self._models[key] = model
+                # the previous versions of the model file
+                stopped = []
+                for other_key, other in list(self._models.items()):
+                    if other_key[:4] == config and other is not model:
+                        other.replaced = True
+                        if other.clients == 0:
+                            stopped.append(self._retire(other_key))
+        for other in stopped:
+            other.stop()
+        return model
+
+    def _retire(self, key):
+        # called with the lock held
+        model = self._models.pop(key)
+        self._summaries.append(model.name + " (replaced): " + model.summary())
+        return model
+
+    def release_model(self, model):
+        """
+        a client of the model disconnected
+        """
+        with self._lock:
+            model.clients -= 1
+            if not model.replaced or model.clients > 0:
+                return
+            keys = [key for key, other in self._models.items() if other is model]
+            if not keys:
+                return
+            self._retire(keys[0])
+        model.stop()
+
+    def remove_client(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.discard(client)
+                self._summaries.append(client.summary())
+
+    def serve_forever(self):
+        while not self._closed:
+            try:
+                sock, _ = self._sock.accept()
+            except OSError:
+                # socket closed by close()
+                break
+            with self._lock:
+                self._count += 1
+                client = ClientConnection(self, sock, self._count)
+                self._clients.add(client)
+            threading.Thread(target=client.run, name=client.name, daemon=True).start()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._sock.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            try:
+                client.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for model in list(self._models.values()):
+            model.stop()
+
+    def summary(self):
+        with self._lock:
+            lines = ["inference server: {0} models, {1} clients".format(len(self._models), self._count)]
+            for model in self._models.values():
+                lines.append("  " + model.name + ": " + model.summary())
+            # replaced models and disconnected clients
+            lines.extend("  " + summary for summary in self._summaries)
+            lines.extend("  " + client.summary() for client in self._clients)
+        return "\n".join(lines)
+
+class RemoteNeuralNetwork(NeuralNetwork):
+    """
+    Client of the inference server with the interface of NeuralNetwork
+
+    The labels and the post-processing stay in the application, the server
+    runs the interpreter. The number of threads and the delegate are the
+    ones of the server.
+    """
+    def __init__(self, socket_path, model_file, label_file, input_mean, input_std, postprocess,
+                 warmup_runs=0, client_name=None, timeout=10.0):
+        self._socket_path = socket_path
+        self._model_file = model_file
+        self._label_file = label_file
+        self._input_mean = input_mean
+        self._input_std = input_std
+        self._postprocess = postprocess
+        self._warmup_runs = warmup_runs
+        self._input_frame = None
+        self._selected_delegate = None
+        self.number_threads = 1
+        self.cold_latency = None
+        self.warm_latency = None
+        self.server_inference_time = None
+        self.last_batch = None
+        self._labels = load_labels(label_file)
+        self._seq = 0
+        self._buffers = None
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(socket_path)
+        self._reader = self._sock.makefile("r")
+        try:
+            reply = self._request({"op": "open", "model": model_path(model_file),
+                                   "labels": os.path.abspath(label_file),
+                                   "input_mean": input_mean, "input_std": input_std,
+                                   "client": client_name or "pid {0}".format(os.getpid())})
+            self._img_size = tuple(int(v) for v in reply["input"])
+            self._output_specs = [(tuple(shape), np.dtype(dtype)) for shape, dtype in reply["outputs"]]
+            self._floating_model = bool(reply["floating"])
+            self._buffers = TensorBuffers("tfl_client_{0}_{1}".format(os.getpid(), id(self)),
+                                          [(self._img_size, np.uint8)] + self._output_specs, create=True)
+            self._request({"op": "attach", "shm": self._buffers.name})
+        except (OSError, RuntimeError):
+            self.close()
+            raise
+        print("inference of " + model_file + " delegated to the server " + socket_path)
+
+    def __getstate__(self):
+        raise TypeError("the client of the inference server cannot be sent to another process")
+
+    def _request(self, message):
+        self._sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+        line = self._reader.readline()
+        if not line:
+            raise RuntimeError("connection closed by the inference server")
+        reply = json.loads(line)
+        if not reply.get("ok"):
+            raise RuntimeError("inference server: " + str(reply.get("error")))
+        return reply
+
+    def get_config(self):
+        config = NeuralNetwork.get_config(self)
+        config["server"] = self._socket_path
+        return config
+
+    def get_img_size(self):
+        return self._img_size
+
+    def get_output_specs(self):
+        return list(self._output_specs)
+
+    def supports_num_threads(self):
+        return False
+
+    def set_num_threads(self, num_threads):
+        pass
+
+    def get_batch_size(self):
+        return 1
+
+    def set_batch_size(self, batch_size):
+        raise ValueError("the frames of the clients are batched by the inference server")
+
+    def launch_inference(self, img):
+        """
+        hand the image to the server and wait for the results
+        """
+        self._input_frame = img
+        self._buffers.tensors[0][...] = img
+        self._seq += 1
+        reply = self._request({"op": "infer", "id": self._seq})
+        self.server_inference_time = reply["inference_time"]
+        self.last_batch = reply["batch"]
+
+    def get_output(self, idx):
+        """
+        :return: copy of the output tensor idx
+        """
+        return np.copy(self._buffers.tensors[1 + idx])
+
+    def close(self):
+        self._reader.close()
+        self._sock.close()
+        if self._buffers is not None:
+            self._buffers.close()
+            self._buffers = None
+
+def main():
+    parser = argparse.ArgumentParser(description="local inference server shared by the applications")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="path of the Unix socket (default " + DEFAULT_SOCKET + ")")
+    parser.add_argument("--model", nargs='*', default=[], metavar="MODEL:LABELS", help="models loaded at startup, the others are loaded on the first request of a client")
+    parser.add_argument("--input_mean", default=127.5, type=float, help="input mean of the models loaded at startup")
+    parser.add_argument("--input_std", default=127.5, type=float, help="input standard deviation of the models loaded at startup")
+    parser.add_argument("-e", "--ext_delegate", default=None, help="external_delegate_library path")
+    parser.add_argument("-p", "--perf", default='std', choices=['std', 'max'], help="[EdgeTPU ONLY] Select the performance of the Coral EdgeTPU")
+    parser.add_argument("--edgetpu", action='store_true', help="enable Coral EdgeTPU acceleration")
+    parser.add_argument("--num_threads", default=None, help="number of threads used by the tflite interpreters")
+    parser.add_argument("--max_batch", default=4, type=int, help="maximal number of frames inferred together (default 4)")
+    parser.add_argument("--batch_window", default=5, type=float, help="time in ms a request waits for the requests of other clients (default 5)")
+    parser.add_argument("--warmup_runs", default=3, type=int, help="number of dummy inferences run when a model is loaded (default 3)")
+    args = parser.parse_args()
+
+    def load(model_file, label_file, input_mean, input_std):
+        nn = NeuralNetwork(model_file, label_file, input_mean, input_std, args.edgetpu, args.perf,
+                           args.ext_delegate, args.num_threads, False, RawPostProcess(), args.warmup_runs)
+        nn.warm_up()
+        print(nn.warm_up_summary())
+        return nn
+
+    server = InferenceServer(args.socket, load, max(1, args.max_batch), args.batch_window / 1000)
+    # the models loaded at startup stay loaded
+    for spec in args.model:
+        model_file, _, label_file = spec.partition(":")
+        server.get_model(model_path(model_file), os.path.abspath(label_file), args.input_mean, args.input_std)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.close())
+    print("inference server listening on " + args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        print(server.summary())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Entry point of the process started by shm_transport.InferenceProcess
+
+The process runs "python3 -m tfl_common.inference_worker", so that it only
+imports the interpreter and not the GTK / GStreamer modules of the
+application, which the spawn start method of multiprocessing re-imports
+with the main module. The arguments of shm_transport.inference_worker are
+read pickled from the standard input, the end of the standard input stops
+the process.
+"""
+
+import pickle
+import sys
+import threading
+
+from tfl_common.shm_transport import inference_worker
+
+def main():
+    stdin = sys.stdin.buffer
+    kwargs = pickle.load(stdin)
+    stop_event = threading.Event()
+
+    def wait_parent():
+        # the parent closes the pipe to stop the process
+        stdin.read()
+        stop_event.set()
+
+    threading.Thread(target=wait_parent, name="inference-stop", daemon=True).start()
+    inference_worker(stop_event=stop_event, **kwargs)
+
+if __name__ == '__main__':
+    main()
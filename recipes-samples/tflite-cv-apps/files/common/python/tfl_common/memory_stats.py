@@ -0,0 +1,120 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+import importlib
+import os
+import threading
+
+def read_process_memory(proc_root="/proc", pid="self"):
+    """
+    :return: (resident set size, peak resident set size) in bytes of a
+             process, (0, 0) if unknown
+    """
+    rss = 0
+    hwm = 0
+    try:
+        with open(os.path.join(proc_root, str(pid), "status"), "r") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    hwm = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return (rss, hwm)
+
+class LazyModule:
+    """
+    Module imported on its first attribute access, so that the memory and
+    the import time of a module are only paid when it is used
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self._name)
+        return self._module
+
+    def is_loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        # the lock is only needed until the module is imported
+        module = self._module
+        if module is None:
+            module = self._load()
+        return getattr(module, attr)
+
+# only needed when the python allocations are traced
+tracemalloc = LazyModule("tracemalloc")
+
+class MemoryTracker:
+    """
+    Class that records the memory footprint of the application at
+    successive stages (model loaded, UI created, first inference...)
+
+    Each stage records the resident set size and, when tracemalloc is
+    enabled, the memory allocated by python and the code lines which
+    allocated the most since the previous stage.
+    """
+    def __init__(self, trace=False, top_count=5, proc_root="/proc"):
+        """
+        :param trace: enable tracemalloc, which slows down the allocations
+        :param top_count: number of allocating lines reported per stage
+        """
+        self.trace = trace
+        self.top_count = top_count
+        self.proc_root = proc_root
+        self.stages = []
+        self._seen = set()
+        self._last_snapshot = None
+        self._lock = threading.Lock()
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def snapshot(self, stage, once=False):
+        """
+        record the memory footprint of a stage
+        :param once: do nothing if the stage has already been recorded
+        """
+        with self._lock:
+            if once and stage in self._seen:
+                return
+            self._seen.add(stage)
+            rss, hwm = read_process_memory(self.proc_root)
+            traced = None
+            top = []
+            if self.trace:
+                current, peak = tracemalloc.get_traced_memory()
+                traced = (current, peak)
+                snapshot = tracemalloc.take_snapshot().filter_traces(
+                           (tracemalloc.Filter(False, tracemalloc.__file__),))
+                if self._last_snapshot is not None:
+                    stats = snapshot.compare_to(self._last_snapshot, "lineno")
+                else:
+                    stats = snapshot.statistics("lineno")
+                top = [str(stat) for stat in stats[:self.top_count]]
+                self._last_snapshot = snapshot
+            self.stages.append((stage, rss, hwm, traced, top))
+
+    def summary(self):
+        with self._lock:
+            lines = ["memory footprint:"]
+            for stage, rss, hwm, traced, top in self.stages:
+                line = "  {0:20} rss {1:7.1f} MB, peak rss {2:7.1f} MB".format(stage, rss / 1048576, hwm / 1048576)
+                if traced is not None:
+                    line += ", python {0:6.1f} MB (peak {1:6.1f} MB)".format(traced[0] / 1048576, traced[1] / 1048576)
+                lines.append(line)
+                for stat in top:
+                    lines.append("      " + stat)
+            return "\n".join(lines)
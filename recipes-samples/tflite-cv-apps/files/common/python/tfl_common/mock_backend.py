@@ -0,0 +1,148 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Stand-in for tflite_runtime.interpreter used to run the applications
+without a real model or accelerator.
+
+A mock model is selected with a model path such as
+"mock://detection?size=300&latency=0.05" or "mock://classification".
+
+The inference latency can depend on the interpreter configuration:
+"serial=0.25" keeps 25% of the latency serial and divides the rest by the
+number of threads, "delegate_latency=0.01" is the latency when a delegate
+is loaded. Any existing file, such as an empty .so, can be loaded as a
+delegate.
+"""
+
+import time
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+MOCK_MODEL_PREFIX = "mock://"
+
+def is_mock_model(model_file):
+    return model_file is not None and model_file.startswith(MOCK_MODEL_PREFIX)
+
+def load_delegate(library, options=None):
+    """
+    mimic tflite_runtime.interpreter.load_delegate, the library must exist
+    """
+    with open(library, "rb"):
+        pass
+    return MockDelegate(library)
+
+class MockDelegate:
+    def __init__(self, library):
+        self.library = library
+
+class MockInterpreter:
+    """
+    Minimal implementation of the tflite Interpreter API
+
+    The detection model mimics a SSD MobileNet post-processed output
+    (locations, classes, scores, count) and the classification model a
+    quantized MobileNet output. Results are derived from the input content
+    so that different frames give different results.
+    """
+    def __init__(self, model_path=None, num_threads=None, experimental_delegates=None):
+        url = urlparse(model_path)
+        query = parse_qs(url.query)
+        self.task = url.netloc
+        size = int(query.get("size", ["300" if self.task == "detection" else "224"])[0])
+        self.latency = float(query.get("latency", ["0"])[0])
+        serial = float(query.get("serial", ["1"])[0])
+        if experimental_delegates:
+            self.latency = float(query.get("delegate_latency", [str(self.latency)])[0])
+        elif num_threads is not None and num_threads > 1:
+            self.latency *= serial + (1.0 - serial) / num_threads
+        self.num_classes = int(query.get("classes", ["90" if self.task == "detection" else "1001"])[0])
+        self.max_detections = int(query.get("detections", ["10"])[0])
+        dtype = np.float32 if query.get("float", ["0"])[0] == "1" else np.uint8
+        self.num_threads = num_threads
+        self.delegates = experimental_delegates or []
+
+        self._input_details = [{"name": "input", "index": 0,
+                                "shape": np.array([1, size, size, 3], dtype=np.int32),
+                                "dtype": dtype}]
+        if self.task == "detection":
+            n = self.max_detections
+            shapes = [(1, n, 4), (1, n), (1, n), (1,)]
+            self._output_details = [{"name": name, "index": i + 1,
+                                     "shape": np.array(shape, dtype=np.int32),
+                                     "dtype": np.float32}
+                                    for i, (name, shape) in enumerate(zip(
+                                        ("locations", "classes", "scores", "count"), shapes))]
+        elif self.task == "classification":
+            self._output_details = [{"name": "output", "index": 1,
+                                     "shape": np.array([1, self.num_classes], dtype=np.int32),
+                                     "dtype": dtype}]
+        else:
+            raise ValueError("unknown mock model task: " + str(self.task))
+        self._tensors = {}
+
+    def allocate_tensors(self):
+        for details in self._input_details + self._output_details:
+            self._tensors[details["index"]] = np.zeros(details["shape"], dtype=details["dtype"])
+
+    def get_input_details(self):
+        return self._input_details
+
+    def get_output_details(self):
+        return self._output_details
+
+    def resize_tensor_input(self, input_index, tensor_size, strict=False):
+        self._input_details[0]["shape"] = np.array(tensor_size, dtype=np.int32)
+
+    def set_tensor(self, tensor_index, value):
+        self._tensors[tensor_index] = np.array(value, dtype=self._input_details[0]["dtype"])
+
+    def get_tensor(self, tensor_index):
+        return np.copy(self._tensors[tensor_index])
+
+    def tensor(self, tensor_index):
+        return lambda: self._tensors[tensor_index]
+
+    def invoke(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        frame = self._tensors[0]
+        batch = frame.shape[0]
+        # per frame mean of the three color channels drives the results
+        means = frame.reshape(batch, -1, 3).mean(axis=1) / 255.0
+        if self.task == "detection":
+            n = self.max_detections
+            locations = np.zeros((batch, n, 4), dtype=np.float32)
+            classes = np.zeros((batch, n), dtype=np.float32)
+            scores = np.zeros((batch, n), dtype=np.float32)
+            for b in range(batch):
+                r, g, bl = means[b]
+                for i in range(n):
+                    x0 = (0.1 * i + r * 0.2) % 0.7
+                    y0 = (0.05 * i + g * 0.2) % 0.7
+                    locations[b, i] = (y0, x0, y0 + 0.25, x0 + 0.25)
+                    classes[b, i] = (i + int(bl * 10)) % self.num_classes
+                    scores[b, i] = max(0.0, 0.95 - 0.1 * i)
+            self._tensors[1] = locations
+            self._tensors[2] = classes
+            self._tensors[3] = scores
+            self._tensors[4] = np.array([n] * batch, dtype=np.float32)
+        else:
+            details = self._output_details[0]
+            scores = np.zeros((batch, self.num_classes), dtype=np.float32)
+            for b in range(batch):
+                top = int(means[b].sum() / 3 * (self.num_classes - 1))
+                scores[b, top] = 0.9
+            if details["dtype"] == np.uint8:
+                scores = (scores * 255).astype(np.uint8)
+            self._tensors[1] = scores
+
+# same entry point names as tflite_runtime.interpreter
+Interpreter = MockInterpreter
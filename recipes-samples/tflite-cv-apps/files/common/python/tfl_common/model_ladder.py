@@ -0,0 +1,213 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Ladder of models of the same task switched to meet a latency budget
+
+The rungs of the ladder are ordered from the heaviest (most accurate) model
+to the lightest one. The scheduler steps down when the smoothed inference
+latency exceeds the per frame budget and steps up when it is well below the
+budget and the heavier model is known, or assumed again after a while, to
+fit in it. Both directions need several consecutive measures and a minimal
+number of inferences since the last switch, so that the models do not
+alternate on each frame.
+"""
+
+import os
+import threading
+from timeit import default_timer as timer
+
+class LadderScheduler:
+    """
+    Class that chooses the rung of the ladder from the inference latencies
+    """
+    def __init__(self, rungs, budget, low=0.7, high=1.0, patience=5, dwell=30,
+                 retry_period=10.0, alpha=0.2):
+        """
+        :param rungs: number of models, rung 0 is the heaviest
+        :param budget: per frame latency budget in seconds
+        :param low: ratio of the budget below which a heavier model is tried
+        :param high: ratio of the budget above which a lighter model is used
+        :param patience: number of consecutive measures beyond a limit
+                         before a switch
+        :param dwell: minimal number of inferences between two switches
+        :param retry_period: time in seconds after which the measured latency
+                             of a heavier model is not trusted anymore
+        :param alpha: smoothing factor of the latency
+        """
+        self.rungs = rungs
+        self.budget = budget
+        self.low = low
+        self.high = high
+        self.patience = patience
+        self.dwell = dwell
+        self.retry_period = retry_period
+        self.alpha = alpha
+        self.rung = 0
+        # smoothed latency of each rung and time of its last measure
+        self.latency = [None] * rungs
+        self.measured = [None] * rungs
+        self._over = 0
+        self._under = 0
+        self._since_switch = 0
+
+    def record(self, latency, now):
+        """
+        :param latency: latency in seconds of an inference of the current rung
+        :return: rung to switch to, None to keep the current one
+        """
+        rung = self.rung
+        if self.latency[rung] is None:
+            self.latency[rung] = latency
+        else :
+            self.latency[rung] += self.alpha * (latency - self.latency[rung])
+        self.measured[rung] = now
+        self._since_switch += 1
+        smoothed = self.latency[rung]
+        self._over = self._over + 1 if smoothed > self.budget * self.high else 0
+        self._under = self._under + 1 if smoothed < self.budget * self.low else 0
+        if self._since_switch < self.dwell:
+            return None
+        if self._over >= self.patience and rung < self.rungs - 1:
+            return rung + 1
+        if self._under >= self.patience and rung > 0:
+            heavier = self.latency[rung - 1]
+            if heavier is None or heavier <= self.budget * self.high or \
+               now - self.measured[rung - 1] >= self.retry_period:
+                return rung - 1
+        return None
+
+    def switch(self, rung):
+        """
+        the models of the rung are loaded and used from now on
+        """
+        self.rung = rung
+        self._over = 0
+        self._under = 0
+        self._since_switch = 0
+
+class ModelLadder:
+    """
+    Class that holds the models of the ladder, preloaded or loaded in
+    background on first use, and switches them from the streaming thread
+    """
+    def __init__(self, model_files, factory, scheduler, first_nn=None, preload=True):
+        """
+        :param model_files: models from the heaviest to the lightest
+        :param factory: function building the warmed up NeuralNetwork object
+                        of a model file
+        :param scheduler: LadderScheduler object
+        :param first_nn: already loaded NeuralNetwork of the first model
+        :param preload: True to load all the models now, a model which fails
+                        to load is skipped and retried on first use
+        """
+        self.model_files = model_files
+        self.factory = factory
+        self.scheduler = scheduler
+        self._nns = [first_nn] + [None] * (len(model_files) - 1)
+        self._loading = set()
+        # time of the last failed load of each rung, the rung is not loaded
+        # again before the retry period of the scheduler
+        self._failed = {}
+        self._lock = threading.Lock()
+        # statistics
+        self.inferences = [0] * len(model_files)
+        self.total_latency = [0.0] * len(model_files)
+        self.switches = []
+        self.failures = 0
+        for rung in range(len(model_files)):
+            if self._nns[rung] is None and preload:
+                self._nns[rung] = self._build(rung)
+
+    def current(self):
+        return self.scheduler.rung
+
+    def _build(self, rung):
+        """
+        :return: NeuralNetwork of the rung, None if it failed to load
+        """
+        try:
+            return self.factory(self.model_files[rung])
+        except Exception as error:
+            # whatever the failure, the current model keeps running
+            message = (str(error).splitlines() or [type(error).__name__])[0]
+            print("WARNING: ladder model " + self.model_files[rung] + " not loaded: " + message)
+            with self._lock:
+                self.failures += 1
+                self._failed[rung] = timer()
+            return None
+
+    def _load(self, rung):
+        nn = None
+        try:
+            nn = self._build(rung)
+        finally:
+            with self._lock:
+                if nn is not None:
+                    self._nns[rung] = nn
+                    self._failed.pop(rung, None)
+                self._loading.discard(rung)
+
+    def get_nn(self, rung):
+        """
+        :return: NeuralNetwork of the rung, None if it is not loaded yet, its
+                 loading is then started in background unless it failed
+                 less than a retry period ago
+        """
+        with self._lock:
+            nn = self._nns[rung]
+            failed = self._failed.get(rung)
+            if failed is not None and timer() - failed < self.scheduler.retry_period:
+                return None
+            if nn is None and rung not in self._loading:
+                self._loading.add(rung)
+                threading.Thread(target=self._load, args=(rung,), name="model-ladder-load",
+                                 daemon=True).start()
+        return nn
+
+    def record(self, latency, now=None):
+        """
+        record the latency of an inference of the current model
+        :return: NeuralNetwork to use from now on, None to keep the current one
+        """
+        if now is None:
+            now = timer()
+        rung = self.scheduler.rung
+        self.inferences[rung] += 1
+        self.total_latency[rung] += latency
+        target = self.scheduler.record(latency, now)
+        if target is None:
+            return None
+        nn = self.get_nn(target)
+        if nn is None:
+            # keep the current model until the target is loaded
+            return None
+        self.scheduler.switch(target)
+        self.switches.append((now, rung, target, latency))
+        return nn
+
+    def _state(self, rung):
+        if self._nns[rung] is not None:
+            return ""
+        if rung in self._failed:
+            return "  (failed)"
+        return "  (not loaded)"
+
+    def summary(self):
+        lines = ["model ladder: budget {0:.1f} ms, {1} switches, {2} failed loads".format(
+                 self.scheduler.budget * 1000, len(self.switches), self.failures)]
+        total = sum(self.inferences)
+        for rung, model_file in enumerate(self.model_files):
+            count = self.inferences[rung]
+            avg_latency = self.total_latency[rung] / count * 1000 if count else 0.0
+            lines.append("  {0} {1:32} {2:6} inferences ({3:3.0f}%)  avg latency {4:8.2f} ms{5}".format(
+                         rung, os.path.basename(model_file), count,
+                         count * 100 / total if total else 0.0, avg_latency,
+                         self._state(rung)))
+        return "\n".join(lines)
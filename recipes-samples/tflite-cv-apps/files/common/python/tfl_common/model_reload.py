@@ -0,0 +1,145 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Hot reload of the model while the pipeline runs
+
+A watcher thread polls the modification time and the size of the model and
+label files. Once a change is stable for one polling period (the file is
+completely written), or on a control request, the new neural network is
+built and warmed up in a background thread. The streaming thread takes it
+between two frames, the previous model stays in use until then and when
+the new one cannot be loaded.
+"""
+
+import os
+import threading
+from timeit import default_timer as timer
+
+def file_signature(path):
+    """
+    :return: (modification time, size) of a file, None if it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+class ModelReloader:
+    """
+    Class that watches the model files and prepares the neural network
+    replacing the current one
+    """
+    def __init__(self, paths, factory, poll_interval=2.0):
+        """
+        :param paths: model and label files watched
+        :param factory: function building the warmed up NeuralNetwork of the
+                        current content of the files
+        :param poll_interval: polling period of the files in seconds
+        """
+        self.paths = [path for path in paths if path]
+        self.factory = factory
+        self.poll_interval = poll_interval
+        self._loaded = self._signatures()
+        self._changed = None
+        self._pending = None
+        self._building = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # statistics
+        self.reloads = 0
+        self.failures = 0
+        self.last_build_time = None
+
+    def _signatures(self):
+        return [file_signature(path) for path in self.paths]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="model-reload", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check()
+
+    def check(self):
+        """
+        compare the files with the loaded ones, called by the watcher thread
+        """
+        signatures = self._signatures()
+        if signatures == self._loaded or None in signatures:
+            # unchanged, or a file is being replaced
+            self._changed = None
+            return
+        if signatures != self._changed:
+            # wait for one more period without modification
+            self._changed = signatures
+            return
+        if self.request():
+            print("model files changed, reloading " + ", ".join(self.paths))
+            self._changed = None
+        # else a build is running, the change is handled at the next period
+
+    def request(self):
+        """
+        build a new neural network from the current files, nothing is done
+        if one is already being built
+        :return: True if the build is started
+        """
+        with self._lock:
+            if self._building:
+                return False
+            self._building = True
+            # files changed from now on are reloaded again
+            self._loaded = self._signatures()
+        threading.Thread(target=self._build, name="model-reload-build", daemon=True).start()
+        return True
+
+    def _build(self):
+        start_time = timer()
+        nn = None
+        try:
+            nn = self.factory()
+        except Exception as error:
+            # whatever the failure, the current model keeps running
+            message = (str(error).splitlines() or [type(error).__name__])[0]
+            print("WARNING: model not reloaded, the current one is kept: " + message)
+            self.failures += 1
+        finally:
+            self.last_build_time = timer() - start_time
+            with self._lock:
+                if nn is not None:
+                    self._pending = nn
+                self._building = False
+
+    def take(self):
+        """
+        called by the streaming thread between two frames
+        :return: the new NeuralNetwork, None if there is none ready
+        """
+        if self._pending is None:
+            return None
+        with self._lock:
+            nn, self._pending = self._pending, None
+        if nn is not None:
+            self.reloads += 1
+        return nn
+
+    def summary(self):
+        build_time = "" if self.last_build_time is None else \
+                     ", last build and warm-up {0:.2f} s".format(self.last_build_time)
+        return "model reload: {0} reloads, {1} failures{2}".format(self.reloads, self.failures, build_time)
@@ -0,0 +1,385 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+import os
+import re
+import subprocess
+from os import path
+from timeit import default_timer as timer
+
+import numpy as np
+
+from tfl_common import mock_backend
+from tfl_common.memory_stats import LazyModule
+
+# not imported when the mock backend is used
+tflr = LazyModule("tflite_runtime.interpreter")
+
+LIBTPU_STD_PATH = "/usr/lib/libedgetpu-std.so.2"
+LIBTPU_MAX_PATH = "/usr/lib/libedgetpu-max.so.2"
+
+def edgetpu_connected():
+    """
+    :return: True if a Coral Edge TPU is plugged on the USB bus
+    """
+    device_re = re.compile(r".+?ID\s(?P<id>\w+)", re.I)
+    lsusb = subprocess.check_output("lsusb").decode("utf-8")
+    for i in lsusb.split('\n'):
+        if i:
+            info = device_re.match(i)
+            if info:
+                d = info.groupdict()
+                if '1a6e' in d.values() or '18d1' in d.values():
+                    return True
+    return False
+
+def interpreter_backend(model_file):
+    """
+    :return: the interpreter module, the mock backend runs the application
+             without a real model ("mock://" model path)
+    """
+    if mock_backend.is_mock_model(model_file):
+        return mock_backend
+    return tflr
+
+def load_labels(filename):
+    my_labels = []
+    with open(filename, 'r') as input_file:
+        for l in input_file:
+            my_labels.append(l.strip())
+    return my_labels
+
+class ClassificationPostProcess:
+    """
+    Post-processing of an image classification model: top-1 class
+    """
+    def warm_up(self, runs):
+        pass
+
+    def get_results(self, nn):
+        """
+        :return: (accuracy, label index) of the best class
+        """
+        results = np.squeeze(nn.get_output(0))
+        top = int(np.argmax(results))
+        if nn.is_floating_model():
+            return (results[top], top)
+        else:
+            return (results[top]/255.0, top)
+
+    def get_batch_results(self, nn, count):
+        """
+        :param count: number of valid images in the input batch
+        :return: (accuracies, label indexes) arrays of the best class of
+                 each image
+        """
+        results = nn.get_output(0)[:count].reshape(count, -1)
+        top = np.argmax(results, axis=1)
+        accuracies = results[np.arange(count), top].astype(np.float32)
+        if not nn.is_floating_model():
+            accuracies /= 255.0
+        return (accuracies, top)
+
+class DetectionPostProcess:
+    """
+    Post-processing of a SSD object detection model with the TFLite
+    detection post-processing operator: locations, classes and scores
+    """
+    def warm_up(self, runs):
+        pass
+
+    def get_results(self, nn):
+        """
+        :return: (locations, classes, scores) output tensors
+        """
+        locations = nn.get_output(0)
+        classes   = nn.get_output(1)
+        scores    = nn.get_output(2)
+        return (locations, classes, scores)
+
+class NeuralNetwork:
+    """
+    Class that handles Neural Network inference
+
+    The task specific part (interpretation of the output tensors) is done
+    by a post-processing object, see ClassificationPostProcess and
+    DetectionPostProcess.
+    """
+
+    def __init__(self, model_file, label_file, input_mean, input_std, edgetpu, perf,
+                 ext_delegate, num_threads, camera_preview, postprocess, warmup_runs=0):
+        """
+        :param model_file: .tflite model to be executed
+        :param label_file:  name of file containing labels
+        :param input_mean: input_mean
+        :param input_std: input standard deviation
+        :param edgetpu: True to run the model on the Coral Edge TPU
+        :param perf: Edge TPU library to use, 'std' or 'max'
+        :param ext_delegate: path of an external delegate library or None
+        :param num_threads: number of interpreter threads, None for automatic
+        :param camera_preview: True when a core has to be kept for the video display
+        :param postprocess: task specific post-processing object
+        :param warmup_runs: number of dummy inferences run by warm_up()
+        """
+
+        if num_threads == None :
+            if os.cpu_count() <= 1:
+                self.number_threads = 1
+            else :
+                # one core is always reserved for video display
+                if camera_preview:
+                    self.number_threads = os.cpu_count() - 1
+                else :
+                    self.number_threads = os.cpu_count()
+        else :
+           self.number_threads = int(num_threads)
+
+        self._selected_delegate = None
+        self._model_file = model_file
+        self._label_file = label_file
+        self._input_mean = input_mean
+        self._input_std = input_std
+        self._floating_model = False
+        self._input_frame = None
+        self._postprocess = postprocess
+        self._warmup_runs = warmup_runs
+        self.cold_latency = None
+        self.warm_latency = None
+        self._backend = self.get_backend(model_file)
+
+        if edgetpu is True:
+            #Check if the Edge TPU is connected
+            if not edgetpu_connected():
+                print("Edge TPU is not plugged!")
+                print("Please connect the Edge TPU and try again.")
+                os._exit(1)
+
+            if perf == 'std':
+                if path.exists(LIBTPU_STD_PATH):
+                    self._selected_delegate = LIBTPU_STD_PATH
+                else :
+                    print("No delegate ",LIBTPU_STD_PATH, "found fall back on CPU mode")
+            elif perf == 'max':
+                if path.exists(LIBTPU_MAX_PATH):
+                    self._selected_delegate = LIBTPU_MAX_PATH
+                else :
+                    print("No delegate ",LIBTPU_MAX_PATH, "found fall back on CPU mode")
+
+        elif ext_delegate is not None :
+            if path.exists(ext_delegate):
+                self._selected_delegate = ext_delegate
+            else :
+                print("No delegate ",ext_delegate, "found fall back on CPU mode")
+
+        if self._selected_delegate is not None:
+            print('Loading external delegate from {}'.format(self._selected_delegate))
+            print("number of threads used in tflite interpreter : ",self.number_threads)
+        else :
+            print("no delegate to use, CPU mode activated")
+        self._create_interpreter()
+
+        # check the type of the input tensor
+        if self._input_details[0]['dtype'] == np.float32:
+            self._floating_model = True
+            print("Floating point Tensorflow Lite Model")
+
+        self._labels = load_labels(self._label_file)
+
+    def __getstate__(self):
+        return (self._model_file, self._label_file, self._input_mean,
+                self._input_std, self._floating_model, self._selected_delegate, self.number_threads, \
+                self._input_details, self._output_details, self._labels, self._postprocess, \
+                self._warmup_runs)
+
+    def __setstate__(self, state):
+        self._model_file, self._label_file, self._input_mean, \
+                self._input_std, self._floating_model, self._selected_delegate, self.number_threads, \
+                self._input_details, self._output_details, self._labels, self._postprocess, \
+                self._warmup_runs = state
+
+        self._backend = self.get_backend(self._model_file)
+        self._input_frame = None
+        self.cold_latency = None
+        self.warm_latency = None
+        self._create_interpreter()
+
+    def _create_interpreter(self):
+        if self._selected_delegate is not None:
+            self._interpreter = self._backend.Interpreter(model_path=self._model_file,
+                                                          num_threads = self.number_threads,
+                                                          experimental_delegates=[self._backend.load_delegate(self._selected_delegate)])
+        else :
+            self._interpreter = self._backend.Interpreter(model_path=self._model_file,
+                                                          num_threads = self.number_threads)
+        self._interpreter.allocate_tensors()
+        self._update_details()
+
+    def _update_details(self):
+        self._input_details = self._interpreter.get_input_details()
+        self._output_details = self._interpreter.get_output_details()
+        self._input_index = self._input_details[0]['index']
+
+    def get_backend(self, model_file):
+        return interpreter_backend(model_file)
+
+    def get_labels(self):
+        return self._labels
+
+    def get_config(self):
+        """
+        :return: dictionary of the parameters, other than the model file,
+                 on which the results of the model depend
+        """
+        return {"delegate": self._selected_delegate,
+                "input_mean": self._input_mean,
+                "input_std": self._input_std,
+                "input_size": [int(v) for v in self.get_img_size()],
+                "postprocess": type(self._postprocess).__name__}
+
+    def get_postprocess(self):
+        return self._postprocess
+
+    def is_floating_model(self):
+        return self._floating_model
+
+    def get_img_size(self):
+        """
+        :return: size of NN input image size
+        """
+        # NxHxWxC, H:1, W:2, C:3
+        return (int(self._input_details[0]['shape'][1]),
+                int(self._input_details[0]['shape'][2]),
+                int(self._input_details[0]['shape'][3]))
+
+    def get_output_specs(self):
+        """
+        :return: list of (shape, dtype) of the output tensors of one image,
+                 the batch dimension is 1
+        """
+        return [((1,) + tuple(int(v) for v in details['shape'][1:]), np.dtype(details['dtype']))
+                for details in self._output_details]
+
+    def supports_num_threads(self):
+        """
+        :return: True if the number of threads drives the inference speed,
+                 which is not the case with a delegate
+        """
+        return self._selected_delegate is None
+
+    def set_num_threads(self, num_threads):
+        """
+        re-create and warm up the interpreter with another number of
+        threads, the input batch size is kept
+        """
+        batch_size = self.get_batch_size()
+        self.number_threads = int(num_threads)
+        self._create_interpreter()
+        if batch_size != 1:
+            self.set_batch_size(batch_size)
+        self.warm_up()
+        print("number of threads used in tflite interpreter : ",self.number_threads)
+
+    def get_batch_size(self):
+        return int(self._input_details[0]['shape'][0])
+
+    def set_batch_size(self, batch_size):
+        """
+        resize the batch dimension of the input tensor, the tensors are
+        re-allocated so this must not be done for every inference
+        """
+        height, width, channel = self.get_img_size()
+        self._interpreter.resize_tensor_input(self._input_index, [batch_size, height, width, channel])
+        self._interpreter.allocate_tensors()
+        self._update_details()
+
+    def get_input_frame(self):
+        """
+        :return: the last image passed to launch_inference, None before the
+                 first inference
+        """
+        return self._input_frame
+
+    def _write_input(self, input_tensor, img):
+        if self._floating_model:
+            np.subtract(img, self._input_mean, out=input_tensor, dtype=np.float32)
+            np.divide(input_tensor, self._input_std, out=input_tensor)
+        else:
+            input_tensor[...] = img
+
+    def launch_inference(self, img):
+        """
+        This method launches inference using the invoke call
+        :param img: the image to be inferenced
+        """
+        self._input_frame = img
+        # the frame is written straight into the input tensor (N dim
+        # dropped), the normalization of floating point models is done in
+        # place to avoid intermediate copies
+        input_tensor = self._interpreter.tensor(self._input_index)()[0]
+        self._write_input(input_tensor, img)
+        # no reference to the tensor buffer must be kept during invoke
+        del input_tensor
+        self._interpreter.invoke()
+
+    def launch_batch_inference(self, imgs):
+        """
+        launch a single inference on a batch of images
+        :param imgs: images to be inferenced, at most get_batch_size() of them
+        """
+        input_tensor = self._interpreter.tensor(self._input_index)()
+        for i, img in enumerate(imgs):
+            self._write_input(input_tensor[i], img)
+        del input_tensor
+        self._interpreter.invoke()
+
+    def warm_up(self, runs=None):
+        """
+        Run dummy inferences so that the first frames do not pay the one time
+        costs of the first invocations (weights packing, accelerator upload)
+        :param runs: number of inferences, the warmup_runs of the constructor
+                     by default
+        :return: (cold latency, warm latency) in seconds, the cold latency is
+                 the first inference and the warm latency the mean of the
+                 others (None with less than two runs)
+        """
+        if runs is None:
+            runs = self._warmup_runs
+        if runs <= 0:
+            return (None, None)
+        height, width, channel = self.get_img_size()
+        dummy = np.full((height, width, channel), 128, dtype=np.uint8)
+        latencies = []
+        for i in range(runs):
+            start_time = timer()
+            self.launch_inference(dummy)
+            latencies.append(timer() - start_time)
+        # the dummy frame must not be seen by the post-processing
+        self._input_frame = None
+        self._postprocess.warm_up(runs)
+        self.cold_latency = latencies[0]
+        if runs > 1:
+            self.warm_latency = sum(latencies[1:]) / (runs - 1)
+        return (self.cold_latency, self.warm_latency)
+
+    def warm_up_summary(self):
+        if self.cold_latency is None:
+            return "warm-up: not done"
+        summary = "warm-up: cold inference {0:.1f} ms".format(self.cold_latency * 1000)
+        if self.warm_latency is not None:
+            summary += ", warm inference {0:.1f} ms".format(self.warm_latency * 1000)
+        return summary
+
+    def get_output(self, idx):
+        """
+        :return: copy of the output tensor idx
+        """
+        return self._interpreter.get_tensor(self._output_details[idx]['index'])
+
+    def get_results(self):
+        return self._postprocess.get_results(self)
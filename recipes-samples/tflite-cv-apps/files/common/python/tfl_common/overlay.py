@@ -0,0 +1,265 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+import math
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+import cairo
+
+# colors of the boxes drawn around the detected objects, by rank
+BOX_COLORS = ((1, 0, 0),
+              (0, 1, 0),
+              (0, 0, 1),
+              (0.5, 0.5, 0),
+              (0.5, 0, 0.5))
+
+class TextSprite:
+    """
+    Text rendered once in an image surface and painted as a bitmap
+    """
+    def __init__(self, surface, x_bearing, y_bearing, width, height):
+        self.surface = surface
+        # position of the surface origin relatively to the text baseline
+        self.x_bearing = x_bearing
+        self.y_bearing = y_bearing
+        self.width = width
+        self.height = height
+
+    def paint(self, cr, x, y):
+        """
+        paint the text with its baseline starting at (x, y)
+        """
+        cr.set_source_surface(self.surface, x + self.x_bearing, y + self.y_bearing)
+        cr.paint()
+
+    def paint_centered(self, cr, x, y):
+        """
+        paint the text horizontally centered on x with its baseline at y
+        """
+        cr.set_source_surface(self.surface, x - self.width / 2, y + self.y_bearing)
+        cr.paint()
+
+    def extents(self, x, y):
+        """
+        :return: (x, y, width, height) area covered when painted at (x, y)
+        """
+        return (x + self.x_bearing, y + self.y_bearing, self.width, self.height)
+
+class TextCache:
+    """
+    Least recently used cache of pre-rendered texts
+
+    Rendering a text with cairo means shaping the glyphs and rasterizing
+    them on each call, caching the result as a bitmap avoids doing it again
+    on every redraw.
+    """
+    def __init__(self, font_size, max_entries=256):
+        self.font_size = font_size
+        self.max_entries = max_entries
+        self._sprites = OrderedDict()
+        # scratch context only used to measure the texts
+        self._scratch = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1))
+        self._scratch.set_font_size(font_size)
+
+    def get(self, text, fill, outline=None, line_width=1):
+        """
+        :param text: text to render
+        :param fill: (r, g, b) color of the text
+        :param outline: optional (r, g, b) color of the text outline
+        :return: TextSprite of the text
+        """
+        key = (text, fill, outline, line_width)
+        sprite = self._sprites.get(key)
+        if sprite is not None:
+            self._sprites.move_to_end(key)
+            return sprite
+
+        sprite = self._render(text, fill, outline, line_width)
+        self._sprites[key] = sprite
+        if len(self._sprites) > self.max_entries:
+            self._sprites.popitem(last=False)
+        return sprite
+
+    def _render(self, text, fill, outline, line_width):
+        xbearing, ybearing, width, height, xadvance, yadvance = self._scratch.text_extents(text)
+        margin = int(math.ceil(line_width)) + 1
+        surface_width = int(math.ceil(width)) + 2 * margin
+        surface_height = int(math.ceil(height)) + 2 * margin
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, max(surface_width, 1), max(surface_height, 1))
+        cr = cairo.Context(surface)
+        cr.set_font_size(self.font_size)
+        cr.move_to(margin - xbearing, margin - ybearing)
+        if outline is None:
+            cr.set_source_rgb(*fill)
+            cr.show_text(text)
+        else:
+            cr.text_path(text)
+            cr.set_source_rgb(*fill)
+            cr.fill_preserve()
+            cr.set_source_rgb(*outline)
+            cr.set_line_width(line_width)
+            cr.stroke()
+        surface.flush()
+        return TextSprite(surface, xbearing - margin, ybearing - margin,
+                          surface_width, surface_height)
+
+class DetectionOverlay:
+    """
+    Class that draws the boxes of the detected objects
+
+    The geometry of the boxes and their captions are computed once per
+    inference result in update(), draw() only replays them. update() returns
+    the areas covered by the previous and the new boxes so that the caller
+    can invalidate only those regions.
+    """
+    def __init__(self, font_size, text_offset, max_boxes, score_bucket=1, line_width=2):
+        """
+        :param font_size: font size of the box captions
+        :param text_offset: distance between the box top and the caption baseline
+        :param max_boxes: maximum number of boxes drawn
+        :param score_bucket: score resolution (in percent) of the cached captions
+        """
+        self.text_cache = TextCache(font_size)
+        self.text_offset = text_offset
+        self.max_boxes = max_boxes
+        self.score_bucket = max(1, int(score_bucket))
+        self.line_width = line_width
+        self.preview_width = 0
+        self.preview_height = 0
+        self.offset = 0
+        self._boxes = []
+
+    def set_geometry(self, preview_width, preview_height, offset):
+        """
+        set the size of the video preview and its horizontal offset in the
+        drawing area
+        """
+        self.preview_width = preview_width
+        self.preview_height = preview_height
+        self.offset = offset
+
+    def update(self, locations, classes, scores, labels, threshold, sub_labels=None):
+        """
+        compute the boxes of a new inference result
+        :param locations: (N, 4) array of normalized y0, x0, y1, x1 locations
+        :param classes: (N,) array of class indexes
+        :param scores: (N,) array of scores
+        :param sub_labels: optional (N,) sequence of texts appended to the
+                           captions, None for no text
+        :return: list of (x, y, width, height) areas to redraw
+        """
+        dirty = [self._box_extents(box) for box in self._boxes]
+        boxes = []
+        for i in range(min(self.max_boxes, len(scores))):
+            score = float(scores[i])
+            if score <= threshold:
+                continue
+            y0 = int(float(locations[i][0]) * self.preview_height)
+            x0 = int(float(locations[i][1]) * self.preview_width)
+            y1 = int(float(locations[i][2]) * self.preview_height)
+            x1 = int(float(locations[i][3]) * self.preview_width)
+            x = int(x0 + self.offset)
+            y = y0
+            accuracy = int(score * 100)
+            accuracy -= accuracy % self.score_bucket
+            color = BOX_COLORS[i % len(BOX_COLORS)]
+            caption = labels[int(classes[i])] + " " + str(accuracy) + "%"
+            if sub_labels is not None and sub_labels[i] is not None:
+                caption += " " + sub_labels[i]
+            sprite = self.text_cache.get(caption, color)
+            boxes.append((x, y, x1 - x0, y1 - y0, color, sprite))
+        self._boxes = boxes
+        dirty.extend(self._box_extents(box) for box in boxes)
+        return dirty
+
+    def clear(self):
+        """
+        remove all the boxes
+        :return: list of (x, y, width, height) areas to redraw
+        """
+        dirty = [self._box_extents(box) for box in self._boxes]
+        self._boxes = []
+        return dirty
+
+    def _box_extents(self, box):
+        x, y, width, height, color, sprite = box
+        margin = self.line_width
+        tx, ty, tw, th = sprite.extents(x, y - self.text_offset)
+        left = min(x - margin, tx)
+        top = min(y - margin, ty)
+        right = max(x + width + margin, tx + tw)
+        bottom = max(y + height + margin, ty + th)
+        return (int(math.floor(left)), int(math.floor(top)),
+                int(math.ceil(right - left)) + 1, int(math.ceil(bottom - top)) + 1)
+
+    def draw(self, cr):
+        cr.set_line_width(self.line_width)
+        for x, y, width, height, color, sprite in self._boxes:
+            cr.set_source_rgb(*color)
+            cr.rectangle(x, y, width, height)
+            cr.stroke()
+            sprite.paint(cr, x, y - self.text_offset)
+
+class PipelineOverlay:
+    """
+    Boxes of the last published result drawn on the frames of the display
+    branch by a cairooverlay element, on the GStreamer streaming thread
+
+    The boxes are computed once per result snapshot and painted on every
+    frame, the annotated frames reach the sink without any GTK widget
+    stacked over the video.
+    """
+    def __init__(self, handoff, labels, threshold, font_size, text_offset, max_boxes, sub_labels=None):
+        """
+        :param handoff: ResultHandoff object publishing the results
+        :param labels: labels of the detected classes
+        :param font_size: font size of the captions in frame pixels
+        :param sub_labels: labels of the classes of the second stage
+                           classification (results[3]), None without
+        """
+        self.handoff = handoff
+        self.labels = labels
+        self.threshold = threshold
+        self.sub_labels = sub_labels
+        # dedicated overlay and text cache, the GTK thread never uses them
+        self.boxes = DetectionOverlay(font_size, text_offset, max_boxes)
+        self._seq = 0
+        # statistics
+        self.frames = 0
+        self.draw_time = 0.0
+
+    def set_frame_size(self, width, height):
+        """
+        called when the caps of the display branch change
+        """
+        self.boxes.set_geometry(width, height, 0)
+        # compute the boxes again with the new geometry
+        self._seq = 0
+
+    def draw(self, cr):
+        start_time = timer()
+        snapshot = self.handoff.latest()
+        if snapshot is not None and snapshot.seq != self._seq:
+            self._seq = snapshot.seq
+            locations, classes, scores = snapshot.results[:3]
+            sub_labels = None
+            if self.sub_labels is not None:
+                sub_labels = [self.sub_labels[c] if c >= 0 else None
+                              for c in snapshot.results[3][0]]
+            self.boxes.update(locations[0], classes[0], scores[0],
+                              self.labels, self.threshold, sub_labels)
+        self.boxes.draw(cr)
+        self.frames += 1
+        self.draw_time += timer() - start_time
+
+    def summary(self):
+        avg_draw_time = self.draw_time / self.frames * 1000 if self.frames else 0.0
+        return "pipeline overlay: {0} frames annotated, avg draw time {1:.2f} ms".format(
+               self.frames, avg_draw_time)
@@ -0,0 +1,303 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+import threading
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from tfl_common.memory_stats import LazyModule
+
+# only needed when the metrics are served
+http_server = LazyModule("http.server")
+
+class LatencyStats:
+    """
+    Accumulated latency figures of one probe point of the pipeline
+    """
+    def __init__(self):
+        self.count = 0
+        self.last = 0.0
+        self.max = 0.0
+        self.sum = 0.0
+
+    def add(self, latency):
+        self.count += 1
+        self.last = latency
+        self.sum += latency
+        if latency > self.max:
+            self.max = latency
+
+    def average(self):
+        if self.count == 0:
+            return 0.0
+        return self.sum / self.count
+
+class QueueStats:
+    """
+    Buffer counters of a queue element, used to deduce the number of
+    buffers dropped by a leaky queue
+    """
+    def __init__(self, queue):
+        self.queue = queue
+        self.buffers_in = 0
+        self.buffers_out = 0
+        self.overruns = 0
+
+    def level(self):
+        return self.queue.get_property("current-level-buffers")
+
+    def dropped(self):
+        # every buffer entering the queue either left it, is still queued or
+        # was discarded by the leaky mode
+        return max(0, self.buffers_in - self.buffers_out - self.level())
+
+class PipelineMetrics:
+    """
+    In-process store of the pipeline runtime metrics
+
+    Values are written from the GStreamer streaming threads and read from
+    the GTK main loop or the Prometheus server thread, so all the accesses
+    are done under a lock.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._queues = {}
+        self._received = {}
+        self._pulled = {}
+        self._gauges = {}
+
+    def record_latency(self, point, latency):
+        """
+        :param point: name of the probe point
+        :param latency: latency in seconds between capture and the probe point
+        """
+        with self._lock:
+            stats = self._latency.get(point)
+            if stats is None:
+                stats = self._latency[point] = LatencyStats()
+            stats.add(latency)
+
+    def add_queue(self, queue):
+        with self._lock:
+            stats = self._queues[queue.get_name()] = QueueStats(queue)
+        return stats
+
+    def record_queue_in(self, name):
+        with self._lock:
+            self._queues[name].buffers_in += 1
+
+    def record_queue_out(self, name):
+        with self._lock:
+            self._queues[name].buffers_out += 1
+
+    def record_queue_overrun(self, name):
+        with self._lock:
+            self._queues[name].overruns += 1
+
+    def record_received(self, point):
+        """
+        count the buffers reaching an appsink
+        """
+        with self._lock:
+            self._received[point] = self._received.get(point, 0) + 1
+
+    def record_pull(self, point):
+        """
+        count the samples really pulled from an appsink
+        """
+        with self._lock:
+            self._pulled[point] = self._pulled.get(point, 0) + 1
+
+    def set_value(self, name, value):
+        """
+        store an application level gauge (display fps, inference time...)
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self):
+        """
+        :return: a dictionary with a copy of all the current metrics
+        """
+        with self._lock:
+            latency = {}
+            for point, stats in self._latency.items():
+                latency[point] = {"count": stats.count,
+                                  "last": stats.last,
+                                  "avg": stats.average(),
+                                  "max": stats.max}
+            queues = {}
+            for name, stats in self._queues.items():
+                queues[name] = {"in": stats.buffers_in,
+                                "out": stats.buffers_out,
+                                "level": stats.level(),
+                                "dropped": stats.dropped(),
+                                "overruns": stats.overruns}
+            pulled = {}
+            for point, received in self._received.items():
+                count = self._pulled.get(point, 0)
+                # an appsink configured with drop=True silently replaces its
+                # pending sample, the last one may still be waiting
+                pulled[point] = {"received": received,
+                                 "pulled": count,
+                                 "dropped": max(0, received - count - 1)}
+            return {"latency": latency,
+                    "queues": queues,
+                    "appsinks": pulled,
+                    "gauges": dict(self._gauges)}
+
+    def summary(self):
+        """
+        :return: human readable report of the metrics
+        """
+        snap = self.snapshot()
+        lines = []
+        for point, stats in snap["latency"].items():
+            lines.append("{0:12} latency avg {1:8.2f} ms  max {2:8.2f} ms  ({3} buffers)".format(
+                         point, stats["avg"] * 1000, stats["max"] * 1000, stats["count"]))
+        for name, stats in snap["queues"].items():
+            lines.append("{0:12} in {1:6}  out {2:6}  level {3}  dropped {4}".format(
+                         name, stats["in"], stats["out"], stats["level"], stats["dropped"]))
+        for point, stats in snap["appsinks"].items():
+            lines.append("{0:12} received {1:6}  pulled {2:6}  dropped {3}".format(
+                         point, stats["received"], stats["pulled"], stats["dropped"]))
+        return "\n".join(lines)
+
+    def to_prometheus(self):
+        """
+        :return: the metrics formatted with the Prometheus text exposition format
+        """
+        snap = self.snapshot()
+        lines = []
+        lines.append("# TYPE tfl_pipeline_buffers_total counter")
+        for point, stats in snap["latency"].items():
+            lines.append('tfl_pipeline_buffers_total{point="%s"} %d' % (point, stats["count"]))
+        lines.append("# TYPE tfl_pipeline_latency_seconds gauge")
+        for point, stats in snap["latency"].items():
+            lines.append('tfl_pipeline_latency_seconds{point="%s",stat="last"} %f' % (point, stats["last"]))
+            lines.append('tfl_pipeline_latency_seconds{point="%s",stat="avg"} %f' % (point, stats["avg"]))
+            lines.append('tfl_pipeline_latency_seconds{point="%s",stat="max"} %f' % (point, stats["max"]))
+        lines.append("# TYPE tfl_queue_level_buffers gauge")
+        for name, stats in snap["queues"].items():
+            lines.append('tfl_queue_level_buffers{queue="%s"} %d' % (name, stats["level"]))
+        lines.append("# TYPE tfl_queue_dropped_total counter")
+        for name, stats in snap["queues"].items():
+            lines.append('tfl_queue_dropped_total{queue="%s"} %d' % (name, stats["dropped"]))
+        lines.append("# TYPE tfl_appsink_dropped_total counter")
+        for point, stats in snap["appsinks"].items():
+            lines.append('tfl_appsink_dropped_total{appsink="%s"} %d' % (point, stats["dropped"]))
+        for name, value in snap["gauges"].items():
+            lines.append("# TYPE tfl_%s gauge" % name)
+            lines.append("tfl_%s %f" % (name, value))
+        return "\n".join(lines) + "\n"
+
+class PipelineProbes:
+    """
+    Class that installs the pad probes feeding a PipelineMetrics object
+    """
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def _running_time(self, element):
+        clock = element.get_clock()
+        if clock is None:
+            return None
+        return clock.get_time() - element.get_base_time()
+
+    def _latency_probe(self, pad, info, point):
+        buf = info.get_buffer()
+        if buf is not None and buf.pts != Gst.CLOCK_TIME_NONE:
+            # live sources timestamp the buffers with the pipeline running
+            # time at capture
+            running_time = self._running_time(pad.get_parent_element())
+            if running_time is not None:
+                self.metrics.record_latency(point, (running_time - buf.pts) / Gst.SECOND)
+        return Gst.PadProbeReturn.OK
+
+    def _queue_in_probe(self, pad, info, name):
+        self.metrics.record_queue_in(name)
+        return Gst.PadProbeReturn.OK
+
+    def _queue_out_probe(self, pad, info, name):
+        self.metrics.record_queue_out(name)
+        return Gst.PadProbeReturn.OK
+
+    def _appsink_probe(self, pad, info, point):
+        self.metrics.record_received(point)
+        return self._latency_probe(pad, info, point)
+
+    def _queue_overrun(self, queue):
+        self.metrics.record_queue_overrun(queue.get_name())
+
+    def watch_point(self, point, pad):
+        """
+        measure the capture to pad latency of each buffer
+        """
+        pad.add_probe(Gst.PadProbeType.BUFFER, self._latency_probe, point)
+
+    def watch_queue(self, queue):
+        """
+        count the buffers going through a queue and measure the latency
+        at its output
+        """
+        name = queue.get_name()
+        self.metrics.add_queue(queue)
+        queue.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER,
+                                               self._queue_in_probe, name)
+        srcpad = queue.get_static_pad("src")
+        srcpad.add_probe(Gst.PadProbeType.BUFFER, self._queue_out_probe, name)
+        srcpad.add_probe(Gst.PadProbeType.BUFFER, self._latency_probe, name)
+        queue.connect("overrun", self._queue_overrun)
+
+    def watch_appsink(self, appsink):
+        """
+        count the buffers reaching an appsink and measure their latency, the
+        application reports the pulled samples with PipelineMetrics.record_pull
+        """
+        appsink.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER,
+                                                 self._appsink_probe,
+                                                 appsink.get_name())
+
+class PrometheusServer:
+    """
+    Serve the metrics as Prometheus text on a local TCP socket
+    """
+    def __init__(self, metrics, port, address="127.0.0.1"):
+        self.metrics = metrics
+
+        class Handler(http_server.BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split("?", 1)[0] != "/metrics":
+                    handler.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode("utf-8")
+                handler.send_response(200)
+                handler.send_header("Content-Type", "text/plain; version=0.0.4")
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                pass
+
+        self._server = http_server.ThreadingHTTPServer((address, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="metrics-server", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        print("pipeline metrics available on http://{0}:{1}/metrics".format(*self._server.server_address))
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
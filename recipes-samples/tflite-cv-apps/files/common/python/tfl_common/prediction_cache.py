@@ -0,0 +1,192 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+On-disk cache of the inference results of the still pictures
+
+The results of a model only depend on the model files, the delegate, the
+preprocessing of the pictures and the picture bytes. The cache of a model
+lives in <cache directory>/<key>, the key being a digest of the model files
+and of the configuration, so that the cache of a modified model is never
+used. The results of the pictures are stored in one memory mapped .npy file
+per result array, index.json maps the digest of each picture to its row.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+INDEX_FILE = "index.json"
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    :return: sha256 hex digest of the content of a file
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as input_file:
+        for chunk in iter(lambda: input_file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cache_key(model_files, config):
+    """
+    :param model_files: paths of the models producing the results, a path
+                        which is not a file (mock model) is hashed as is
+    :param config: JSON serializable dictionary of the parameters changing
+                   the results (preprocessing, delegate...)
+    :return: (key, model digests)
+    """
+    model_digests = []
+    for model_file in model_files:
+        if os.path.isfile(model_file):
+            model_digests.append(file_digest(model_file))
+        else:
+            model_digests.append(hashlib.sha256(str(model_file).encode()).hexdigest())
+    digest = hashlib.sha256()
+    digest.update(json.dumps([model_digests, config], sort_keys=True).encode())
+    return digest.hexdigest()[:32], model_digests
+
+class PredictionCache:
+    """
+    Class that stores and replays the inference results of the pictures
+
+    The results of a picture are a tuple of arrays having the same shapes
+    and types for all the pictures (the get_results() of the post-process).
+    """
+    def __init__(self, directory, model_files, config, initial_capacity=64, flush_interval=64):
+        """
+        :param directory: root directory of the caches of all the models
+        :param flush_interval: number of new entries between two index writes
+        """
+        self.key, self.model_digests = cache_key(model_files, config)
+        self.config = config
+        self.directory = os.path.join(directory, self.key)
+        self.initial_capacity = initial_capacity
+        self.flush_interval = flush_interval
+        self._index_path = os.path.join(self.directory, INDEX_FILE)
+        self._entries = {}
+        self._specs = None
+        self._arrays = []
+        self._capacity = 0
+        self._unflushed = 0
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def _array_path(self, idx):
+        return os.path.join(self.directory, "output_{0}.npy".format(idx))
+
+    def _load(self):
+        try:
+            with open(self._index_path, "r") as index_file:
+                index = json.load(index_file)
+            specs = [(tuple(shape), np.dtype(dtype)) for shape, dtype in index["outputs"]]
+            arrays = [np.load(self._array_path(i), mmap_mode="r+") for i in range(len(specs))]
+        except (OSError, ValueError, KeyError, TypeError):
+            # no cache yet or unusable cache, start from scratch
+            return
+        capacity = min(len(array) for array in arrays) if arrays else 0
+        entries = index["entries"]
+        if any(array.shape[1:] != shape or array.dtype != dtype
+               for array, (shape, dtype) in zip(arrays, specs)) or \
+           any(entry[0] >= capacity for entry in entries.values()):
+            return
+        self._specs = specs
+        self._arrays = arrays
+        self._capacity = capacity
+        self._entries = entries
+
+    def _allocate(self, results):
+        self._specs = [(np.shape(result), np.asarray(result).dtype) for result in results]
+        self._capacity = 0
+        self._arrays = [None] * len(self._specs)
+        self._entries = {}
+        self._grow(self.initial_capacity)
+
+    def _grow(self, capacity):
+        """
+        re-create the memory mapped arrays with a larger number of rows
+        """
+        for i, (shape, dtype) in enumerate(self._specs):
+            path = self._array_path(i)
+            tmp_path = path + ".tmp"
+            array = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype,
+                                              shape=(capacity,) + shape)
+            if self._arrays[i] is not None:
+                array[:self._capacity] = self._arrays[i][:self._capacity]
+            array.flush()
+            os.replace(tmp_path, path)
+            self._arrays[i] = array
+        self._capacity = capacity
+
+    def get(self, image_key):
+        """
+        :param image_key: digest of the picture file
+        :return: (results, inference time) of the picture, None if the
+                 picture is not in the cache
+        """
+        entry = self._entries.get(image_key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        row, inference_time = entry
+        results = tuple(np.array(array[row]) for array in self._arrays)
+        return results, inference_time
+
+    def put(self, image_key, results, inference_time):
+        """
+        store the results of a picture
+        """
+        if self._specs is None or len(results) != len(self._specs) or \
+           any(np.shape(result) != shape for result, (shape, _) in zip(results, self._specs)):
+            # first results, or results of another layout
+            self._allocate(results)
+        row = len(self._entries)
+        if image_key in self._entries:
+            row = self._entries[image_key][0]
+        elif row >= self._capacity:
+            self._grow(2 * self._capacity)
+        for array, result in zip(self._arrays, results):
+            array[row] = result
+        self._entries[image_key] = (row, inference_time)
+        self._unflushed += 1
+        if self._unflushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        write the arrays then the index which refers to them
+        """
+        if self._specs is None or self._unflushed == 0:
+            return
+        for array in self._arrays:
+            array.flush()
+        index = {"models": self.model_digests,
+                 "config": self.config,
+                 "outputs": [(list(shape), dtype.str) for shape, dtype in self._specs],
+                 "entries": self._entries}
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as index_file:
+            json.dump(index, index_file)
+        os.replace(tmp_path, self._index_path)
+        self._unflushed = 0
+
+    def close(self):
+        self.flush()
+        self._arrays = []
+        self._specs = None
+
+    def summary(self):
+        return "prediction cache {0}: {1} hits, {2} misses, {3} pictures cached".format(
+               self.directory, self.hits, self.misses, len(self._entries))
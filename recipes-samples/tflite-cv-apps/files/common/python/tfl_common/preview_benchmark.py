@@ -0,0 +1,84 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Micro-benchmark of the still picture preview paths
+
+    python3 -m tfl_common.preview_benchmark --width 1920 --height 1080
+
+compares the time needed to turn a RGB frame into something GTK can paint
+with the PIL -> GLib.Bytes -> GdkPixbuf -> copy chain and with the cairo
+surface of FramePreview.
+"""
+
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+
+from tfl_common.frame_preview import FramePreview, pack_rgb24
+
+def pixbuf_chain(frame):
+    """
+    former preview path of the still picture mode
+    """
+    from PIL import Image
+    import gi
+    gi.require_version('GdkPixbuf', '2.0')
+    from gi.repository import GLib
+    from gi.repository import GdkPixbuf
+    img = Image.fromarray(frame)
+    data = GLib.Bytes.new(img.tobytes())
+    pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(data,
+                                             GdkPixbuf.Colorspace.RGB,
+                                             False,
+                                             8,
+                                             frame.shape[1],
+                                             frame.shape[0],
+                                             frame.shape[2] * frame.shape[1])
+    return pixbuf.copy()
+
+def measure(function, frame, runs):
+    """
+    :return: median duration in seconds of function(frame)
+    """
+    function(frame)
+    durations = []
+    for _ in range(runs):
+        start_time = timer()
+        function(frame)
+        durations.append(timer() - start_time)
+    return float(np.median(durations))
+
+def main():
+    parser = argparse.ArgumentParser(description="still picture preview micro-benchmark")
+    parser.add_argument("--width", default=1920, type=int, help="frame width")
+    parser.add_argument("--height", default=1080, type=int, help="frame height")
+    parser.add_argument("--runs", default=50, type=int, help="number of measured runs")
+    args = parser.parse_args()
+
+    frame = np.random.randint(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    # the conversion alone, in a buffer of the size of the cairo surface
+    pixels = np.zeros((args.height, args.width, 4), dtype=np.uint8)
+    paths = [("numpy RGB24 conversion", lambda f: pack_rgb24(f, pixels))]
+    preview = FramePreview()
+    paths.append(("cairo FramePreview", preview.set_frame))
+    paths.append(("PIL/GdkPixbuf chain", pixbuf_chain))
+
+    print("{0}x{1} frame, median of {2} runs".format(args.width, args.height, args.runs))
+    for name, function in paths:
+        try:
+            duration = measure(function, frame, args.runs)
+        except (ImportError, ValueError) as error:
+            print("  {0:24} skipped: {1}".format(name, error))
+            continue
+        print("  {0:24} {1:8.2f} ms".format(name, duration * 1000))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+import os
+import threading
+
+class CpuLoadMonitor:
+    """
+    Class that measures the global CPU load from the aggregated "cpu" line
+    of <proc_root>/stat
+    """
+    def __init__(self, proc_root="/proc"):
+        self._stat_path = os.path.join(proc_root, "stat")
+        self._last = self._read()
+
+    def _read(self):
+        """
+        :return: (busy, total) jiffies, None if the file cannot be read
+        """
+        try:
+            with open(self._stat_path, "r") as stat_file:
+                fields = stat_file.readline().split()
+        except OSError:
+            return None
+        if not fields or fields[0] != "cpu":
+            return None
+        values = [int(v) for v in fields[1:]]
+        # idle and iowait are the 4th and 5th fields
+        idle = values[3] + (values[4] if len(values) > 4 else 0)
+        total = sum(values[:8])
+        return (total - idle, total)
+
+    def sample(self):
+        """
+        :return: CPU load between 0 and 1 since the previous sample, None if
+                 unknown
+        """
+        current = self._read()
+        last, self._last = self._last, current
+        if current is None or last is None:
+            return None
+        total = current[1] - last[1]
+        if total <= 0:
+            return None
+        return (current[0] - last[0]) / total
+
+class RateController:
+    """
+    Closed loop controller of the inference workload
+
+    The controller is updated with the display fps measurements. When the
+    display is below the target fps and the CPU is saturated the inference
+    stride is increased (one frame inferred every stride frames), then the
+    number of interpreter threads is decreased. When the display reaches
+    the target and the CPU has headroom the stride is decreased, then the
+    number of threads increased. A decision has to be confirmed by
+    consecutive updates before it is applied, and the new number of threads
+    is applied by the inference thread with take_num_threads().
+    """
+    def __init__(self, target_fps, num_threads, max_threads, adjust_threads=True,
+                 max_stride=8, high_load=0.85, low_load=0.65, confirm=2,
+                 cpu_monitor=None):
+        """
+        :param target_fps: display fps to reach
+        :param num_threads: initial number of interpreter threads
+        :param max_threads: maximal number of interpreter threads
+        :param adjust_threads: False when the interpreter threads cannot be
+                               changed (delegate, inference process)
+        :param max_stride: maximal inference stride
+        :param high_load: CPU load above which the CPU is saturated
+        :param low_load: CPU load below which the CPU has headroom
+        :param confirm: number of consecutive updates confirming a decision
+        :param cpu_monitor: CpuLoadMonitor object
+        """
+        self.target_fps = float(target_fps)
+        self.num_threads = num_threads
+        self.max_threads = max(1, max_threads)
+        self.adjust_threads = adjust_threads
+        self.max_stride = max(1, max_stride)
+        self.high_load = high_load
+        self.low_load = low_load
+        self.confirm = max(1, confirm)
+        self.cpu_monitor = cpu_monitor if cpu_monitor is not None else CpuLoadMonitor()
+        self.stride = 1
+        self.cpu_load = None
+        self.display_fps = 0.0
+        self.inference_time = 0.0
+        self._lock = threading.Lock()
+        self._frame_count = 0
+        self._votes = 0
+        self._pending_threads = None
+        # statistics
+        self.skipped = 0
+        self.adjustments = 0
+
+    def should_infer(self):
+        """
+        :return: True if the current frame has to be inferred
+        """
+        with self._lock:
+            self._frame_count += 1
+            if self._frame_count >= self.stride:
+                self._frame_count = 0
+                return True
+            self.skipped += 1
+            return False
+
+    def record_inference(self, inference_time):
+        with self._lock:
+            # smoothed inference latency
+            if self.inference_time == 0.0:
+                self.inference_time = inference_time
+            else:
+                self.inference_time = 0.8 * self.inference_time + 0.2 * inference_time
+
+    def take_num_threads(self):
+        """
+        :return: the new number of interpreter threads, None if unchanged
+        """
+        with self._lock:
+            num_threads, self._pending_threads = self._pending_threads, None
+            return num_threads
+
+    def _decide(self):
+        """
+        :return: -1 to reduce the inference workload, 1 to increase it, 0 to
+                 keep it
+        """
+        if self.display_fps < 0.9 * self.target_fps:
+            if self.cpu_load is None or self.cpu_load >= self.high_load:
+                return -1
+        elif self.cpu_load is not None and self.cpu_load <= self.low_load:
+            return 1
+        return 0
+
+    def update(self, display_fps):
+        """
+        new display fps measurement, adjust the stride or the number of
+        threads
+        """
+        with self._lock:
+            self.display_fps = display_fps
+            self.cpu_load = self.cpu_monitor.sample()
+            decision = self._decide()
+            if decision == 0 or (self._votes != 0 and (decision > 0) != (self._votes > 0)):
+                self._votes = decision
+            else:
+                self._votes += decision
+            if abs(self._votes) < self.confirm:
+                return
+            self._votes = 0
+            if decision < 0:
+                if self.stride < self.max_stride:
+                    self.stride += 1
+                    self.adjustments += 1
+                elif self.adjust_threads and self.num_threads > 1:
+                    self.num_threads -= 1
+                    self._pending_threads = self.num_threads
+                    self.adjustments += 1
+            else:
+                if self.stride > 1:
+                    self.stride -= 1
+                    self.adjustments += 1
+                elif self.adjust_threads and self.num_threads < self.max_threads:
+                    self.num_threads += 1
+                    self._pending_threads = self.num_threads
+                    self.adjustments += 1
+
+    def summary(self):
+        with self._lock:
+            load = "unknown" if self.cpu_load is None else "{0:.0f}%".format(self.cpu_load * 100)
+            return ("rate controller: stride {0}, {1} threads, cpu load {2}, "
+                    "{3} adjustments, {4} frames skipped").format(
+                    self.stride, self.num_threads, load, self.adjustments, self.skipped)
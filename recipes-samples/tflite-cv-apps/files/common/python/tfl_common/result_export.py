@@ -0,0 +1,318 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Streaming export of the inference results
+
+Results are published from the inference thread into a bounded buffer and
+written by a background thread, in batches, to one of the following sinks:
+  jsonl:<file>        one JSON object per line
+  bin:<file>          compact binary records (see BinaryRecordWriter)
+  unix:<socket>[#topic]  JSON lines sent to a local Unix stream socket, each
+                      line carries a topic to mimic a MQTT publication
+"""
+
+import json
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+class ExportRecord:
+    """
+    Raw inference result of one frame, converted by the writer thread
+    """
+    __slots__ = ("frame", "timestamp", "pts", "task", "source", "classes", "scores", "locations")
+
+    def __init__(self, frame, pts, task, source, classes, scores, locations=None):
+        self.frame = frame
+        self.timestamp = time.time()
+        self.pts = pts
+        self.task = task
+        self.source = source
+        self.classes = classes
+        self.scores = scores
+        self.locations = locations
+
+    def objects(self, labels, threshold):
+        """
+        :return: list of (class index, label, score, box) of the objects with
+                 a score above threshold, box is (x0, y0, x1, y1) or None
+        """
+        objects = []
+        for i in range(len(self.scores)):
+            score = float(self.scores[i])
+            if score <= threshold:
+                continue
+            class_id = int(self.classes[i])
+            label = labels[class_id] if 0 <= class_id < len(labels) else str(class_id)
+            box = None
+            if self.locations is not None:
+                y0, x0, y1, x1 = (float(v) for v in self.locations[i])
+                box = (x0, y0, x1, y1)
+            objects.append((class_id, label, score, box))
+        return objects
+
+    def to_dict(self, labels, threshold):
+        objects = []
+        for class_id, label, score, box in self.objects(labels, threshold):
+            obj = {"class": class_id, "label": label, "score": round(score, 4)}
+            if box is not None:
+                obj["box"] = [round(v, 5) for v in box]
+            objects.append(obj)
+        record = {"frame": self.frame,
+                  "timestamp": self.timestamp,
+                  "task": self.task,
+                  "objects": objects}
+        if self.pts >= 0:
+            record["pts"] = self.pts
+        if self.source is not None:
+            record["source"] = self.source
+        return record
+
+class JsonLinesWriter:
+    def __init__(self, path, labels, threshold):
+        self._file = open(path, "a")
+        self._labels = labels
+        self._threshold = threshold
+
+    def write_batch(self, records):
+        lines = [json.dumps(r.to_dict(self._labels, self._threshold)) for r in records]
+        self._file.write("\n".join(lines) + "\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class BinaryRecordWriter:
+    """
+    Compact binary records, little endian:
+      header: magic "TFLR", frame (uint32), timestamp (float64),
+              pts (int64, -1 if unknown), object count (uint16)
+      object: class index (uint16), score (float32),
+              x0, y0, x1, y1 (float32, 0 for classification)
+    """
+    MAGIC = b"TFLR"
+    HEADER = struct.Struct("<4sIdqH")
+    OBJECT = struct.Struct("<Hf4f")
+
+    def __init__(self, path, labels, threshold):
+        self._file = open(path, "ab")
+        self._labels = labels
+        self._threshold = threshold
+
+    def write_batch(self, records):
+        chunks = []
+        for r in records:
+            objects = r.objects(self._labels, self._threshold)
+            chunks.append(self.HEADER.pack(self.MAGIC, r.frame & 0xffffffff, r.timestamp,
+                                           r.pts, len(objects)))
+            for class_id, label, score, box in objects:
+                chunks.append(self.OBJECT.pack(class_id, score, *(box or (0, 0, 0, 0))))
+        self._file.write(b"".join(chunks))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class UnixSocketWriter:
+    """
+    Publish JSON lines on a local Unix stream socket, the records are lost
+    while no consumer is listening or while the consumer does not read them
+
+    The socket is non-blocking: the part of a batch the socket buffer cannot
+    take is kept, so that the lines stay complete, and the next batches are
+    dropped until it is sent.
+    """
+    def __init__(self, path, labels, threshold, topic="tflite/results"):
+        self._path = path
+        self._labels = labels
+        self._threshold = threshold
+        self._topic = topic
+        self._sock = None
+        self._backlog = b""
+        self.lost = 0
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self._path)
+        except OSError:
+            sock.close()
+            return None
+        sock.setblocking(False)
+        return sock
+
+    def _send(self, data):
+        """
+        :return: number of bytes the socket buffer took
+        """
+        try:
+            return self._sock.send(data)
+        except BlockingIOError:
+            return 0
+
+    def write_batch(self, records):
+        if self._sock is None:
+            self._sock = self._connect()
+            if self._sock is None:
+                self.lost += len(records)
+                return
+        try:
+            if self._backlog:
+                # end of the lines of a previous batch
+                self._backlog = self._backlog[self._send(self._backlog):]
+                if self._backlog:
+                    self.lost += len(records)
+                    return
+            lines = []
+            for r in records:
+                payload = r.to_dict(self._labels, self._threshold)
+                lines.append(json.dumps({"topic": self._topic, "payload": payload}))
+            data = ("\n".join(lines) + "\n").encode("utf-8")
+            self._backlog = data[self._send(data):]
+        except OSError:
+            self.lost += len(records)
+            self.close()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        self._backlog = b""
+
+class ResultExporter:
+    """
+    Class that streams the inference results to a writer from a background
+    thread
+
+    publish_* never block: when the writer cannot keep up, the oldest
+    pending records are dropped and counted.
+    """
+    # time in seconds close() waits for the pending records to be written
+    CLOSE_TIMEOUT = 2.0
+
+    def __init__(self, writer, max_pending=256, batch_size=32, flush_interval=0.5):
+        self._writer = writer
+        self._pending = deque(maxlen=max_pending)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._cond = threading.Condition()
+        self._running = True
+        self._frame = 0
+        self.published = 0
+        self.written = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="result-export", daemon=True)
+        self._thread.start()
+
+    def _publish(self, record):
+        with self._cond:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append(record)
+            self.published += 1
+            if len(self._pending) >= self._batch_size:
+                self._cond.notify()
+
+    def publish_detection(self, pts, locations, classes, scores, source=None):
+        """
+        :param locations: (N, 4) array of normalized y0, x0, y1, x1 locations
+        :param classes: (N,) array of class indexes
+        :param scores: (N,) array of scores
+        """
+        self._frame += 1
+        self._publish(ExportRecord(self._frame, pts, "detection", source,
+                                   np.array(classes), np.array(scores), np.array(locations)))
+
+    def publish_classification(self, pts, label_index, score, source=None):
+        self._frame += 1
+        self._publish(ExportRecord(self._frame, pts, "classification", source,
+                                   (int(label_index),), (float(score),)))
+
+    def _take_batch(self):
+        batch = []
+        while self._pending and len(batch) < self._batch_size:
+            batch.append(self._pending.popleft())
+        return batch
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            with self._cond:
+                if self._running and len(self._pending) < self._batch_size:
+                    self._cond.wait(self._flush_interval)
+                batch = self._take_batch()
+                running = self._running
+            if batch:
+                try:
+                    self._writer.write_batch(batch)
+                    self.written += len(batch)
+                except OSError as exc:
+                    print("result export error: ", exc)
+            now = time.monotonic()
+            if now - last_flush >= self._flush_interval or not running:
+                self._writer.flush()
+                last_flush = now
+            if not running and not self._pending:
+                break
+
+    def close(self):
+        """
+        write the pending records and stop the writer thread
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(self.CLOSE_TIMEOUT)
+        if self._thread.is_alive():
+            print("WARNING: result export still writing after {0} s, the pending records are lost".format(
+                  self.CLOSE_TIMEOUT))
+        self._writer.close()
+
+    def summary(self):
+        summary = "result export: {0} published, {1} written, {2} dropped".format(
+                  self.published, self.written, self.dropped)
+        lost = getattr(self._writer, "lost", 0)
+        if lost:
+            summary += ", {0} not received by the consumer".format(lost)
+        return summary
+
+def create_exporter(spec, labels, threshold):
+    """
+    :param spec: export destination, jsonl:<file>, bin:<file> or unix:<socket>[#topic]
+    :param labels: list of the model labels
+    :param threshold: minimal score of the exported objects
+    """
+    kind, sep, target = spec.partition(":")
+    if not sep or not target:
+        raise ValueError("invalid export destination: " + spec)
+    if kind == "jsonl":
+        writer = JsonLinesWriter(target, labels, threshold)
+    elif kind == "bin":
+        writer = BinaryRecordWriter(target, labels, threshold)
+    elif kind == "unix":
+        path, sep, topic = target.partition("#")
+        if topic:
+            writer = UnixSocketWriter(path, labels, threshold, topic)
+        else:
+            writer = UnixSocketWriter(path, labels, threshold)
+    else:
+        raise ValueError("unknown export format: " + kind)
+    return ResultExporter(writer)
@@ -0,0 +1,124 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Hand-off of the inference results from the streaming thread to the GTK
+thread
+
+The streaming thread publishes one immutable snapshot per inference, the
+GTK thread acquires the last one. Publishing a snapshot is a single
+reference assignment, atomic in CPython, so neither side ever waits for
+the other nor sees a partially written result.
+"""
+
+from timeit import default_timer as timer
+
+import numpy as np
+
+class ResultSnapshot:
+    """
+    Immutable inference result of a frame
+    """
+    __slots__ = ("seq", "results", "pts", "inference_time", "capture_time", "publish_time")
+
+    def __init__(self, seq, results, pts, inference_time, capture_time, publish_time):
+        """
+        :param seq: sequence number of the snapshot, starting from 1
+        :param results: tuple of the post-processed results, the arrays are
+                        read-only copies
+        :param pts: presentation timestamp of the inferred frame, -1 if unknown
+        :param inference_time: inference time in seconds
+        :param capture_time: timer() when the frame was pulled from the
+                             pipeline
+        :param publish_time: timer() when the result was published
+        """
+        object.__setattr__(self, "seq", seq)
+        object.__setattr__(self, "results", results)
+        object.__setattr__(self, "pts", pts)
+        object.__setattr__(self, "inference_time", inference_time)
+        object.__setattr__(self, "capture_time", capture_time)
+        object.__setattr__(self, "publish_time", publish_time)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ResultSnapshot is immutable")
+
+    def latency(self, now=None):
+        """
+        :return: time in seconds since the capture of the frame
+        """
+        if now is None:
+            now = timer()
+        return now - self.capture_time
+
+def _freeze(result):
+    if isinstance(result, np.ndarray):
+        result = np.array(result)
+        result.setflags(write=False)
+    return result
+
+class ResultHandoff:
+    """
+    Latest inference result shared between one publisher thread and one
+    consumer thread
+
+    publish() returns True when the consumer has to be notified, that is
+    when no notification is pending, so that a slow consumer receives one
+    notification for several publications and only handles the last one.
+    """
+    def __init__(self):
+        self._snapshot = None
+        self._seq = 0
+        self._pending = False
+        # statistics
+        self.published = 0
+        self.acquired = 0
+        self.unchanged = 0
+
+    def publish(self, results, pts, inference_time, capture_time=None):
+        """
+        publish the results of an inference, called by the publisher thread
+        :return: True if the consumer has to be notified
+        """
+        now = timer()
+        self._seq += 1
+        self._snapshot = ResultSnapshot(self._seq, tuple(_freeze(r) for r in results), pts,
+                                        inference_time,
+                                        now if capture_time is None else capture_time, now)
+        self.published += 1
+        # the snapshot is stored before the pending flag is tested, a
+        # consumer clearing the flag afterwards reads this snapshot
+        if self._pending:
+            return False
+        self._pending = True
+        return True
+
+    def acquire(self, last_seq=0):
+        """
+        called by the consumer thread
+        :param last_seq: sequence number of the snapshot already handled
+        :return: the last published snapshot, None if there is none newer
+                 than last_seq
+        """
+        self._pending = False
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.seq == last_seq:
+            self.unchanged += 1
+            return None
+        self.acquired += 1
+        return snapshot
+
+    def latest(self):
+        """
+        :return: the last published snapshot, None before the first one
+        """
+        return self._snapshot
+
+    def summary(self):
+        return "result hand-off: {0} results published, {1} displayed, {2} unchanged".format(
+               self.published, self.acquired, self.unchanged)
@@ -0,0 +1,97 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Gating of the inferences on the changes of the scene
+
+A fixed camera mostly films a static scene, the results of the previous
+inference are still valid as long as the frame does not change. Each frame
+is reduced to a small grid of block intensities computed on a subsampled
+frame, the inference runs when the mean difference with the grid of the
+last inferred frame exceeds a threshold, or when the last inference is
+older than the refresh period.
+"""
+
+import numpy as np
+
+def frame_signature(frame, grid=16, samples=4):
+    """
+    :param frame: (height, width[, channels]) uint8 array
+    :param grid: number of blocks of the signature per dimension
+    :param samples: number of samples per block and per dimension
+    :return: (grid, grid) float32 array of the mean intensity of the blocks
+    """
+    height, width = frame.shape[:2]
+    grid = max(1, min(grid, height, width))
+    step_y = max(1, height // (grid * samples))
+    step_x = max(1, width // (grid * samples))
+    sub = frame[::step_y, ::step_x]
+    rows = (sub.shape[0] // grid) * grid
+    cols = (sub.shape[1] // grid) * grid
+    blocks = sub[:rows, :cols].reshape(grid, rows // grid, grid, cols // grid, -1)
+    return blocks.mean(axis=(1, 3, 4), dtype=np.float32)
+
+class SceneGate:
+    """
+    Class that decides whether a frame has to be inferred or whether the
+    results of the previous inference can be reused
+    """
+    def __init__(self, threshold, refresh_period, grid=16):
+        """
+        :param threshold: mean difference of the block intensities, between 0
+                          and 1, above which the frame is inferred
+        :param refresh_period: maximal age in seconds of the reused results
+        :param grid: number of blocks of the signature per dimension
+        """
+        self.threshold = threshold
+        self.refresh_period = refresh_period
+        self.grid = grid
+        self._reference = None
+        self._reference_time = 0.0
+        self.last_change = 0.0
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def should_infer(self, frame, now):
+        """
+        :param now: timer() of the frame capture
+        :return: True if the frame has to be inferred, False if the previous
+                 results are still valid
+        """
+        signature = frame_signature(frame, self.grid)
+        if self._reference is None or self._reference.shape != signature.shape:
+            change = 1.0
+        else :
+            change = float(np.mean(np.abs(signature - self._reference))) / 255
+        self.last_change = change
+        if change < self.threshold:
+            if now - self._reference_time < self.refresh_period:
+                self.hits += 1
+                return False
+            self.refreshes += 1
+        self.misses += 1
+        # the next frames are compared to the inferred one, a slow drift of
+        # the scene eventually triggers an inference
+        self._reference = signature
+        self._reference_time = now
+        return True
+
+    def hit_rate(self):
+        """
+        :return: ratio of the frames whose inference was skipped
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self):
+        return ("scene gate: {0} frames skipped, {1} inferred ({2} forced refreshes), "
+                "hit rate {3:.0f}%").format(self.hits, self.misses, self.refreshes,
+                                            self.hit_rate() * 100)
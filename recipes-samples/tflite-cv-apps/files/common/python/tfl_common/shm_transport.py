@@ -0,0 +1,281 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+import os
+import pickle
+import subprocess
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+from timeit import default_timer as timer
+
+import numpy as np
+
+def attach_shared_memory(name):
+    """
+    attach a shared memory segment created by another process, which stays
+    in charge of unlinking it
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13: the resource tracker of this process would unlink
+        # the segment when it exits
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+class SharedRing:
+    """
+    Ring of slots stored in a shared memory segment
+
+    Each slot holds one record made of several numpy fields. The header of
+    the segment contains the sequence number of the last written record
+    followed by the sequence number of the record stored in each slot. A
+    writer clears the slot sequence number before overwriting the slot and
+    sets it once the record is complete, so that a reader can detect a
+    record that was overwritten while it was copying it.
+    """
+    def __init__(self, name, fields, slots, create=False):
+        """
+        :param name: name of the shared memory segment
+        :param fields: list of (shape, dtype) of the fields of a record
+        :param slots: number of records kept in the ring
+        :param create: True in the process owning the segment
+        """
+        self.fields = [(tuple(shape), np.dtype(dtype)) for shape, dtype in fields]
+        self.slots = slots
+        self._owner = create
+
+        header_size = 8 * (1 + slots)
+        record_size = 0
+        offsets = []
+        for shape, dtype in self.fields:
+            offsets.append(record_size)
+            size = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            record_size += (size + 7) & ~7
+        self._record_size = record_size
+        total_size = header_size + record_size * slots
+
+        if create:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=total_size)
+        else:
+            self._shm = attach_shared_memory(name)
+        self.name = self._shm.name
+
+        buf = self._shm.buf
+        self._header = np.ndarray((1 + slots,), dtype=np.uint64, buffer=buf)
+        self._records = []
+        for slot in range(slots):
+            base = header_size + slot * record_size
+            record = []
+            for (shape, dtype), offset in zip(self.fields, offsets):
+                record.append(np.ndarray(shape, dtype=dtype, buffer=buf, offset=base + offset))
+            self._records.append(record)
+        if create:
+            self._header[:] = 0
+
+    def latest_seq(self):
+        """
+        :return: sequence number of the last written record, 0 if none
+        """
+        return int(self._header[0])
+
+    def write(self, *values):
+        """
+        write a new record in the ring
+        :return: the sequence number of the record
+        """
+        seq = self.latest_seq() + 1
+        slot = seq % self.slots
+        self._header[1 + slot] = 0
+        for field, value in zip(self._records[slot], values):
+            field[...] = value
+        self._header[1 + slot] = seq
+        self._header[0] = seq
+        return seq
+
+    def read(self, seq=None):
+        """
+        copy a record out of the ring
+        :param seq: sequence number of the record, the last one by default
+        :return: (seq, list of field copies) or None if the record is not
+                 available anymore
+        """
+        if seq is None:
+            seq = self.latest_seq()
+        if seq == 0:
+            return None
+        slot = seq % self.slots
+        if int(self._header[1 + slot]) != seq:
+            return None
+        values = [np.copy(field) for field in self._records[slot]]
+        # the writer may have reused the slot during the copy
+        if int(self._header[1 + slot]) != seq:
+            return None
+        return seq, values
+
+    def close(self):
+        self._header = None
+        self._records = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+class FrameRing(SharedRing):
+    """
+    Ring of video frames, each frame is stored with its timestamp
+    """
+    def __init__(self, name, frame_shape, slots=3, create=False):
+        super().__init__(name, [(frame_shape, np.uint8), ((1,), np.int64)], slots, create)
+
+    def write_frame(self, frame, pts):
+        return self.write(frame, pts)
+
+    def read_frame(self, seq=None):
+        """
+        :return: (seq, frame, pts) or None
+        """
+        record = self.read(seq)
+        if record is None:
+            return None
+        seq, (frame, pts) = record
+        return seq, frame, int(pts[0])
+
+class ResultRing(SharedRing):
+    """
+    Ring of inference results, each result is stored with the sequence
+    number and the timestamp of the frame it was computed on, and the
+    inference time
+    """
+    def __init__(self, name, output_specs, slots=3, create=False):
+        """
+        :param output_specs: list of (shape, dtype) of the model outputs
+        """
+        super().__init__(name, list(output_specs) + [((3,), np.float64)], slots, create)
+
+    def write_result(self, outputs, frame_seq, pts, inference_time):
+        return self.write(*outputs, (frame_seq, pts, inference_time))
+
+    def read_result(self, seq=None):
+        """
+        :return: (seq, outputs, frame_seq, pts, inference_time) or None
+        """
+        record = self.read(seq)
+        if record is None:
+            return None
+        seq, values = record
+        frame_seq, pts, inference_time = values[-1]
+        return seq, values[:-1], int(frame_seq), int(pts), float(inference_time)
+
+def output_specs(nn):
+    """
+    :return: the (shape, dtype) list of the results returned by nn.get_results()
+    """
+    return [(np.shape(value), np.asarray(value).dtype) for value in nn.get_results()]
+
+def inference_worker(nn, frame_ring_name, frame_shape, result_ring_name, specs,
+                     slots, stop_event, parent_pid, poll_period):
+    """
+    Main function of the inference process: infer the last frame written
+    in the frame ring and publish the results in the result ring
+    :param stop_event: threading.Event set when the process must stop
+    """
+    frames = FrameRing(frame_ring_name, frame_shape, slots)
+    results = ResultRing(result_ring_name, specs, slots)
+    last_seq = 0
+    # the interpreter of this process has never run
+    nn.warm_up()
+    try:
+        while not stop_event.is_set() and os.getppid() == parent_pid:
+            seq = frames.latest_seq()
+            if seq == last_seq:
+                time.sleep(poll_period)
+                continue
+            record = frames.read_frame(seq)
+            if record is None:
+                continue
+            last_seq, frame, pts = record
+            start_time = timer()
+            nn.launch_inference(frame)
+            stop_time = timer()
+            results.write_result(nn.get_results(), last_seq, pts, stop_time - start_time)
+    finally:
+        frames.close()
+        results.close()
+
+class InferenceProcess:
+    """
+    Class that runs a NeuralNetwork in a separate process
+
+    The process runs the tfl_common.inference_worker module, the
+    NeuralNetwork object is pickled to it with its __getstate__/__setstate__
+    methods, which rebuild the interpreter on the other side. Frames and
+    results are exchanged through shared memory rings, only the last frame
+    is inferred.
+    """
+    def __init__(self, nn, frame_shape, slots=3, poll_period=0.002):
+        specs = output_specs(nn)
+        prefix = "tfl_{0}".format(os.getpid())
+        self.frames = FrameRing(prefix + "_frames", frame_shape, slots, create=True)
+        self.results = ResultRing(prefix + "_results", specs, slots, create=True)
+        self._last_result = 0
+        self._worker_args = {"nn": nn, "frame_ring_name": self.frames.name,
+                             "frame_shape": frame_shape,
+                             "result_ring_name": self.results.name, "specs": specs,
+                             "slots": slots, "parent_pid": os.getpid(),
+                             "poll_period": poll_period}
+        self._process = None
+
+    def start(self):
+        # a fresh interpreter process is started rather than forking the
+        # GTK / GStreamer threads of this one, from a module which does not
+        # import them
+        env = dict(os.environ)
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env["PYTHONPATH"] = os.pathsep.join(path for path in (package_root, env.get("PYTHONPATH")) if path)
+        self._process = subprocess.Popen([sys.executable, "-m", "tfl_common.inference_worker"],
+                                         stdin=subprocess.PIPE, env=env)
+        pickle.dump(self._worker_args, self._process.stdin)
+        self._process.stdin.flush()
+        self._worker_args = None
+
+    def push_frame(self, frame, pts):
+        """
+        hand a frame to the inference process
+        """
+        return self.frames.write_frame(frame, pts)
+
+    def poll_result(self):
+        """
+        :return: the result newer than the last one returned, or None
+        """
+        seq = self.results.latest_seq()
+        if seq == self._last_result:
+            return None
+        record = self.results.read_result(seq)
+        if record is not None:
+            self._last_result = seq
+        return record
+
+    def stop(self):
+        if self._process is not None:
+            try:
+                # end of file of the standard input of the process
+                self._process.stdin.close()
+            except OSError:
+                pass
+            try:
+                self._process.wait(1)
+            except subprocess.TimeoutExpired:
+                self._process.terminate()
+                self._process.wait()
+            self._process = None
+        self.frames.close()
+        self.results.close()
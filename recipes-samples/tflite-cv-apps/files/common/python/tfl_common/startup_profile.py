@@ -0,0 +1,185 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Startup time profile of the applications
+
+This module is imported before any heavy module, it only depends on the
+standard library.
+"""
+
+import builtins
+import importlib.util
+import os
+import sys
+import threading
+import time
+
+def process_age(proc_root="/proc"):
+    """
+    :return: time in seconds since the start of the process, None if unknown
+    """
+    try:
+        with open(os.path.join(proc_root, "uptime"), "r") as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        with open(os.path.join(proc_root, "self", "stat"), "r") as stat_file:
+            # the command name may contain spaces, the fields after it are
+            # numbered from the closing parenthesis, starttime is field 22
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        start_time = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+    return uptime - start_time
+
+class StartupProfile:
+    """
+    Class that records the duration of the startup phases of an application
+    (python interpreter startup, arguments parsing, imports, model loading,
+    UI creation, first frame) and optionally the time spent importing each
+    module, reported in the format of python -X importtime
+    """
+    def __init__(self):
+        self._start = time.perf_counter()
+        # the python interpreter startup is measured from the process start
+        self._offset = process_age() or 0.0
+        self.phases = [("interpreter startup", self._offset)]
+        self.imports = []
+        self._local = threading.local()
+        self._original_import = None
+        self._original_import_module = None
+        self._reported = False
+
+    def elapsed(self):
+        """
+        :return: time in seconds since the start of the process
+        """
+        return self._offset + time.perf_counter() - self._start
+
+    def mark(self, phase):
+        """
+        record the end of a startup phase
+        """
+        self.phases.append((phase, self.elapsed()))
+
+    def trace_imports(self):
+        """
+        time the modules imported from now on, by import statements and by
+        importlib.import_module (memory_stats.LazyModule)
+        """
+        if self._original_import is not None:
+            return
+        self._original_import = builtins.__import__
+        self._original_import_module = importlib.import_module
+        builtins.__import__ = self._timed_import
+        importlib.import_module = self._timed_import_module
+
+    def stop_tracing_imports(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            importlib.import_module = self._original_import_module
+            self._original_import = None
+            self._original_import_module = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original_import
+        if original is None:
+            # tracing stopped
+            return builtins.__import__(name, globals, locals, fromlist, level)
+        target = self._import_target(name, globals, fromlist, level)
+        if target is None:
+            return original(name, globals, locals, fromlist, level)
+        return self._timed(target, original, name, globals, locals, fromlist, level)
+
+    def _timed_import_module(self, name, package=None):
+        original = self._original_import_module
+        if original is None:
+            # tracing stopped
+            return importlib.import_module(name, package)
+        target = name
+        if name.startswith("."):
+            try:
+                target = importlib.util.resolve_name(name, package)
+            except (ImportError, ValueError):
+                return original(name, package)
+        if target in sys.modules:
+            return original(name, package)
+        return self._timed(target, original, name, package)
+
+    def _timed(self, target, function, *args):
+        """
+        call an import function and record the time spent importing target,
+        the imports it triggers are recorded as its children
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        # children time of the module being imported
+        stack.append(0.0)
+        depth = len(stack)
+        index = len(self.imports)
+        self.imports.append(None)
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            cumulative = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            # the record is placed before the modules it imported
+            self.imports[index] = (target, cumulative - children, cumulative, depth)
+
+    def _import_target(self, name, globals, fromlist, level):
+        """
+        :return: name of the modules an import statement loads, None if they
+                 are all loaded already
+        """
+        if level != 0:
+            # relative import
+            globals = globals or {}
+            package = globals.get("__package__") or globals.get("__name__", "").rpartition(".")[0]
+            try:
+                name = importlib.util.resolve_name("." * level + name, package)
+            except (ImportError, ValueError):
+                return None
+        module = sys.modules.get(name)
+        if module is None:
+            return name
+        # "from package import submodule" of a loaded package, for instance
+        # the typelibs of gi.repository
+        missing = [item for item in fromlist or ()
+                   if item != "*" and not hasattr(module, item) and name + "." + item not in sys.modules]
+        if not missing:
+            return None
+        return ", ".join(name + "." + item for item in missing)
+
+    def report(self, min_import_time=0.001):
+        """
+        :param min_import_time: imports faster than this are not reported
+        :return: text report of the startup phases and of the imports
+        """
+        self._reported = True
+        lines = ["startup profile:"]
+        previous = 0.0
+        for phase, end in self.phases:
+            lines.append("  {0:24} {1:8.3f} s (+{2:.3f} s)".format(phase, end, end - previous))
+            previous = end
+        imports = [record for record in self.imports if record is not None]
+        if imports:
+            lines.append("import time: self [us] | cumulative | imported package")
+            for name, self_time, cumulative, depth in imports:
+                if cumulative < min_import_time:
+                    continue
+                lines.append("import time: {0:9d} | {1:10d} | {2}{3}".format(
+                             int(self_time * 1e6), int(cumulative * 1e6),
+                             "  " * (depth - 1), name))
+        return "\n".join(lines)
+
+    def is_reported(self):
+        return self._reported
@@ -0,0 +1,234 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Thermal and CPU frequency telemetry correlated with the inference latency
+
+A background thread samples the temperature of the thermal zones, the
+current frequency of the cpus and the CPU load. Each inference latency is
+aligned with the last sample preceding it, so that the report tells a
+regression of the model from a throttled SoC. The sysfs and proc roots are
+parameters, a directory tree mimicking them can replace the real ones.
+"""
+
+import bisect
+import glob
+import json
+import os
+import threading
+from collections import deque
+from timeit import default_timer as timer
+
+from tfl_common.rate_controller import CpuLoadMonitor
+
+def _read_int(path):
+    try:
+        with open(path, "r") as value_file:
+            return int(value_file.read().strip())
+    except (OSError, ValueError):
+        return None
+
+class TelemetrySample:
+    """
+    State of the SoC at a given time
+    """
+    __slots__ = ("time", "temperatures", "frequencies", "cpu_load")
+
+    def __init__(self, time, temperatures, frequencies, cpu_load):
+        """
+        :param time: timer() of the sample
+        :param temperatures: temperatures in degrees Celsius of the thermal
+                             zones, None for an unreadable zone
+        :param frequencies: current frequencies in MHz of the cpus, None for
+                            an unreadable cpu
+        :param cpu_load: CPU load between 0 and 1 since the previous sample,
+                         None if unknown
+        """
+        self.time = time
+        self.temperatures = temperatures
+        self.frequencies = frequencies
+        self.cpu_load = cpu_load
+
+    def to_dict(self):
+        return {"time": self.time, "temperatures": self.temperatures,
+                "frequencies": self.frequencies, "cpu_load": self.cpu_load}
+
+class TelemetrySampler:
+    """
+    Class that samples the telemetry on a background timer and records the
+    inference latencies
+    """
+    def __init__(self, interval=1.0, sys_root="/sys", proc_root="/proc",
+                 max_samples=3600, max_records=100000):
+        """
+        :param interval: sampling period in seconds
+        :param max_samples: number of samples kept, the oldest are dropped
+        :param max_records: number of inference latencies kept
+        """
+        self.interval = interval
+        self.zones = []
+        for zone in sorted(glob.glob(os.path.join(sys_root, "class", "thermal", "thermal_zone*"))):
+            try:
+                with open(os.path.join(zone, "type"), "r") as type_file:
+                    zone_type = type_file.read().strip()
+            except OSError:
+                zone_type = "?"
+            self.zones.append((os.path.basename(zone), zone_type, os.path.join(zone, "temp")))
+        self.cpus = []
+        for cpufreq in sorted(glob.glob(os.path.join(sys_root, "devices", "system", "cpu", "cpu[0-9]*", "cpufreq"))):
+            max_freq = _read_int(os.path.join(cpufreq, "cpuinfo_max_freq"))
+            self.cpus.append((os.path.basename(os.path.dirname(cpufreq)),
+                              max_freq / 1000 if max_freq is not None else None,
+                              os.path.join(cpufreq, "scaling_cur_freq")))
+        self.cpu_monitor = CpuLoadMonitor(proc_root)
+        self._samples = deque(maxlen=max_samples)
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self, now=None):
+        """
+        read the telemetry, called by the sampling thread
+        :return: TelemetrySample object
+        """
+        temperatures = []
+        for name, zone_type, path in self.zones:
+            # millidegrees Celsius
+            value = _read_int(path)
+            temperatures.append(value / 1000 if value is not None else None)
+        frequencies = []
+        for name, max_freq, path in self.cpus:
+            # kHz
+            value = _read_int(path)
+            frequencies.append(value / 1000 if value is not None else None)
+        sample = TelemetrySample(timer() if now is None else now, tuple(temperatures),
+                                 tuple(frequencies), self.cpu_monitor.sample())
+        with self._lock:
+            self._samples.append(sample)
+        return sample
+
+    def latest(self):
+        """
+        :return: last TelemetrySample, None before the first one
+        """
+        with self._lock:
+            return self._samples[-1] if self._samples else None
+
+    def record_inference(self, latency, now=None):
+        """
+        record the latency in seconds of an inference ending now
+        """
+        with self._lock:
+            self._records.append((timer() if now is None else now, latency))
+
+    def start(self):
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def align(self):
+        """
+        :return: list of (time, latency, sample) of the recorded inferences,
+                 sample being the last one preceding the inference, or the
+                 first one for the inferences preceding all the samples
+        """
+        with self._lock:
+            samples = list(self._samples)
+            records = list(self._records)
+        if not samples:
+            return []
+        times = [sample.time for sample in samples]
+        aligned = []
+        for time, latency in records:
+            idx = max(0, bisect.bisect_right(times, time) - 1)
+            aligned.append((time, latency, samples[idx]))
+        return aligned
+
+    def report(self):
+        """
+        :return: human readable report of the telemetry and of the inference
+                 latency by cpu frequency and by temperature
+        """
+        with self._lock:
+            samples = list(self._samples)
+            record_count = len(self._records)
+        lines = ["telemetry: {0} samples every {1:.1f} s, {2} inferences".format(
+                 len(samples), self.interval, record_count)]
+        for idx, (name, zone_type, path) in enumerate(self.zones):
+            values = [s.temperatures[idx] for s in samples if s.temperatures[idx] is not None]
+            if values:
+                lines.append("  {0} ({1}): avg {2:.1f} C, max {3:.1f} C".format(
+                             name, zone_type, sum(values) / len(values), max(values)))
+        for idx, (name, max_freq, path) in enumerate(self.cpus):
+            values = [s.frequencies[idx] for s in samples if s.frequencies[idx] is not None]
+            if values:
+                line = "  {0} frequency: avg {1:.0f} MHz, min {2:.0f} MHz".format(
+                       name, sum(values) / len(values), min(values))
+                if max_freq is not None:
+                    throttled = sum(1 for value in values if value < max_freq)
+                    line += ", below the {0:.0f} MHz maximum in {1:.0f}% of the samples".format(
+                            max_freq, throttled * 100 / len(values))
+                lines.append(line)
+        loads = [s.cpu_load for s in samples if s.cpu_load is not None]
+        if loads:
+            lines.append("  cpu load: avg {0:.0f}%, max {1:.0f}%".format(
+                         sum(loads) * 100 / len(loads), max(loads) * 100))
+        aligned = self.align()
+        if self.cpus:
+            lines.extend(self._latency_by(aligned, "  latency by {0} frequency:".format(self.cpus[0][0]),
+                                          lambda s: s.frequencies[0], "{0:.0f} MHz"))
+        if self.zones:
+            # 5 degrees buckets
+            lines.extend(self._latency_by(aligned, "  latency by {0} temperature:".format(self.zones[0][0]),
+                                          lambda s: None if s.temperatures[0] is None
+                                                    else int(s.temperatures[0] // 5) * 5,
+                                          "{0}-{1} C", 5))
+        return "\n".join(lines)
+
+    def _latency_by(self, aligned, title, key, label, width=None):
+        groups = {}
+        for time, latency, sample in aligned:
+            value = key(sample)
+            if value is not None:
+                groups.setdefault(value, []).append(latency)
+        if not groups:
+            return []
+        lines = [title]
+        for value in sorted(groups):
+            latencies = groups[value]
+            text = label.format(value, value + width) if width is not None else label.format(value)
+            lines.append("    {0:12} avg {1:8.2f} ms  max {2:8.2f} ms  ({3} inferences)".format(
+                         text, sum(latencies) * 1000 / len(latencies), max(latencies) * 1000,
+                         len(latencies)))
+        return lines
+
+    def save(self, path):
+        """
+        store the samples and the aligned inference latencies in a json file
+        """
+        with self._lock:
+            samples = [sample.to_dict() for sample in self._samples]
+        data = {"zones": [[name, zone_type] for name, zone_type, _ in self.zones],
+                "cpus": [[name, max_freq] for name, max_freq, _ in self.cpus],
+                "samples": samples,
+                "inferences": [{"time": time, "latency": latency, "sample_time": sample.time}
+                               for time, latency, sample in self.align()]}
+        with open(path, "w") as output_file:
+            json.dump(data, output_file)
@@ -0,0 +1,230 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+"""
+Placement of the threads of the application on configurable core sets
+
+The threads have one of three roles:
+ - inference: the thread calling the interpreter and the worker threads of
+   the interpreter
+ - streaming: the GStreamer streaming threads
+ - ui: the GTK main loop
+
+A placement is given as ROLE:CPUS[:nice=N|fifo=P], for instance
+"inference:0-1", "streaming:1:fifo=10" or "ui::nice=5". Each thread places
+itself when it starts (GTK main thread, GStreamer stream-status messages),
+the interpreter worker threads, which the interpreter creates without name,
+are placed once they exist. The report gives the achieved placement and the
+context switches of each thread read from /proc.
+"""
+
+import os
+import threading
+
+ROLES = ("inference", "streaming", "ui")
+
+def parse_cpus(text):
+    """
+    :param text: list of cpus and cpu ranges, for instance "0-1,3"
+    :return: set of cpu numbers
+    """
+    cpus = set()
+    for part in text.split(","):
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else :
+            cpus.add(int(part))
+    return cpus
+
+def format_cpus(cpus):
+    """
+    :return: "0-1,3" text of a set of cpu numbers
+    """
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else :
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else "{0}-{1}".format(a, b) for a, b in ranges)
+
+class Placement:
+    """
+    Core set and priority of the threads of a role
+    """
+    def __init__(self, cpus=None, nice=None, fifo=None):
+        """
+        :param cpus: set of cpus, None to keep the inherited affinity
+        :param nice: nice value, None to keep the inherited one
+        :param fifo: SCHED_FIFO priority, None for the normal policy
+        """
+        self.cpus = cpus
+        self.nice = nice
+        self.fifo = fifo
+
+    def describe(self):
+        text = "cpus " + (format_cpus(self.cpus) if self.cpus else "inherited")
+        if self.fifo is not None:
+            text += ", SCHED_FIFO {0}".format(self.fifo)
+        if self.nice is not None:
+            text += ", nice {0}".format(self.nice)
+        return text
+
+def parse_placements(specs):
+    """
+    :param specs: list of ROLE:CPUS[:nice=N|fifo=P] texts
+    :return: dictionary of the Placement objects by role
+    """
+    placements = {}
+    for spec in specs:
+        fields = spec.split(":")
+        if len(fields) not in (2, 3) or fields[0] not in ROLES:
+            raise ValueError("invalid thread placement " + spec + ", expected ROLE:CPUS[:nice=N|fifo=P] "
+                             "with ROLE in " + ", ".join(ROLES))
+        placement = Placement(parse_cpus(fields[1]) if fields[1] else None)
+        if len(fields) == 3:
+            policy, _, value = fields[2].partition("=")
+            if policy == "nice":
+                placement.nice = int(value)
+            elif policy == "fifo":
+                placement.fifo = int(value)
+            else :
+                raise ValueError("invalid thread priority " + fields[2] + ", expected nice=N or fifo=P")
+        placements[fields[0]] = placement
+    return placements
+
+def list_threads(proc_root="/proc/self"):
+    """
+    :return: set of the thread ids of the process
+    """
+    try:
+        return set(int(tid) for tid in os.listdir(os.path.join(proc_root, "task")))
+    except OSError:
+        return set()
+
+def read_thread_status(tid, proc_root="/proc/self"):
+    """
+    :return: dictionary of the fields of /proc/self/task/<tid>/status, empty
+             if the thread does not exist anymore
+    """
+    status = {}
+    try:
+        with open(os.path.join(proc_root, "task", str(tid), "status"), "r") as status_file:
+            for line in status_file:
+                key, _, value = line.partition(":")
+                status[key] = value.strip()
+    except OSError:
+        pass
+    return status
+
+class ThreadPlacement:
+    """
+    Class that applies the placements to the threads and reports the
+    achieved placement
+    """
+    def __init__(self, placements, proc_root="/proc/self"):
+        """
+        :param placements: dictionary of the Placement objects by role
+        """
+        self.placements = placements
+        self.proc_root = proc_root
+        self._lock = threading.Lock()
+        # role and placement errors of the threads, by thread id
+        self._threads = {}
+        # threads existing before the interpreter, never placed as workers
+        self._known = list_threads(proc_root)
+        self._process_name = read_thread_status(os.getpid(), proc_root).get("Name")
+
+    def place_current(self, role):
+        """
+        place the calling thread
+        """
+        self.place(threading.get_native_id(), role)
+
+    def place(self, tid, role):
+        errors = []
+        placement = self.placements.get(role)
+        if placement is not None:
+            if placement.cpus:
+                try:
+                    os.sched_setaffinity(tid, placement.cpus)
+                except OSError as error:
+                    errors.append("affinity: " + str(error))
+            if placement.fifo is not None:
+                try:
+                    os.sched_setscheduler(tid, os.SCHED_FIFO, os.sched_param(placement.fifo))
+                except OSError as error:
+                    errors.append("SCHED_FIFO: " + str(error))
+            if placement.nice is not None:
+                try:
+                    os.setpriority(os.PRIO_PROCESS, tid, placement.nice)
+                except OSError as error:
+                    errors.append("nice: " + str(error))
+        with self._lock:
+            self._threads[tid] = (role, errors)
+        for error in errors:
+            print("WARNING: " + role + " thread " + str(tid) + " not placed, " + error)
+
+    def place_new_threads(self, role):
+        """
+        place the unnamed threads created since the creation of the object
+        which are not placed yet, the worker threads of the interpreter
+        :return: number of threads placed
+        """
+        python_threads = set(thread.native_id for thread in threading.enumerate())
+        with self._lock:
+            candidates = list_threads(self.proc_root) - self._known - set(self._threads) - python_threads
+        count = 0
+        for tid in sorted(candidates):
+            # the threads of GLib and GStreamer are named, the workers of the
+            # interpreter keep the name of the process
+            if read_thread_status(tid, self.proc_root).get("Name") == self._process_name:
+                self.place(tid, role)
+                count += 1
+        return count
+
+    def report(self):
+        """
+        :return: achieved placement and context switches of the placed
+                 threads
+        """
+        lines = ["thread placement:"]
+        for role in ROLES:
+            if role in self.placements:
+                lines.append("  {0:10} requested {1}".format(role, self.placements[role].describe()))
+        with self._lock:
+            threads = sorted(self._threads.items(), key=lambda item: (ROLES.index(item[1][0]), item[0]))
+        totals = {}
+        for tid, (role, errors) in threads:
+            status = read_thread_status(tid, self.proc_root)
+            if not status:
+                lines.append("  {0:10} {1:6} exited".format(role, tid))
+                continue
+            try:
+                cpus = format_cpus(os.sched_getaffinity(tid))
+                policy = "fifo" if os.sched_getscheduler(tid) == os.SCHED_FIFO else "other"
+                nice = os.getpriority(os.PRIO_PROCESS, tid)
+            except OSError:
+                lines.append("  {0:10} {1:6} exited".format(role, tid))
+                continue
+            voluntary = int(status.get("voluntary_ctxt_switches", 0))
+            involuntary = int(status.get("nonvoluntary_ctxt_switches", 0))
+            total = totals.setdefault(role, [0, 0])
+            total[0] += voluntary
+            total[1] += involuntary
+            lines.append("  {0:10} {1:6} {2:16} cpus {3:8} {4:5} nice {5:3}  ctx switches {6} voluntary, "
+                         "{7} involuntary{8}".format(role, tid, status.get("Name", "?"), cpus, policy, nice,
+                                                     voluntary, involuntary,
+                                                     "  (" + "; ".join(errors) + ")" if errors else ""))
+        for role in ROLES:
+            if role in totals:
+                lines.append("  {0:10} total ctx switches {1} voluntary, {2} involuntary".format(
+                             role, totals[role][0], totals[role][1]))
+        return "\n".join(lines)
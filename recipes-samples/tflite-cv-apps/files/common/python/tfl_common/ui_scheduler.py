@@ -0,0 +1,81 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+from gi.repository import GLib
+
+class LabelUpdateScheduler:
+    """
+    Class that refreshes the Gtk labels of the UI at a fixed rate
+
+    Inference results are submitted as raw values, only the last submitted
+    values are formatted and applied on each refresh tick. The markup of a
+    label is set only when its rendered value changed, since each
+    set_markup triggers a relayout of the widget.
+    """
+    def __init__(self, render, rate):
+        """
+        :param render: callable formatting the submitted values into a list
+                       of (Gtk.Label, markup) tuples
+        :param rate: refresh rate in Hz, 0 to refresh on every submission
+        """
+        self._render = render
+        self._rate = rate
+        self._pending = None
+        self._markups = {}
+        self._source_id = None
+        # statistics
+        self.submitted = 0
+        self.coalesced = 0
+        self.refreshed = 0
+        self.unchanged = 0
+
+    def start(self):
+        if self._rate > 0 and self._source_id is None:
+            self._source_id = GLib.timeout_add(int(1000 / self._rate), self._on_timeout)
+
+    def stop(self):
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+
+    def submit(self, *values):
+        """
+        store the values to display, they replace any values not yet displayed
+        """
+        self.submitted += 1
+        if self._pending is not None:
+            self.coalesced += 1
+        self._pending = values
+        if self._rate <= 0:
+            self.flush()
+
+    def flush(self):
+        """
+        apply the pending values to the labels
+        """
+        if self._pending is None:
+            return
+        values = self._pending
+        self._pending = None
+        for label, markup in self._render(*values):
+            if self._markups.get(label) == markup:
+                self.unchanged += 1
+                continue
+            self._markups[label] = markup
+            label.set_markup(markup)
+            self.refreshed += 1
+
+    def _on_timeout(self):
+        self.flush()
+        return True
+
+    def summary(self):
+        return ("label updates: {0} submitted, {1} coalesced, {2} markups set, "
+                "{3} unchanged markups skipped").format(self.submitted, self.coalesced,
+                                                       self.refreshed, self.unchanged)
@@ -0,0 +1,557 @@
+#
+# Copyright (c) 2022 STMicroelectronics. All rights reserved.
+#
+# This software component is licensed by ST under BSD 3-Clause license,
+# the "License"; You may not use this file except in compliance with the
+# License. You may obtain a copy of the License at:
+#
+#     http://www.opensource.org/licenses/BSD-3-Clause
+
+import os
+import re
+import signal
+import sys
+import threading
+from timeit import default_timer as timer
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk
+from gi.repository import GLib
+
+from tfl_common.frame_preview import FramePreview
+from tfl_common.memory_stats import LazyModule, MemoryTracker
+from tfl_common.pipeline_metrics import PipelineMetrics, PrometheusServer
+from tfl_common.rate_controller import RateController
+from tfl_common.result_handoff import ResultHandoff
+from tfl_common.scene_gate import SceneGate
+
+# modules only needed by some modes are imported on first use
+cv2 = LazyModule("cv2")
+prediction_cache = LazyModule("tfl_common.prediction_cache")
+delegate_select = LazyModule("tfl_common.delegate_select")
+random = LazyModule("random")
+subprocess = LazyModule("subprocess")
+shm_transport = LazyModule("tfl_common.shm_transport")
+thread_placement = LazyModule("tfl_common.thread_placement")
+telemetry = LazyModule("tfl_common.telemetry")
+model_ladder = LazyModule("tfl_common.model_ladder")
+model_reload = LazyModule("tfl_common.model_reload")
+inference_server = LazyModule("tfl_common.inference_server")
+
+class BaseUIWindow(Gtk.Window):
+    """
+    Part of the application main window common to the image classification
+    and object detection applications: camera setup, screen dependent UI
+    parameters, still picture files and shared resources cleanup
+    """
+    # (ui_cairo_font_size_label, ui_cairo_font_size) for the default,
+    # 480x272 and 800x480 displays
+    UI_FONT_SIZES = ((50, 20), (25, 8), (30, 13))
+
+    def __init__(self, args, startup=None):
+        """
+        :param startup: StartupProfile object of the application
+        """
+        Gtk.Window.__init__(self)
+        self.args = args
+        self.startup = startup
+        self._first_result = False
+        self.memory = MemoryTracker(args.memory_stats)
+        self.memory.snapshot("startup")
+        if args.memory_stats:
+            self.connect("destroy", self.print_memory_stats)
+        self.dcmipp_camera = False
+        self.metrics = PipelineMetrics()
+        self.metrics_server = None
+        self.inference_process = None
+        self.exporter = None
+        self.rate_controller = None
+        self.scene_gate = None
+        self.thread_placement = None
+        self.telemetry = None
+        self.model_ladder = None
+        self.model_reloader = None
+        self.prediction_cache = None
+        # clients of the inference server, closed with the window
+        self.remote_nns = []
+        # inference results published by the streaming thread, the last
+        # one applied on the GTK thread has the sequence number displayed_seq
+        self.results = ResultHandoff()
+        self.displayed_seq = 0
+        self.frame_preview = FramePreview()
+        # set once the neural network is warmed up, no inference is
+        # launched on the camera frames before
+        self.nn_ready = threading.Event()
+
+        # initialize the list of the file to be processed (used with the
+        # --image parameter)
+        self.files = []
+
+    def results_ready_cb(self):
+        """
+        apply the last published inference result on the GTK thread, nothing
+        is done if it has already been applied
+        """
+        snapshot = self.results.acquire(self.displayed_seq)
+        if snapshot is None:
+            return False
+        self.displayed_seq = snapshot.seq
+        self.nn_inference_time = snapshot.inference_time
+        self.nn_inference_fps = (1000/(self.nn_inference_time*1000))
+        self.set_nn_results(snapshot.results, snapshot.pts)
+        self.update_camera_preview()
+        self.metrics.set_value("result_latency_seconds", snapshot.latency())
+        return False
+
+    def start_inference_process(self, nn):
+        """
+        start the inference process exchanging frames and results with the
+        GstWidget through shared memory
+        """
+        if self.args.inference_server is not None:
+            print("WARNING: --split_process is ignored, the inferences are run by the --inference_server")
+            return
+        self.inference_process = shm_transport.InferenceProcess(nn, nn.get_img_size())
+        self.inference_process.start()
+        self.connect("destroy", self.stop_inference_process)
+
+    def connect_inference_server(self, model_file, postprocess):
+        """
+        run the inferences of the model in the --inference_server shared
+        with other applications
+        :return: RemoteNeuralNetwork object, None if the server cannot be
+                 used, the model then runs in the application
+        """
+        args = self.args
+        socket_path = args.inference_server or inference_server.DEFAULT_SOCKET
+        try:
+            nn = inference_server.RemoteNeuralNetwork(socket_path, model_file, args.label_file,
+                                                      float(args.input_mean), float(args.input_std),
+                                                      postprocess, args.warmup_runs,
+                                                      os.path.basename(sys.argv[0]))
+        except (OSError, RuntimeError) as error:
+            print("WARNING: inference server " + socket_path + " not used, " + str(error))
+            return None
+        if not self.remote_nns:
+            self.connect("destroy", self.close_remote_nns)
+        self.remote_nns.append(nn)
+        return nn
+
+    def release_nn(self, nn):
+        """
+        a reloaded neural network replaced nn, the connection and the shared
+        memory of a client of the inference server are released
+        """
+        if nn in self.remote_nns:
+            self.remote_nns.remove(nn)
+            nn.close()
+
+    def close_remote_nns(self, widget):
+        for nn in self.remote_nns:
+            nn.close()
+        self.remote_nns = []
+
+    def start_metrics_server(self):
+        """
+        expose the pipeline metrics on the --metrics_port, the application
+        runs without them if the port cannot be used
+        """
+        try:
+            self.metrics_server = PrometheusServer(self.metrics, self.args.metrics_port)
+        except OSError as error:
+            print("WARNING: pipeline metrics not exposed on port " + str(self.args.metrics_port) + ": " + str(error))
+            return
+        self.metrics_server.start()
+        self.connect("destroy", self.stop_metrics_server)
+
+    def stop_metrics_server(self, widget):
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+    def start_rate_controller(self, nn):
+        """
+        adapt the inference stride and threads to reach the --target_fps
+        display fps, the threads of an inference process are not adjusted
+        """
+        adjust_threads = nn.supports_num_threads() and self.inference_process is None
+        self.rate_controller = RateController(self.args.target_fps, nn.number_threads,
+                                              os.cpu_count(), adjust_threads)
+
+    def start_scene_gate(self):
+        """
+        skip the inference of the frames of a static scene, the results are
+        refreshed at least every --scene_gate_refresh ms
+        """
+        self.scene_gate = SceneGate(self.args.scene_gate, self.args.scene_gate_refresh / 1000)
+
+    def start_model_ladder(self, nn, factory):
+        """
+        switch at runtime between the --model_file and the lighter
+        --model_ladder models to meet the --latency_budget, see model_ladder
+        :param nn: NeuralNetwork of the --model_file
+        :param factory: function building the NeuralNetwork of a model file
+        """
+        args = self.args
+        if self.inference_process is not None:
+            print("WARNING: --model_ladder is not supported with --split_process, " + args.model_file + " is used")
+            return
+        budget = args.latency_budget
+        if budget is None:
+            # one frame period
+            budget = 1000 / float(args.framerate)
+
+        def load(model_file):
+            ladder_nn = factory(model_file)
+            ladder_nn.warm_up()
+            return ladder_nn
+
+        model_files = [args.model_file] + list(args.model_ladder)
+        scheduler = model_ladder.LadderScheduler(len(model_files), budget / 1000)
+        self.model_ladder = model_ladder.ModelLadder(model_files, load, scheduler, nn, not args.ladder_lazy)
+
+    def start_model_reloader(self, factory):
+        """
+        replace the neural network without stopping the pipeline when the
+        --model_file or the --label_file change, or on SIGUSR1
+        :param factory: function building the NeuralNetwork of a model file
+        """
+        args = self.args
+        if self.inference_process is not None or self.model_ladder is not None:
+            print("WARNING: --hot_reload is not supported with --split_process and --model_ladder")
+            return
+
+        def load():
+            if self.thread_placement is not None:
+                # the worker threads of the interpreter inherit the
+                # placement of the thread creating it
+                self.thread_placement.place_current("inference")
+            nn = factory(args.model_file)
+            nn.warm_up()
+            return nn
+
+        self.model_reloader = model_reload.ModelReloader([args.model_file, args.label_file], load,
+                                                         args.reload_interval)
+        self.model_reloader.start()
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, self.reload_signal_cb)
+        self.connect("destroy", self.stop_model_reloader)
+
+    def reload_signal_cb(self):
+        print("reload requested, reloading " + self.args.model_file)
+        self.model_reloader.request()
+        return True
+
+    def stop_model_reloader(self, widget):
+        if self.model_reloader is not None:
+            self.model_reloader.stop()
+            print(self.model_reloader.summary())
+            self.model_reloader = None
+
+    def start_thread_placement(self):
+        """
+        place the GTK main thread, called from it before the creation of the
+        neural network, the other threads are placed when they start
+        """
+        try:
+            placements = thread_placement.parse_placements(self.args.affinity)
+        except ValueError as error:
+            print("WARNING: no thread placement, " + str(error))
+            return
+        self.thread_placement = thread_placement.ThreadPlacement(placements)
+        self.thread_placement.place_current("ui")
+        inference = placements.get("inference")
+        if inference is not None and inference.cpus and self.args.num_threads is None:
+            # one interpreter thread per core of the inference
+            self.args.num_threads = len(inference.cpus)
+        self.connect("destroy", self.print_thread_placement)
+
+    def place_interpreter_threads(self):
+        """
+        place the worker threads of the interpreter, which exist once it has
+        run an inference
+        """
+        if self.thread_placement is not None and self.inference_process is None:
+            self.thread_placement.place_new_threads("inference")
+
+    def print_thread_placement(self, widget):
+        print(self.thread_placement.report())
+
+    def start_telemetry(self):
+        """
+        sample the temperatures, the cpu frequencies and the CPU load every
+        --telemetry_interval seconds, the report is printed at exit
+        """
+        self.telemetry = telemetry.TelemetrySampler(self.args.telemetry_interval)
+        self.telemetry.start()
+        self.connect("destroy", self.stop_telemetry)
+
+    def stop_telemetry(self, widget):
+        if self.telemetry is not None:
+            self.telemetry.stop()
+            print(self.telemetry.report())
+            if self.args.telemetry != "":
+                self.telemetry.save(self.args.telemetry)
+                print("telemetry stored in " + self.args.telemetry)
+            self.telemetry = None
+
+    def select_delegate(self):
+        """
+        replace the --edgetpu, --ext_delegate and --num_threads parameters by
+        the fastest configuration of the model, see delegate_select
+        """
+        args = self.args
+        ext_delegates = list(args.auto_delegate)
+        if args.ext_delegate is not None and args.ext_delegate not in ext_delegates:
+            ext_delegates.insert(0, args.ext_delegate)
+        max_threads = os.cpu_count() or 1
+        if args.image == "" and max_threads > 1:
+            # one core is always reserved for video display
+            max_threads -= 1
+        candidates = delegate_select.list_candidates(ext_delegates, max_threads)
+        selection = delegate_select.select_delegate(args.model_file, candidates)
+        if selection is None:
+            print("No delegate candidate can run " + args.model_file + ", keep the command line configuration")
+            return
+        print(selection.explain())
+        args.edgetpu = False
+        args.ext_delegate = selection.delegate
+        args.num_threads = selection.num_threads
+
+    def start_prediction_cache(self, nn, model_files, config=None):
+        """
+        replay the results of the still pictures already inferred with the
+        same models and configuration from the --prediction_cache directory
+        :param model_files: paths of the models producing the results
+        :param config: parameters changing the results in addition to the
+                       configuration of nn
+        """
+        cache_config = nn.get_config()
+        if config is not None:
+            cache_config.update(config)
+        self.prediction_cache = prediction_cache.PredictionCache(self.args.prediction_cache,
+                                                                 model_files, cache_config)
+        self.connect("destroy", self.close_prediction_cache)
+
+    def close_prediction_cache(self, widget):
+        if self.prediction_cache is not None:
+            self.prediction_cache.close()
+            print(self.prediction_cache.summary())
+            self.prediction_cache = None
+
+    def infer_picture(self, nn, img_array, image_path):
+        """
+        launch the inference of a still picture, or replay its results from
+        the prediction cache
+        :return: (results, inference time in seconds)
+        """
+        image_key = None
+        if self.prediction_cache is not None:
+            image_key = prediction_cache.file_digest(image_path)
+            cached = self.prediction_cache.get(image_key)
+            if cached is not None:
+                return cached
+        height, width = nn.get_img_size()[:2]
+        nn_frame = cv2.resize(img_array, (width, height))
+        start_time = timer()
+        nn.launch_inference(nn_frame)
+        inference_time = timer() - start_time
+        results = nn.get_results()
+        if self.telemetry is not None:
+            self.telemetry.record_inference(inference_time)
+        if image_key is not None:
+            self.prediction_cache.put(image_key, results, inference_time)
+        return results, inference_time
+
+    def warm_up_nn(self, nn, background):
+        """
+        run the warm-up inferences of the neural network
+        :param background: True to run them in a thread, the UI shows the
+                           warm-up state meanwhile
+        """
+        if self.args.warmup_runs <= 0 or self.inference_process is not None:
+            # the inference process warms up its own interpreter
+            self.nn_ready.set()
+            return
+        if background:
+            threading.Thread(target=self._warm_up, args=(nn,), name="nn-warm-up", daemon=True).start()
+        else:
+            self._warm_up(nn)
+
+    def _warm_up(self, nn):
+        nn.warm_up()
+        self.place_interpreter_threads()
+        print(nn.warm_up_summary())
+        self.metrics.set_value("warmup_cold_latency_seconds", nn.cold_latency)
+        if nn.warm_latency is not None:
+            self.metrics.set_value("warmup_warm_latency_seconds", nn.warm_latency)
+        self.nn_ready.set()
+        GLib.idle_add(self.nn_ready_cb)
+
+    def nn_ready_cb(self):
+        """
+        leave the warm-up screen
+        """
+        if hasattr(self, "drawing_area"):
+            self.drawing_area.queue_draw()
+        return False
+
+    def get_loading_text(self):
+        """
+        :return: text of the waiting screen, the warm-up of the neural network
+                 then the wait for the first inference result
+        """
+        if self.nn_ready.is_set():
+            return "Waiting for the first frame"
+        return "Warming up NN model"
+
+    def startup_stage(self, stage):
+        """
+        record the memory footprint and the startup time of a stage
+        """
+        self.memory.snapshot(stage)
+        if self.startup is not None:
+            self.startup.mark(stage)
+
+    def first_result_done(self):
+        """
+        end of the startup, called for each inference result
+        """
+        if self._first_result:
+            return
+        self._first_result = True
+        self.place_interpreter_threads()
+        self.startup_stage("first inference")
+        if self.startup is not None:
+            self.startup.stop_tracing_imports()
+            if self.args.startup_profile:
+                print(self.startup.report())
+
+    def print_memory_stats(self, widget):
+        self.memory.snapshot("exit")
+        print(self.memory.summary())
+
+    def stop_inference_process(self, widget):
+        if self.inference_process is not None:
+            self.inference_process.stop()
+            self.inference_process = None
+
+    def stop_label_scheduler(self, widget):
+        # no refresh of the labels once they are destroyed
+        self.label_scheduler.stop()
+
+    def close_exporter(self, widget):
+        if self.exporter is not None:
+            self.exporter.close()
+            print(self.exporter.summary())
+            self.exporter = None
+
+    def setup_dcmipp(self):
+        args = self.args
+        config_cam = "media-ctl -d /dev/media0 --set-v4l2 \"\'ov5640 1-003c\':0[fmt:RGB565_2X8_LE/" + str(args.frame_width)  + "x" + str(args.frame_height) + "@1/" + str(args.framerate) + " field:none]\""
+        os.system(config_cam)
+
+        config_dcmipp_parallel = "media-ctl -d /dev/media0 --set-v4l2 \"\'dcmipp_parallel\':0[fmt:RGB565_2X8_LE/" + str(args.frame_width) + "x" + str(args.frame_height) + "]\""
+        os.system(config_dcmipp_parallel)
+
+        config_dcmipp_dump_postproc0 = "media-ctl -d /dev/media0 --set-v4l2 \"\'dcmipp_dump_postproc\':0[fmt:RGB565_2X8_LE/" + str(args.frame_width) + "x" + str(args.frame_height) +"]\"";
+        os.system(config_dcmipp_dump_postproc0)
+
+        config_dcmipp_dump_postproc1 = "media-ctl -d /dev/media0 --set-v4l2 \"\'dcmipp_dump_postproc\':1[fmt:RGB565_2X8_LE/" + str(args.frame_width) + "x" + str(args.frame_height) +"]\"";
+        os.system(config_dcmipp_dump_postproc1)
+
+        config_dcmipp_dump_postproc_crop = "media-ctl -d /dev/media0 --set-v4l2 \"\'dcmipp_dump_postproc\':1[crop:(0,0)/" + str(args.frame_width) + "x" + str(args.frame_height) + "]\"";
+        os.system(config_dcmipp_dump_postproc_crop)
+        self.dcmipp_camera = True
+        print("dcmipp congiguration passed ")
+
+    def check_video_device (self):
+        #Check the camera type to configure it if necessary
+        cmd = "cat /sys/class/video4linux/video" + str(self.args.video_device) + "/name"
+        camera_type = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE).communicate()[0]
+        dcmipp = 'dcmipp_dump_capture'
+        found = re.search(dcmipp,str(camera_type))
+        if found :
+            #dcmipp camera found
+            self.setup_dcmipp();
+            return True
+        else :
+            return False
+
+    def set_ui_param(self):
+        """
+        Setup all the UI parameter depending
+        on the screen size
+        """
+        self.ui_cairo_font_size_label, self.ui_cairo_font_size = self.UI_FONT_SIZES[0]
+        self.ui_icon_exit_width = '50';
+        self.ui_icon_exit_height = '50';
+        self.ui_icon_st_width = '130';
+        self.ui_icon_st_height = '160';
+        if self.screen_height <= 272:
+               # Display 480x272 */
+               self.ui_cairo_font_size_label, self.ui_cairo_font_size = self.UI_FONT_SIZES[1]
+               self.ui_icon_exit_width = '25';
+               self.ui_icon_exit_height = '25';
+               self.ui_icon_st_width = '42';
+               self.ui_icon_st_height = '52';
+        elif self.screen_height <= 480:
+               #Display 800x480 */
+               self.ui_cairo_font_size_label, self.ui_cairo_font_size = self.UI_FONT_SIZES[2]
+               self.ui_icon_exit_width = '50';
+               self.ui_icon_exit_height = '50';
+               self.ui_icon_st_width = '65';
+               self.ui_icon_st_height = '80';
+
+    def valid_timeout_callback(self):
+        """
+        if timeout occurs that means that camera preview and the gtk is not
+        behaving as expected */
+        """
+        print("Timeout: camera preview and/or gtk is not behaving has expected\n");
+        self.destroy()
+        os._exit(1)
+
+    def exit_icon_cb(self,eventbox, event):
+        """
+        Exit callback to close application
+        """
+        self.destroy()
+        Gtk.main_quit()
+
+    def update_frame(self, frame):
+        """
+        update frame in still picture mode, the frame is painted by the
+        drawing callback under the labels and the boxes
+        """
+        self.frame_preview.set_frame(frame)
+        self.drawing_area.queue_draw()
+
+    def draw_frame(self, cr):
+        """
+        paint the still picture, horizontally centered in the drawing area
+        """
+        self.frame_preview.draw(cr, (self.drawing_width - self.frame_preview.width) / 2, 0)
+
+    # get random file in a directory
+    def getRandomFile(self, path):
+        """
+        Returns a random filename, chosen among the files of the given path.
+        The .json files holding the expected validation results are skipped.
+        """
+        if len(self.files) == 0:
+            self.files = [f for f in os.listdir(path) if not f.endswith(".json")]
+
+        if len(self.files) == 0:
+            return '';
+
+        index = random.randrange(0, len(self.files))
+        file_path = self.files[index]
+        self.files.pop(index)
+        return file_path
+
+    def get_image_path(self, file_name):
+        """
+        :return: path of a file of the --image directory
+        """
+        return os.path.join(self.args.image, file_name)
@@ -11,398 +11,171 @@
 #
 #     http://www.opensource.org/licenses/BSD-3-Clause
 
+import argparse
+import os
+import signal
+
+from tfl_common.startup_profile import StartupProfile
+
+startup = StartupProfile()
+
+def parse_args():
+    """
+    parse the command line, before the heavy imports so that --help and
+    the argument errors do not pay them
+    """
+    #Tensorflow Lite NN intitalisation
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--image", default="", help="image directory with image to be classified")
+    parser.add_argument("-v", "--video_device", default=0, help="video device (default /dev/video0)")
+    parser.add_argument("--frame_width", default=320, help="width of the camera frame (default is 320)")
+    parser.add_argument("--frame_height", default=240, help="height of the camera frame (default is 240)")
+    parser.add_argument("--framerate", default=15, help="framerate of the camera (default is 15fps)")
+    parser.add_argument("-m", "--model_file", default="", help=".tflite model to be executed")
+    parser.add_argument("-l", "--label_file", default="", help="name of file containing labels")
+    parser.add_argument("-e", "--ext_delegate",default = None, help="external_delegate_library path")
+    parser.add_argument("-p", "--perf", default='std', choices= ['std', 'max'], help="[EdgeTPU ONLY] Select the performance of the Coral EdgeTPU")
+    parser.add_argument("--edgetpu", action='store_true', help="enable Coral EdgeTPU acceleration")
+    parser.add_argument("--input_mean", default=127.5, help="input mean")
+    parser.add_argument("--input_std", default=127.5, help="input standard deviation")
+    parser.add_argument("--validation", action='store_true', help="enable the validation mode")
+    parser.add_argument("--num_threads", default=None, help="Select the number of threads used by tflite interpreter to run inference")
+    parser.add_argument("--metrics_port", default=None, type=int, help="expose the pipeline metrics as Prometheus text on 127.0.0.1:<port> (camera preview mode only)")
+    parser.add_argument("--ui_refresh_rate", default=4, type=float, help="refresh rate in Hz of the inference information labels, 0 to refresh them on each inference (default 4)")
+    parser.add_argument("--videotestsrc", action='store_true', help="use a GStreamer test pattern instead of the camera")
+    parser.add_argument("--split_process", action='store_true', help="run the inference in a separate process fed through shared memory (camera preview mode only)")
+    parser.add_argument("--auto_delegate", nargs='*', default=None, metavar="DELEGATE", help="benchmark the model on the CPU with several numbers of threads, the --ext_delegate, the given external delegate libraries and the Edge TPU, and use the fastest. The decision is stored per model")
+    parser.add_argument("--warmup_runs", default=3, type=int, help="number of dummy inferences run before processing the frames, 0 to disable (default 3)")
+    parser.add_argument("--target_fps", default=None, type=float, help="display fps to reach by adapting the inference stride and threads (camera preview mode only)")
+    parser.add_argument("--scene_gate", nargs='?', const=0.02, default=None, type=float, metavar="THRESHOLD", help="skip the inference of the frames which differ from the last inferred frame by less than THRESHOLD (mean block intensity difference between 0 and 1, default 0.02) and reuse its results (camera preview mode only)")
+    parser.add_argument("--scene_gate_refresh", default=1000, type=float, help="maximal age in ms of the results reused by --scene_gate (default 1000)")
+    parser.add_argument("--sync_display", action='store_true', help="display the camera frames matching the last inference result instead of the live frames (camera preview mode only)")
+    parser.add_argument("--max_display_latency", default=200, type=float, help="maximal latency in ms added by --sync_display, the live frames are displayed beyond (default 200)")
+    parser.add_argument("--display_sink", default="gtk", choices=['gtk', 'wayland', 'kms', 'fake'], help="sink displaying the camera frames: gtksink in the UI, waylandsink or kmssink in full screen behind the UI, or fakesink to measure the throughput without display (camera preview mode only, default gtk)")
+    parser.add_argument("--affinity", nargs='+', default=None, metavar="ROLE:CPUS[:nice=N|fifo=P]", help="place the inference, streaming and ui threads on core sets with optional nice or SCHED_FIFO priorities, for instance inference:0 streaming:1 ui:1:nice=5, the achieved placement and the context switches are reported at exit")
+    parser.add_argument("--telemetry", nargs='?', const="", default=None, help="sample the SoC temperatures, the cpu frequencies and the CPU load during the run, print them at exit with the inference latency by frequency and by temperature, and store the samples and the latencies in the optional .json file")
+    parser.add_argument("--telemetry_interval", default=1.0, type=float, help="sampling period in seconds of --telemetry (default 1.0)")
+    parser.add_argument("--model_ladder", nargs='+', default=None, metavar="MODEL", help="lighter .tflite models of the same task, from the heaviest to the lightest, used instead of the --model_file when its inference latency exceeds the --latency_budget (camera preview mode only)")
+    parser.add_argument("--latency_budget", default=None, type=float, help="per frame inference latency budget in ms of --model_ladder (default one frame period)")
+    parser.add_argument("--ladder_lazy", action='store_true', help="load the --model_ladder models on first use instead of at startup")
+    parser.add_argument("--hot_reload", action='store_true', help="reload the --model_file without stopping the camera when it or the --label_file change, or when the application receives SIGUSR1 (camera preview mode only)")
+    parser.add_argument("--reload_interval", default=2.0, type=float, help="polling period in seconds of the files watched by --hot_reload (default 2.0)")
+    parser.add_argument("--inference_server", nargs='?', const="", default=None, metavar="SOCKET", help="run the inferences in the local inference server shared with other applications (python3 -m tfl_common.inference_server) listening on the optional Unix socket (default /tmp/tflite-inference.sock), the model runs in the application if the server is not available")
+    parser.add_argument("--low_memory", action='store_true', help="reduce the memory footprint by reusing the frame buffers and avoiding intermediate copies")
+    parser.add_argument("--memory_stats", action='store_true', help="trace the python allocations and print the memory footprint of each stage at exit")
+    parser.add_argument("--export", default=None, help="stream the inference results to jsonl:<file>, bin:<file> or unix:<socket path>[#topic]")
+    parser.add_argument("--prediction_cache", default=None, help="still picture mode: directory caching the inference results of the pictures, replayed while the model and its configuration are unchanged")
+    parser.add_argument("--startup_profile", action='store_true', help="print the duration of the startup phases and the import time of the modules")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    startup.mark("arguments parsed")
+    if args.startup_profile:
+        startup.trace_imports()
+
 import gi
 gi.require_version('Gtk', '3.0')
 gi.require_version('Gst', '1.0')
 from gi.repository import Gtk
 from gi.repository import Gdk
 from gi.repository import GLib
-from gi.repository import GdkPixbuf
 from gi.repository import Gst
 
 import numpy as np
-import argparse
-import signal
-import os
-import random
-import subprocess
-import re
 import os.path
-from os import path
-import cv2
-from PIL import Image
-import tflite_runtime.interpreter as tflr
-from timeit import default_timer as timer
-
-Gst.init(None)
-Gst.init_check(None)
-image_arr = None
-nn_input_width = 0
-nn_input_height = 0
-nn_input_channel = 0
-
-LIBTPU_STD_PATH = "/usr/lib/libedgetpu-std.so.2"
-LIBTPU_MAX_PATH = "/usr/lib/libedgetpu-max.so.2"
+from tfl_common.memory_stats import LazyModule
+from tfl_common.neural_network import NeuralNetwork, ClassificationPostProcess
+from tfl_common.gst_widget import GstWidget
+from tfl_common.ui_window import BaseUIWindow
+from tfl_common.ui_scheduler import LabelUpdateScheduler
+from tfl_common.overlay import TextCache
+
+# modules only needed by some modes are imported on first use, OpenCV
+# and PIL are only needed in still picture mode
+cv2 = LazyModule("cv2")
+Image = LazyModule("PIL.Image")
+result_export = LazyModule("tfl_common.result_export")
 
 RESOURCES_DIRECTORY = os.path.abspath(os.path.dirname(__file__)) + "/resources/"
 
-class NeuralNetwork:
-    """
-    Class that handles Neural Network inference
-    """
+class MainUIWindow(BaseUIWindow):
+    UI_FONT_SIZES = ((50, 20), (25, 8), (30, 13))
 
-    def __init__(self, model_file, label_file, input_mean, input_std, edgetpu, perf, ext_delegate):
+    def __init__(self, args, startup=None):
         """
-        :param model_path: .tflite model to be executedname of file containing labels")
-        :param label_file:  name of file containing labels
-        :param input_mean: input_mean
-        :param input_std: input standard deviation
-        """
-
-        if args.num_threads == None :
-            if os.cpu_count() <= 1:
-                self.number_threads = 1
-            else :
-                # one core is always reserved for video display
-                if args.image == "":
-                    self.number_threads = os.cpu_count() - 1
-                else :
-                    self.number_threads = os.cpu_count()
-        else :
-           self.number_threads = int(args.num_threads)
-
-        self._selected_delegate = None
-
-        def load_labels(filename):
-            my_labels = []
-            input_file = open(filename, 'r')
-            for l in input_file:
-                my_labels.append(l.strip())
-            return my_labels
-
-        self._model_file = model_file
-        self._label_file = label_file
-        self._input_mean = input_mean
-        self._input_std = input_std
-        self._floating_model = False
-
-        if edgetpu is True:
-            #Check if the Edge TPU is connected
-            edge_tpu = False
-            device_re = re.compile(".+?ID\s(?P<id>\w+)", re.I)
-            lsusb = subprocess.check_output("lsusb").decode("utf-8")
-            for i in lsusb.split('\n'):
-                if i:
-                    info = device_re.match(i)
-                    if info:
-                        d = info.groupdict()
-                        if '1a6e' in d.values() or '18d1' in d.values():
-                            edge_tpu = True
-
-            if not edge_tpu:
-                print("Edge TPU is not plugged!")
-                print("Please connect the Edge TPU and try again.")
-                os._exit(1)
-
-            if perf == 'std':
-                if path.exists(LIBTPU_STD_PATH):
-                    self._selected_delegate = LIBTPU_STD_PATH
-                else :
-                    print("No delegate ",LIBTPU_STD_PATH, "found fall back on CPU mode")
-            elif perf == 'max':
-                if path.exists(LIBTPU_MAX_PATH):
-                    self._selected_delegate = LIBTPU_MAX_PATH
-                else :
-                    print("No delegate ",LIBTPU_MAX_PATH, "found fall back on CPU mode")
-
-        elif ext_delegate is not None :
-            if path.exists(ext_delegate):
-                self._selected_delegate = ext_delegate
-            else :
-                print("No delegate ",ext_delegate, "found fall back on CPU mode")
-
-        if self._selected_delegate is not None:
-            print('Loading external delegate from {}'.format(self._selected_delegate))
-            print("number of threads used in tflite interpreter : ",self.number_threads)
-            self._interpreter = tflr.Interpreter(model_path=self._model_file,
-                                                 num_threads = self.number_threads,
-                                                 experimental_delegates=[tflr.load_delegate(self._selected_delegate)])
-        else :
-            print("no delegate to use, CPU mode activated")
-            self._interpreter = tflr.Interpreter(model_path=self._model_file,
-                                                 num_threads = self.number_threads)
-
-        self._interpreter.allocate_tensors()
-        self._input_details = self._interpreter.get_input_details()
-        self._output_details = self._interpreter.get_output_details()
-
-        # check the type of the input tensor
-        if self._input_details[0]['dtype'] == np.float32:
-            self._floating_model = True
-            print("Floating point Tensorflow Lite Model")
-
-        self._labels = load_labels(self._label_file)
-
-    def __getstate__(self):
-        return (self._model_file, self._label_file, self._input_mean,
-                self._input_std, self._floating_model, self._selected_delegate, self.number_threads, \
-                self._input_details, self._output_details, self._labels)
-
-    def __setstate__(self, state):
-        self._model_file, self._label_file, self._input_mean, \
-                self._input_std, self._floating_model, self._selected_delegate, self.number_threads, \
-                self._input_details, self._output_details, self._labels = state
-
-        if self._selected_delegate is not None:
-            self._interpreter = tflr.Interpreter(model_path=self._model_file,
-                                                 num_threads = self.number_threads,
-                                                 experimental_delegates=[tflr.load_delegate(self._selected_delegate)])
-        else :
-            self._interpreter = tflr.Interpreter(model_path=self._model_file,
-                                                 num_threads = self.number_threads)
-        self._interpreter.allocate_tensors()
-
-    def get_labels(self):
-        return self._labels
-
-    def get_img_size(self):
-        """
-        :return: size of NN input image size
-        """
-        # NxHxWxC, H:1, W:2, C:3
-        return (int(self._input_details[0]['shape'][1]),
-                int(self._input_details[0]['shape'][2]),
-                int(self._input_details[0]['shape'][3]))
-
-    def launch_inference(self, img):
-        """
-        This method launches inference using the invoke call
-        :param img: the image to be inferenced
+        Setup the Gtk UI
         """
-        # add N dim
-        input_data = np.expand_dims(img, axis=0)
-
-        if self._floating_model:
-            input_data = (np.float32(input_data) - self._input_mean) / self._input_std
-
-        self._interpreter.set_tensor(self._input_details[0]['index'], input_data)
-        self._interpreter.invoke()
+        BaseUIWindow.__init__(self, args, startup)
+
+        # optional placement of the threads on core sets
+        if args.affinity is not None:
+            self.start_thread_placement()
+
+        # optional thermal and cpu frequency telemetry
+        if args.telemetry is not None:
+            self.start_telemetry()
+
+        # optional benchmark of the execution configurations of the model
+        if args.auto_delegate is not None:
+            self.select_delegate()
+
+        # initialize NeuralNetwork object, or the client of the inference
+        # server shared with other applications
+        self.nn = None
+        if args.inference_server is not None:
+            self.nn = self.connect_inference_server(args.model_file, ClassificationPostProcess())
+        if self.nn is None:
+            self.nn = NeuralNetwork(args.model_file, args.label_file, float(args.input_mean), float(args.input_std),
+                                    args.edgetpu, args.perf, args.ext_delegate, args.num_threads,
+                                    args.image == "", ClassificationPostProcess(), args.warmup_runs)
+        self.shape = self.nn.get_img_size()
+        self.startup_stage("nn loaded")
 
-    def get_results(self):
-         """
-         This method can print and return the top_k results of the inference
-         """
-         output_data = self._interpreter.get_tensor(self._output_details[0]['index'])
-         results = np.squeeze(output_data)
+        # optional inference process exchanging frames and results through
+        # shared memory (camera preview mode only)
+        if args.split_process and args.image == "":
+            self.start_inference_process(self.nn)
+        # camera preview mode: warm-up in background behind the warm-up screen
+        self.warm_up_nn(self.nn, args.image == "")
 
-         top_k = results.argsort()[-5:][::-1]
+        # optional adaptation of the inference workload to the display fps
+        if args.target_fps is not None and args.image == "":
+            self.start_rate_controller(self.nn)
 
-         if self._floating_model:
-             return (results[top_k[0]], top_k[0])
-         else:
-             return (results[top_k[0]]/255.0, top_k[0])
+        # optional switch to lighter models to meet the latency budget
+        if args.model_ladder is not None and args.image == "":
+            self.start_model_ladder(self.nn, self.load_nn)
 
-class GstWidget(Gtk.Box):
-    """
-    Class that handles Gstreamer pipeline using gtksink and appsink
-    """
-    def __init__(self, window, nn):
-         super().__init__()
-         # connect the gtkwidget with the realize callback
-         self.connect('realize', self._on_realize)
-         self.instant_fps = 0
-         self.window = window
-         self.nn = nn
-
-    def _on_realize(self, widget):
-            """
-            creation of the gstreamer pipeline when gstwidget is created
-            """
-            # gstreamer pipeline creation
-            self.pipeline = Gst.Pipeline()
-
-            # creation of the source v4l2src
-            self.v4lsrc1 = Gst.ElementFactory.make("v4l2src", "source")
-            video_device = "/dev/video" + args.video_device
-            self.v4lsrc1.set_property("device", video_device)
-
-            #creation of the v4l2src caps
-            if self.window.dcmipp_camera :
-                caps = "video/x-raw,format = RGB16, width=" + str(args.frame_width) +",height=" + str(args.frame_height) + ", framerate=" + str(args.framerate)+ "/1"
-            else:
-                caps = "video/x-raw, width=" + str(args.frame_width) +",height=" + str(args.frame_height) + ", framerate=" + str(args.framerate)+ "/1"
-            camera1caps = Gst.Caps.from_string(caps)
-            self.camerafilter1 = Gst.ElementFactory.make("capsfilter", "filter1")
-            self.camerafilter1.set_property("caps", camera1caps)
-
-            # creation of the videoconvert elements
-            self.videoformatconverter1 = Gst.ElementFactory.make("videoconvert", "video_convert1")
-            self.videoformatconverter2 = Gst.ElementFactory.make("videoconvert", "video_convert2")
-
-            self.tee = Gst.ElementFactory.make("tee", "tee")
-
-            # creation and configuration of the queue elements
-            self.queue1 = Gst.ElementFactory.make("queue", "queue-1")
-            self.queue2 = Gst.ElementFactory.make("queue", "queue-2")
-            self.queue1.set_property("max-size-buffers", 1)
-            self.queue1.set_property("leaky", 2)
-            self.queue2.set_property("max-size-buffers", 1)
-            self.queue2.set_property("leaky", 2)
-
-            # creation and configuration of the appsink element
-            self.appsink = Gst.ElementFactory.make("appsink", "appsink")
-            nn_caps = "video/x-raw, format = RGB, width=" + str(nn_input_width) + ",height=" + str(nn_input_height)
-            nncaps = Gst.Caps.from_string(nn_caps)
-            self.appsink.set_property("caps", nncaps)
-            self.appsink.set_property("emit-signals", True)
-            self.appsink.set_property("sync", False)
-            self.appsink.set_property("max-buffers", 1)
-            self.appsink.set_property("drop", True)
-            self.appsink.connect("new-sample", self.new_sample)
-
-            # creation of the gtksink element to handle the gestreamer video stream
-            self.gtksink = Gst.ElementFactory.make("gtksink")
-            self.pack_start(self.gtksink.props.widget, True, True, 0)
-            self.gtksink.props.widget.show()
-
-            # creation and configuration of the fpsdisplaysink element to measure display fps
-            self.fps_disp_sink = Gst.ElementFactory.make("fpsdisplaysink", "fpsmeasure1")
-            self.fps_disp_sink.set_property("signal-fps-measurements", True)
-            self.fps_disp_sink.set_property("fps-update-interval", 2000)
-            self.fps_disp_sink.set_property("text-overlay", False)
-            self.fps_disp_sink.set_property("video-sink", self.gtksink)
-            self.fps_disp_sink.connect("fps-measurements",self.get_fps_display)
-
-            # creation of the video rate and video scale elements
-            self.video_rate = Gst.ElementFactory.make("videorate", "video-rate")
-            self.video_scale = Gst.ElementFactory.make("videoscale", "video-scale")
-
-            # Add all elements to the pipeline
-            self.pipeline.add(self.v4lsrc1)
-            self.pipeline.add(self.camerafilter1)
-            self.pipeline.add(self.videoformatconverter1)
-            self.pipeline.add(self.videoformatconverter2)
-            self.pipeline.add(self.tee)
-            self.pipeline.add(self.queue1)
-            self.pipeline.add(self.queue2)
-            self.pipeline.add(self.appsink)
-            self.pipeline.add(self.fps_disp_sink)
-            self.pipeline.add(self.video_rate)
-            self.pipeline.add(self.video_scale)
-
-            # linking elements together
-            #                              -> queue 1 -> videoconvert -> fpsdisplaysink
-            # v4l2src -> video rate -> tee
-            #                              -> queue 2 -> videoconvert -> video scale -> appsink
-            self.v4lsrc1.link(self.video_rate)
-            self.video_rate.link(self.camerafilter1)
-            self.camerafilter1.link(self.tee)
-            self.queue1.link(self.videoformatconverter1)
-            self.videoformatconverter1.link(self.fps_disp_sink)
-            self.queue2.link(self.videoformatconverter2)
-            self.videoformatconverter2.link(self.video_scale)
-            self.video_scale.link(self.appsink)
-            self.tee.link(self.queue1)
-            self.tee.link(self.queue2)
-
-            # set pipeline playing mode
-            self.pipeline.set_state(Gst.State.PLAYING)
-            # getting pipeline bus
-            self.bus = self.pipeline.get_bus()
-            self.bus.add_signal_watch()
-            self.bus.connect('message::error', self.msg_error_cb)
-            self.bus.connect('message::eos', self.msg_eos_cb)
-            self.bus.connect('message::info', self.msg_info_cb)
-            self.bus.connect('message::application', self.msg_application_cb)
-
-            Gst.debug_bin_to_dot_file(self.pipeline, Gst.DebugGraphDetails.ALL,
-                                           "pipeline")
-
-    def msg_eos_cb(self, bus, message):
-        print('eos message -> {}'.format(message))
-
-    def msg_info_cb(self, bus, message):
-        print('info message -> {}'.format(message))
-
-    def msg_error_cb(self, bus, message):
-        print('error message -> {}'.format(message.parse_error()))
-
-    def msg_application_cb(self, bus, message):
-        if message.get_structure().get_name() == 'inference-done':
-            self.window.update_camera_preview()
-            self.window.queue_draw()
-
-    def gst_to_opencv(self,sample):
-        """
-        convertion of the gstreamer frame buffer into numpy array
-        """
-        buf = sample.get_buffer()
-        caps = sample.get_caps()
-        arr = np.ndarray(
-            (caps.get_structure(0).get_value('height'),
-             caps.get_structure(0).get_value('width'),
-             3),
-            buffer=buf.extract_dup(0, buf.get_size()),
-            dtype=np.uint8)
-        return arr
-
-    def new_sample(self,*data):
-        """
-        recover video frame from appsink
-        and run inference
-        """
-        global image_arr
-        sample = self.appsink.emit("pull-sample")
-        arr = self.gst_to_opencv(sample)
-        if arr is not None :
-            start_time = timer()
-            self.nn.launch_inference(arr)
-            stop_time = timer()
-            self.window.nn_inference_time = stop_time - start_time
-            self.window.nn_inference_fps = (1000/(self.window.nn_inference_time*1000))
-            self.window.nn_result_accuracy,self.window.nn_result_label = self.nn.get_results()
-            struc = Gst.Structure.new_empty("inference-done")
-            msg = Gst.Message.new_application(None, struc)
-            self.bus.post(msg)
-        return Gst.FlowReturn.OK
-
-    def get_fps_display(self,fpsdisplaysink,fps,droprate,avgfps):
-        """
-        measure and recover display fps
-        """
-        self.instant_fps = fps
-        return self.instant_fps
-
-class MainUIWindow(Gtk.Window):
-    def __init__(self, args):
-        """
-        Setup the Gtk UI
-        """
-        Gtk.Window.__init__(self)
+        # optional reload of the model while the pipeline runs
+        if args.hot_reload and args.image == "":
+            self.start_model_reloader(self.load_nn)
 
-        # initialize NeuralNetwork object
-        self.nn = NeuralNetwork(args.model_file, args.label_file, float(args.input_mean), float(args.input_std), args.edgetpu, args.perf, args.ext_delegate)
-        self.shape = self.nn.get_img_size()
-        global nn_input_width
-        global nn_input_height
-        global nn_input_channel
-        nn_input_width = self.shape[1]
-        nn_input_height = self.shape[0]
-        nn_input_channel = self.shape[2]
+        # optional reuse of the results while the scene does not change
+        if args.scene_gate is not None and args.image == "":
+            self.start_scene_gate()
 
         #define shared variables
         self.nn_inference_time = 0.0
         self.nn_inference_fps = 0.0
+        self.label_scheduler = LabelUpdateScheduler(self.render_label_preview, args.ui_refresh_rate)
+        self.connect("destroy", self.stop_label_scheduler)
+
+        # optional streaming of the inference results out of the application
+        if args.export is not None:
+            self.exporter = result_export.create_exporter(args.export, self.nn.get_labels(), 0.0)
+            self.connect("destroy", self.close_exporter)
+
+        # optional replay of the results of the pictures already inferred
+        # (still picture mode only)
+        if args.prediction_cache is not None and args.image != "":
+            self.start_prediction_cache(self.nn, [args.model_file])
+
         self.nn_result_accuracy = 0.0
         self.nn_result_label = 0
 
         self.exit_app = False
-        self.dcmipp_camera = False
         self.first_call = True
-
-        # initialize the list of the file to be processed (used with the
-        # --image parameter)
-        self.files = []
         self.label_to_display = ""
 
         # initialize the list of inference/display time to process the average
@@ -415,46 +188,30 @@ class MainUIWindow(Gtk.Window):
         #if args.image is empty -> camera preview mode else still picture
         if args.image == "":
             self.enable_camera_preview = True
-            self.check_video_device()
+            if not args.videotestsrc:
+                self.check_video_device()
         else:
             self.enable_camera_preview = False
             self.still_picture_next = False
 
         #waiting for the ui cration before launching the main function
         ui_launched = self.main_ui_creation()
+        self.startup_stage("ui created")
         if ui_launched :
             self.main(args)
 
-    def setup_dcmipp(self):
-        config_cam = "media-ctl -d /dev/media0 --set-v4l2 \"\'ov5640 1-003c\':0[fmt:RGB565_2X8_LE/" + str(args.frame_width)  + "x" + str(args.frame_height) + "@1/" + str(args.framerate) + " field:none]\""
-        os.system(config_cam)
-
-        config_dcmipp_parallel = "media-ctl -d /dev/media0 --set-v4l2 \"\'dcmipp_parallel\':0[fmt:RGB565_2X8_LE/" + str(args.frame_width) + "x" + str(args.frame_height) + "]\""
-        os.system(config_dcmipp_parallel)
-
-        config_dcmipp_dump_postproc0 = "media-ctl -d /dev/media0 --set-v4l2 \"\'dcmipp_dump_postproc\':0[fmt:RGB565_2X8_LE/" + str(args.frame_width) + "x" + str(args.frame_height) +"]\"";
-        os.system(config_dcmipp_dump_postproc0)
-
-        config_dcmipp_dump_postproc1 = "media-ctl -d /dev/media0 --set-v4l2 \"\'dcmipp_dump_postproc\':1[fmt:RGB565_2X8_LE/" + str(args.frame_width) + "x" + str(args.frame_height) +"]\"";
-        os.system(config_dcmipp_dump_postproc1)
-
-        config_dcmipp_dump_postproc_crop = "media-ctl -d /dev/media0 --set-v4l2 \"\'dcmipp_dump_postproc\':1[crop:(0,0)/" + str(args.frame_width) + "x" + str(args.frame_height) + "]\"";
-        os.system(config_dcmipp_dump_postproc_crop)
-        self.dcmipp_camera = True
-        print("dcmipp congiguration passed ")
-
-    def check_video_device (self):
-        #Check the camera type to configure it if necessary
-        cmd = "cat /sys/class/video4linux/video" + str(args.video_device) + "/name"
-        camera_type = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE).communicate()[0]
-        dcmipp = 'dcmipp_dump_capture'
-        found = re.search(dcmipp,str(camera_type))
-        if found :
-            #dcmipp camera found
-            self.setup_dcmipp();
-            return True
-        else :
-            return False
+    def load_nn(self, model_file):
+        """
+        :return: NeuralNetwork of another model of the task, in camera
+                 preview mode (model ladder, hot reload)
+        """
+        if args.inference_server is not None:
+            nn = self.connect_inference_server(model_file, self.nn.get_postprocess())
+            if nn is not None:
+                return nn
+        return NeuralNetwork(model_file, args.label_file, float(args.input_mean), float(args.input_std),
+                             args.edgetpu, args.perf, args.ext_delegate, args.num_threads,
+                             True, self.nn.get_postprocess(), args.warmup_runs)
 
     def main_ui_creation(self):
         """
@@ -483,6 +240,10 @@ class MainUIWindow(Gtk.Window):
         self.connect('destroy', Gtk.main_quit)
         self.set_ui_param()
 
+        # pre-rendered texts drawn on top of the video preview
+        self.text_cache = TextCache(self.ui_cairo_font_size_label)
+        self.label_sprite = None
+
         # setup info_box containing inference results and ST_logo which is a
         # "next inference" button in still picture mode
         if self.enable_camera_preview == True:
@@ -547,7 +308,7 @@ class MainUIWindow(Gtk.Window):
             self.info_box.pack_start(self.acc,True,False,2)
 
         # setup video box containing gst stream in camera previex mode
-        # and a openCV picture in still picture mode
+        # and the still picture painted in the drawing area in still picture mode
         # An overlay is used to keep a gtk drawing area on top of the video stream
         self.video_box = Gtk.HBox()
         self.video_box.set_css_name("gui_main_video")
@@ -556,12 +317,8 @@ class MainUIWindow(Gtk.Window):
         self.overlay = Gtk.Overlay()
         if self.enable_camera_preview == True:
             # camera preview => gst stream
-            self.video_widget = GstWidget(self,self.nn)
+            self.video_widget = GstWidget(self, self.nn, args)
             self.overlay.add_overlay(self.video_widget)
-        else :
-            # still picture => openCV picture
-            self.image = Gtk.Image()
-            self.overlay.add_overlay(self.image)
         self.overlay.add_overlay(self.drawing_area)
         self.video_box.pack_start(self.overlay, True, True, 0)
 
@@ -584,13 +341,6 @@ class MainUIWindow(Gtk.Window):
         self.add(self.main_box)
         return True
 
-    def exit_icon_cb(self,eventbox, event):
-        """
-        Exit callback to close application
-        """
-        self.destroy()
-        Gtk.main_quit()
-
     def drawing(self, widget, cr):
         """
         Drawing callback used to draw with cairo on
@@ -609,84 +359,29 @@ class MainUIWindow(Gtk.Window):
                 else:
                     self.process_picture()
             return False
+        if self.enable_camera_preview == False:
+            # still picture painted under the texts and the boxes
+            self.draw_frame(cr)
         if (self.label_to_display == ""):
             # waiting screen
-            text = "Load nn_model"
-            cr.set_font_size(self.ui_cairo_font_size_label)
-            xbearing, ybearing, width, height, xadvance, yadvance = cr.text_extents(text)
-            cr.move_to((self.drawing_width/2-width/2),(self.drawing_height/2))
-            cr.text_path(text)
-            cr.set_source_rgb(0.235, 0.71, 0.90)
-            cr.fill_preserve()
-            cr.set_source_rgb(0.012, 0.137, 0.294)
-            cr.set_line_width(1)
-            cr.stroke()
+            text = self.text_cache.get(self.get_loading_text(), (0.235, 0.71, 0.90), (0.012, 0.137, 0.294))
+            text.paint_centered(cr, self.drawing_width/2, self.drawing_height/2)
             return True
         else :
-            cr.set_font_size(self.ui_cairo_font_size_label)
             self.label_printed = True
             if args.validation:
                 self.still_picture_next = True
             # running screen
-            xbearing, ybearing, width, height, xadvance, yadvance = cr.text_extents(self.label_to_display)
-            cr.move_to((self.drawing_width/2-width/2),((9/10)*self.drawing_height))
-            cr.text_path(self.label_to_display)
-            cr.set_source_rgb(1, 1, 1)
-            cr.fill_preserve()
-            cr.set_source_rgb(0, 0, 0)
-            cr.set_line_width(0.7)
-            cr.stroke()
+            self.get_label_sprite().paint_centered(cr, self.drawing_width/2, (9/10)*self.drawing_height)
             return True
 
-    def set_ui_param(self):
-        """
-        Setup all the UI parameter depending
-        on the screen size
-        """
-        self.ui_cairo_font_size_label = 50;
-        self.ui_cairo_font_size = 20;
-        self.ui_icon_exit_width = '50';
-        self.ui_icon_exit_height = '50';
-        self.ui_icon_st_width = '130';
-        self.ui_icon_st_height = '160';
-        if self.screen_height <= 272:
-               # Display 480x272 */
-               self.ui_cairo_font_size_label = 25;
-               self.ui_cairo_font_size = 8;
-               self.ui_icon_exit_width = '25';
-               self.ui_icon_exit_height = '25';
-               self.ui_icon_st_width = '42';
-               self.ui_icon_st_height = '52';
-        elif self.screen_height <= 480:
-               #Display 800x480 */
-               self.ui_cairo_font_size_label = 30;
-               self.ui_cairo_font_size = 13;
-               self.ui_icon_exit_width = '50';
-               self.ui_icon_exit_height = '50';
-               self.ui_icon_st_width = '65';
-               self.ui_icon_st_height = '80';
-
-    def valid_timeout_callback(self):
-        """
-        if timeout occurs that means that camera preview and the gtk is not
-        behaving as expected */
-        """
-        print("Timeout: camera preview and/or gtk is not behaving has expected\n");
-        self.destroy()
-        os._exit(1)
-
     def update_label_preview(self, label, accuracy, inference_time, display_fps, inference_fps):
         """
         Updating the labels and the inference infos displayed on the GUI interface - camera input
         """
         str_accuracy = str("{0:.0f}".format(accuracy))
-        str_inference_time = str("{0:0.1f}".format(inference_time))
-        str_display_fps = str("{0:.1f}".format(display_fps))
-        str_inference_fps = str("{0:.1f}".format(inference_fps))
-
-        self.inf_time.set_markup("<span font=\'%d\' color='#FFFFFFFF'><b>%sms\n</b></span>" % (self.ui_cairo_font_size,str_inference_time))
-        self.inf_fps.set_markup("<span font=\'%d\' color='#FFFFFFFF'><b>%sfps\n</b></span>" % (self.ui_cairo_font_size,str_inference_fps))
-        self.disp_fps.set_markup("<span font=\'%d\' color='#FFFFFFFF'><b>%sfps\n</b></span>" % (self.ui_cairo_font_size,str_display_fps))
+        # the labels are refreshed at the --ui_refresh_rate rate by the scheduler
+        self.label_scheduler.submit(inference_time, display_fps, inference_fps)
         self.label_to_display = label + " " + str_accuracy +"%"
 
         if args.validation:
@@ -704,14 +399,67 @@ class MainUIWindow(Gtk.Window):
                 print("avg display fps= " + str(avg_prev_fps))
                 print("avg inference fps= " + str(avg_inf_fps))
                 print("avg inference time= " + str(avg_inf_time) + " ms")
+                print(self.metrics.summary())
+                print(self.label_scheduler.summary())
+                print(self.results.summary())
+                if self.video_widget.frame_sync is not None:
+                    print(self.video_widget.frame_sync.summary())
+                print(self.video_widget.rendering_summary())
+                print(self.nn.warm_up_summary())
+                if self.rate_controller is not None:
+                    print(self.rate_controller.summary())
+                if self.scene_gate is not None:
+                    print(self.scene_gate.summary())
+                if self.model_ladder is not None:
+                    print(self.model_ladder.summary())
+                if self.model_reloader is not None:
+                    print(self.model_reloader.summary())
                 GLib.source_remove(self.valid_timeout_id)
                 self.destroy()
                 Gtk.main_quit()
 
+    def get_label_sprite(self):
+        """
+        :return: pre-rendered text of the label to display
+        """
+        return self.text_cache.get(self.label_to_display, (1, 1, 1), (0, 0, 0), 0.7)
+
+    def update_label_area(self):
+        """
+        invalidate the areas covered by the previous and the new label
+        """
+        if self.first_drawing_call:
+            return
+        sprite = self.get_label_sprite()
+        if sprite is self.label_sprite:
+            return
+        for text in (self.label_sprite, sprite):
+            if text is not None:
+                self.drawing_area.queue_draw_area(int(self.drawing_width/2 - text.width/2),
+                                                  int((9/10)*self.drawing_height + text.y_bearing),
+                                                  text.width + 1, text.height + 1)
+        self.label_sprite = sprite
+
+    def set_nn_results(self, results, pts):
+        """
+        store the classification result of a frame, called on the GTK thread
+        """
+        self.nn_result_accuracy = float(results[0])
+        self.nn_result_label = int(results[1])
+
+    def export_results(self, results, pts, source=None):
+        """
+        stream the classification result of a frame out of the application
+        if requested
+        """
+        if self.exporter is not None:
+            self.exporter.publish_classification(pts, int(results[1]),
+                                                 float(results[0]), source=source)
+
     def update_camera_preview(self):
         """
-        if the last inference is done grab a new frame from appsink
-        and update the inference results
+        update the UI with the last inference result, called by
+        results_ready_cb once per new result
         """
         # write information on the GTK UI
         labels = self.nn.get_labels()
@@ -725,9 +473,26 @@ class MainUIWindow(Gtk.Window):
             self.valid_preview_fps.append(round(self.video_widget.instant_fps))
             self.valid_inference_time.append(round(self.nn_inference_time * 1000, 4))
 
+        loading_screen = (self.label_to_display == "")
         self.update_label_preview(str(label), accuracy, inference_time, display_fps, inference_fps)
+        if loading_screen:
+            # remove the waiting screen
+            self.drawing_area.queue_draw()
+        self.update_label_area()
         return True
 
+    def render_label_preview(self, inference_time, display_fps, inference_fps):
+        """
+        format the inference infos displayed on the GUI interface - camera input
+        """
+        str_inference_time = str("{0:0.1f}".format(inference_time))
+        str_display_fps = str("{0:.1f}".format(display_fps))
+        str_inference_fps = str("{0:.1f}".format(inference_fps))
+
+        return ((self.inf_time, "<span font=\'%d\' color='#FFFFFFFF'><b>%sms\n</b></span>" % (self.ui_cairo_font_size,str_inference_time)),
+                (self.inf_fps, "<span font=\'%d\' color='#FFFFFFFF'><b>%sfps\n</b></span>" % (self.ui_cairo_font_size,str_inference_fps)),
+                (self.disp_fps, "<span font=\'%d\' color='#FFFFFFFF'><b>%sfps\n</b></span>" % (self.ui_cairo_font_size,str_display_fps)))
+
     def update_label_still(self, label, accuracy, inference_time):
         """
         update inference results in still picture mode
@@ -739,38 +504,6 @@ class MainUIWindow(Gtk.Window):
         self.acc.set_markup("<span font=\'%d\' color='#FFFFFFFF'><b>%s&#37;\n\n</b></span>" % (self.ui_cairo_font_size,str_accuracy))
         self.label_to_display = label
 
-    def update_frame(self, frame):
-        """
-        update frame in still picture mode
-        """
-        img = Image.fromarray(frame)
-        data = img.tobytes()
-        data = GLib.Bytes.new(data)
-        pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(data,
-                                                 GdkPixbuf.Colorspace.RGB,
-                                                 False,
-                                                 8,
-                                                 frame.shape[1],
-                                                 frame.shape[0],
-                                                 frame.shape[2] * frame.shape[1])
-        self.image.set_from_pixbuf(pixbuf.copy())
-
-    # get random file in a directory
-    def getRandomFile(self, path):
-        """
-        Returns a random filename, chosen among the files of the given path.
-        """
-        if len(self.files) == 0:
-            self.files = os.listdir(path)
-
-        if len(self.files) == 0:
-            return '';
-
-        index = random.randrange(0, len(self.files))
-        file_path = self.files[index]
-        self.files.pop(index)
-        return file_path
-
     def still_picture(self,  widget, event):
         """
         ST icon cb which trigger a new inference
@@ -791,7 +524,7 @@ class MainUIWindow(Gtk.Window):
         if self.still_picture_next and self.label_printed:
             # get randomly a picture in the directory
             rfile = self.getRandomFile(args.image)
-            img = Image.open(args.image + rfile)
+            img = Image.open(self.get_image_path(rfile))
             picture_width, picture_height = img.size
 
             # display the picture in the screen
@@ -803,21 +536,23 @@ class MainUIWindow(Gtk.Window):
             # if not fill the drawing space as possible
             if (frame_width > self.drawing_width):
                 frame_width = self.drawing_width
-            prev_frame = cv2.resize(np.array(img), (frame_width, frame_height))
+            # single copy of the picture shared by the preview and the inference
+            img_array = np.asarray(img)
+            prev_frame = cv2.resize(img_array, (frame_width, frame_height))
 
             # update the preview frame
             self.update_frame(prev_frame)
             self.label_printed = False
 
-            # execute the inference
-            nn_frame = cv2.resize(np.array(img), (nn_input_width, nn_input_height))
-            start_time = timer()
-            self.nn.launch_inference(nn_frame)
-            stop_time = timer()
+            # execute the inference, or replay its results from the
+            # prediction cache
+            results, self.nn_inference_time = self.infer_picture(self.nn, img_array,
+                                                                 self.get_image_path(rfile))
             self.still_picture_next = False;
-            self.nn_inference_time = stop_time - start_time
             self.nn_inference_fps = (1000/(self.nn_inference_time*1000))
-            self.nn_result_accuracy, self.nn_result_label = self.nn.get_results()
+            self.set_nn_results(results, -1)
+            self.export_results(results, -1, source=rfile)
+            self.first_result_done()
 
             # write information onf the GTK UI
             labels = self.nn.get_labels()
@@ -838,8 +573,9 @@ class MainUIWindow(Gtk.Window):
                 file_name = file_name.rsplit('_')[0]
                 # store the inference time in a list so that we can compute the
                 # average later on
-                if self.first_call :
-                    #skip first inference time to avoid warmup time in EdgeTPU mode
+                if self.first_call and args.warmup_runs <= 0 :
+                    #without warm-up phase, skip first inference time to avoid
+                    #warmup time in EdgeTPU mode
                     self.first_call = False
                 else :
                     self.valid_inference_time.append(round(self.nn_inference_time * 1000, 4))
@@ -872,6 +608,12 @@ class MainUIWindow(Gtk.Window):
             self.valid_timeout_id = GLib.timeout_add(35000,
                                                      self.valid_timeout_callback)
 
+        if args.metrics_port is not None and self.enable_camera_preview:
+            self.start_metrics_server()
+
+        if self.enable_camera_preview:
+            self.label_scheduler.start()
+
         if self.enable_camera_preview == False:
             # still picture
             # Check if image directory is empty
@@ -896,26 +638,13 @@ if __name__ == '__main__':
     # add signal to catch CRTL+C
     signal.signal(signal.SIGINT, signal.SIG_DFL)
 
-    #Tensorflow Lite NN intitalisation
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--image", default="", help="image directory with image to be classified")
-    parser.add_argument("-v", "--video_device", default=0, help="video device (default /dev/video0)")
-    parser.add_argument("--frame_width", default=320, help="width of the camera frame (default is 320)")
-    parser.add_argument("--frame_height", default=240, help="height of the camera frame (default is 240)")
-    parser.add_argument("--framerate", default=15, help="framerate of the camera (default is 15fps)")
-    parser.add_argument("-m", "--model_file", default="", help=".tflite model to be executed")
-    parser.add_argument("-l", "--label_file", default="", help="name of file containing labels")
-    parser.add_argument("-e", "--ext_delegate",default = None, help="external_delegate_library path")
-    parser.add_argument("-p", "--perf", default='std', choices= ['std', 'max'], help="[EdgeTPU ONLY] Select the performance of the Coral EdgeTPU")
-    parser.add_argument("--edgetpu", action='store_true', help="enable Coral EdgeTPU acceleration")
-    parser.add_argument("--input_mean", default=127.5, help="input mean")
-    parser.add_argument("--input_std", default=127.5, help="input standard deviation")
-    parser.add_argument("--validation", action='store_true', help="enable the validation mode")
-    parser.add_argument("--num_threads", default=None, help="Select the number of threads used by tflite interpreter to run inference")
-    args = parser.parse_args()
+    #init gstreamer
+    Gst.init(None)
+    startup.mark("modules imported")
+
 
     try:
-        win = MainUIWindow(args)
+        win = MainUIWindow(args, startup)
         win.connect("delete-event", Gtk.main_quit)
         win.connect("destroy", destroy_window)
         win.show_all()
@@ -11,398 +11,213 @@
 #
 # http://www.opensource.org/licenses/BSD-3-Clause
 
+import argparse
+import os
+import signal
+
+from tfl_common.startup_profile import StartupProfile
+
+startup = StartupProfile()
+
+def parse_args():
+    """
+    parse the command line, before the heavy imports so that --help and
+    the argument errors do not pay them
+    """
+    #Tensorflow Lite NN intitalisation
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--image", default="", help="image directory with image to be classified")
+    parser.add_argument("-v", "--video_device", default=0, help="video device (default /dev/video0)")
+    parser.add_argument("--frame_width", default=320, help="width of the camera frame (default is 320)")
+    parser.add_argument("--frame_height", default=240, help="height of the camera frame (default is 240)")
+    parser.add_argument("--framerate", default=15, help="framerate of the camera (default is 15fps)")
+    parser.add_argument("-m", "--model_file", default="", help=".tflite model to be executed")
+    parser.add_argument("-l", "--label_file", default="", help="name of file containing labels")
+    parser.add_argument("-e", "--ext_delegate",default = None, help="external_delegate_library path")
+    parser.add_argument("-p", "--perf", default='std', choices= ['std', 'max'], help="[EdgeTPU ONLY] Select the performance of the Coral EdgeTPU")
+    parser.add_argument("--edgetpu", action='store_true', help="enable Coral EdgeTPU acceleration")
+    parser.add_argument("--input_mean", default=127.5, help="input mean")
+    parser.add_argument("--input_std", default=127.5, help="input standard deviation")
+    parser.add_argument("--validation", action='store_true', help="enable the validation mode")
+    parser.add_argument("--num_threads", default=None, help="Select the number of threads used by tflite interpreter to run inference")
+    parser.add_argument("--maximum_detection", default=10, type=int, help="Adjust the maximum number of object detected in a frame accordingly to your NN model (default is 10)")
+    parser.add_argument("--threshold", default=0.60, type=float, help="threshold of accuracy above which the boxes are displayed (default 0.60)")
+    parser.add_argument("--metrics_port", default=None, type=int, help="expose the pipeline metrics as Prometheus text on 127.0.0.1:<port> (camera preview mode only)")
+    parser.add_argument("--ui_refresh_rate", default=4, type=float, help="refresh rate in Hz of the inference information labels, 0 to refresh them on each inference (default 4)")
+    parser.add_argument("--videotestsrc", action='store_true', help="use a GStreamer test pattern instead of the camera")
+    parser.add_argument("--split_process", action='store_true', help="run the inference in a separate process fed through shared memory (camera preview mode only)")
+    parser.add_argument("--cascade_model", default=None, help="image classification .tflite model run on the detected objects")
+    parser.add_argument("--cascade_label_file", default="", help="name of file containing the labels of the --cascade_model")
+    parser.add_argument("--cascade_max_crops", default=3, type=int, help="maximum number of objects classified per frame by the --cascade_model (default 3)")
+    parser.add_argument("--auto_delegate", nargs='*', default=None, metavar="DELEGATE", help="benchmark the model on the CPU with several numbers of threads, the --ext_delegate, the given external delegate libraries and the Edge TPU, and use the fastest. The decision is stored per model")
+    parser.add_argument("--warmup_runs", default=3, type=int, help="number of dummy inferences run before processing the frames, 0 to disable (default 3)")
+    parser.add_argument("--target_fps", default=None, type=float, help="display fps to reach by adapting the inference stride and threads (camera preview mode only)")
+    parser.add_argument("--scene_gate", nargs='?', const=0.02, default=None, type=float, metavar="THRESHOLD", help="skip the inference of the frames which differ from the last inferred frame by less than THRESHOLD (mean block intensity difference between 0 and 1, default 0.02) and reuse its results (camera preview mode only)")
+    parser.add_argument("--scene_gate_refresh", default=1000, type=float, help="maximal age in ms of the results reused by --scene_gate (default 1000)")
+    parser.add_argument("--sync_display", action='store_true', help="display the camera frames matching the last inference result instead of the live frames (camera preview mode only)")
+    parser.add_argument("--max_display_latency", default=200, type=float, help="maximal latency in ms added by --sync_display, the live frames are displayed beyond (default 200)")
+    parser.add_argument("--overlay_mode", default="gtk", choices=['gtk', 'pipeline'], help="draw the boxes on a GTK drawing area over the video (gtk) or on the frames inside the GStreamer pipeline with a cairooverlay element (pipeline) (camera preview mode only, default gtk)")
+    parser.add_argument("--display_sink", default="gtk", choices=['gtk', 'wayland', 'kms', 'fake'], help="sink displaying the camera frames: gtksink in the UI, waylandsink or kmssink in full screen behind the UI, or fakesink to measure the throughput without display (camera preview mode only, default gtk)")
+    parser.add_argument("--affinity", nargs='+', default=None, metavar="ROLE:CPUS[:nice=N|fifo=P]", help="place the inference, streaming and ui threads on core sets with optional nice or SCHED_FIFO priorities, for instance inference:0 streaming:1 ui:1:nice=5, the achieved placement and the context switches are reported at exit")
+    parser.add_argument("--telemetry", nargs='?', const="", default=None, help="sample the SoC temperatures, the cpu frequencies and the CPU load during the run, print them at exit with the inference latency by frequency and by temperature, and store the samples and the latencies in the optional .json file")
+    parser.add_argument("--telemetry_interval", default=1.0, type=float, help="sampling period in seconds of --telemetry (default 1.0)")
+    parser.add_argument("--model_ladder", nargs='+', default=None, metavar="MODEL", help="lighter .tflite models of the same task, from the heaviest to the lightest, used instead of the --model_file when its inference latency exceeds the --latency_budget (camera preview mode only)")
+    parser.add_argument("--latency_budget", default=None, type=float, help="per frame inference latency budget in ms of --model_ladder (default one frame period)")
+    parser.add_argument("--ladder_lazy", action='store_true', help="load the --model_ladder models on first use instead of at startup")
+    parser.add_argument("--hot_reload", action='store_true', help="reload the --model_file without stopping the camera when it or the --label_file change, or when the application receives SIGUSR1 (camera preview mode only)")
+    parser.add_argument("--reload_interval", default=2.0, type=float, help="polling period in seconds of the files watched by --hot_reload (default 2.0)")
+    parser.add_argument("--inference_server", nargs='?', const="", default=None, metavar="SOCKET", help="run the inferences in the local inference server shared with other applications (python3 -m tfl_common.inference_server) listening on the optional Unix socket (default /tmp/tflite-inference.sock), the model runs in the application if the server is not available")
+    parser.add_argument("--low_memory", action='store_true', help="reduce the memory footprint by reusing the frame buffers and avoiding intermediate copies")
+    parser.add_argument("--memory_stats", action='store_true', help="trace the python allocations and print the memory footprint of each stage at exit")
+    parser.add_argument("--export", default=None, help="stream the inference results to jsonl:<file>, bin:<file> or unix:<socket path>[#topic]")
+    parser.add_argument("--evaluate", nargs='?', const="", default=None, help="still picture mode: compute the per class AP and the mAP of the model on the --image directory against its .json files, and store the raw predictions in the optional .npz file")
+    parser.add_argument("--prediction_cache", default=None, help="still picture mode: directory caching the inference results of the pictures, replayed while the model and its configuration are unchanged")
+    parser.add_argument("--startup_profile", action='store_true', help="print the duration of the startup phases and the import time of the modules")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    startup.mark("arguments parsed")
+    if args.startup_profile:
+        startup.trace_imports()
+
 import gi
 gi.require_version('Gtk', '3.0')
 gi.require_version('Gst', '1.0')
 from gi.repository import Gtk
 from gi.repository import Gdk
 from gi.repository import GLib
-from gi.repository import GdkPixbuf
 from gi.repository import Gst
 
 import numpy as np
-import argparse
-import signal
-import os
-import random
-import json
-import subprocess
-import re
 import os.path
-from os import path
-import cv2
-from PIL import Image
-import tflite_runtime.interpreter as tflr
-from timeit import default_timer as timer
-
-#init gstreamer
-Gst.init(None)
-Gst.init_check(None)
+from tfl_common.memory_stats import LazyModule
+from tfl_common.neural_network import NeuralNetwork, DetectionPostProcess, ClassificationPostProcess
+from tfl_common.gst_widget import GstWidget
+from tfl_common.ui_window import BaseUIWindow
+from tfl_common.ui_scheduler import LabelUpdateScheduler
+from tfl_common.overlay import DetectionOverlay, PipelineOverlay, TextCache
+
+# modules only needed by some modes are imported on first use, OpenCV
+# and PIL are only needed in still picture mode
+cv2 = LazyModule("cv2")
+Image = LazyModule("PIL.Image")
+result_export = LazyModule("tfl_common.result_export")
+cascade = LazyModule("tfl_common.cascade")
+json = LazyModule("json")
+detection_eval = LazyModule("tfl_common.detection_eval")
 #init global variables
 char_text_width = 6
-nn_input_width = 0
-nn_input_height = 0
-nn_input_channel = 0
-
-LIBTPU_STD_PATH = "/usr/lib/libedgetpu-std.so.2"
-LIBTPU_MAX_PATH = "/usr/lib/libedgetpu-max.so.2"
 
 RESOURCES_DIRECTORY = os.path.abspath(os.path.dirname(__file__)) + "/resources/"
 
-class NeuralNetwork:
-    """
-    Class that handles Neural Network inference
-    """
-
-    def __init__(self, model_file, label_file, input_mean, input_std, edgetpu, perf, ext_delegate):
-        """
-        :param model_path: .tflite model to be executedname of file containing labels")
-        :param label_file:  name of file containing labels
-        :param input_mean: input_mean
-        :param input_std: input standard deviation
-        """
-
-        if args.num_threads == None :
-            if os.cpu_count() <= 1:
-                self.number_threads = 1
-            else :
-                # one core is always reserved for video display
-                if args.image == "":
-                    self.number_threads = os.cpu_count() - 1
-                else :
-                    self.number_threads = os.cpu_count()
-        else :
-           self.number_threads = int(args.num_threads)
-
-        self._selected_delegate = None
-
-        def load_labels(filename):
-            my_labels = []
-            input_file = open(filename, 'r')
-            for l in input_file:
-                my_labels.append(l.strip())
-            return my_labels
-
-        self._model_file = model_file
-        self._label_file = label_file
-        self._input_mean = input_mean
-        self._input_std = input_std
-        self._floating_model = False
-
-        if edgetpu is True:
-            #Check if the Edge TPU is connected
-            edge_tpu = False
-            device_re = re.compile(".+?ID\s(?P<id>\w+)", re.I)
-            lsusb = subprocess.check_output("lsusb").decode("utf-8")
-            for i in lsusb.split('\n'):
-                if i:
-                    info = device_re.match(i)
-                    if info:
-                        d = info.groupdict()
-                        if '1a6e' in d.values() or '18d1' in d.values():
-                            edge_tpu = True
-
-            if not edge_tpu:
-                print("Edge TPU is not plugged!")
-                print("Please connect the Edge TPU and try again.")
-                os._exit(1)
-
-            if perf == 'std':
-                if path.exists(LIBTPU_STD_PATH):
-                    self._selected_delegate = LIBTPU_STD_PATH
-                else :
-                    print("No delegate ",LIBTPU_STD_PATH, "found fall back on CPU mode")
-            elif perf == 'max':
-                if path.exists(LIBTPU_MAX_PATH):
-                    self._selected_delegate = LIBTPU_MAX_PATH
-                else :
-                    print("No delegate ",LIBTPU_MAX_PATH, "found fall back on CPU mode")
+class MainUIWindow(BaseUIWindow):
+    UI_FONT_SIZES = ((35, 20), (15, 7), (25, 13))
 
-        elif ext_delegate is not None :
-            if path.exists(ext_delegate):
-                self._selected_delegate = ext_delegate
-            else :
-                print("No delegate ",ext_delegate, "found fall back on CPU mode")
-
-        if self._selected_delegate is not None:
-            print('Loading external delegate from {}'.format(self._selected_delegate))
-            print("number of threads used in tflite interpreter : ",self.number_threads)
-            self._interpreter = tflr.Interpreter(model_path=self._model_file,
-                                                 num_threads = self.number_threads,
-                                                 experimental_delegates=[tflr.load_delegate(self._selected_delegate)])
-        else :
-            print("no delegate to use, CPU mode activated")
-            self._interpreter = tflr.Interpreter(model_path=self._model_file,
-                                                 num_threads = self.number_threads)
-
-        self._interpreter.allocate_tensors()
-        self._input_details = self._interpreter.get_input_details()
-        self._output_details = self._interpreter.get_output_details()
-
-        # check the type of the input tensor
-        if self._input_details[0]['dtype'] == np.float32:
-            self._floating_model = True
-            print("Floating point Tensorflow Lite Model")
-
-        self._labels = load_labels(self._label_file)
-
-    def __getstate__(self):
-        return (self._model_file, self._label_file, self._input_mean,
-                self._input_std, self._floating_model, self._selected_delegate, self.number_threads, \
-                self._input_details, self._output_details, self._labels)
-
-    def __setstate__(self, state):
-        self._model_file, self._label_file, self._input_mean, \
-                self._input_std, self._floating_model, self._selected_delegate, self.number_threads, \
-                self._input_details, self._output_details, self._labels = state
-
-        if self._selected_delegate is not None:
-            self._interpreter = tflr.Interpreter(model_path=self._model_file,
-                                                 num_threads = self.number_threads,
-                                                 experimental_delegates=[tflr.load_delegate(self._selected_delegate)])
-        else :
-            self._interpreter = tflr.Interpreter(model_path=self._model_file,
-                                                 num_threads = self.number_threads)
-        self._interpreter.allocate_tensors()
-
-    def get_labels(self):
-        return self._labels
-
-    def get_img_size(self):
+    def __init__(self, args, startup=None):
         """
-        :return: size of NN input image size
+        Setup instances of class and shared variables
+        usefull for the application
         """
-        # NxHxWxC, H:1, W:2, C:3
-        return (int(self._input_details[0]['shape'][1]),
-                int(self._input_details[0]['shape'][2]),
-                int(self._input_details[0]['shape'][3]))
+        BaseUIWindow.__init__(self, args, startup)
+
+        # optional placement of the threads on core sets
+        if args.affinity is not None:
+            self.start_thread_placement()
+
+        # optional thermal and cpu frequency telemetry
+        if args.telemetry is not None:
+            self.start_telemetry()
+
+        # optional benchmark of the execution configurations of the model
+        if args.auto_delegate is not None:
+            self.select_delegate()
+
+        # optional second stage classifying the detected objects on the
+        # frame prepared for the detector
+        self.cascade = None
+        postprocess = DetectionPostProcess()
+        if args.cascade_model is not None:
+            classifier = NeuralNetwork(args.cascade_model, args.cascade_label_file, float(args.input_mean), float(args.input_std),
+                                       args.edgetpu, args.perf, args.ext_delegate, args.num_threads,
+                                       args.image == "", ClassificationPostProcess())
+            self.cascade = cascade.CascadePostProcess(classifier, args.cascade_max_crops, args.threshold)
+            postprocess = self.cascade
+
+        # initialize NeuralNetwork object, or the client of the inference
+        # server shared with other applications
+        self.nn = None
+        if args.inference_server is not None:
+            self.nn = self.connect_inference_server(args.model_file, postprocess)
+        if self.nn is None:
+            self.nn = NeuralNetwork(args.model_file, args.label_file, float(args.input_mean), float(args.input_std),
+                                    args.edgetpu, args.perf, args.ext_delegate, args.num_threads,
+                                    args.image == "", postprocess, args.warmup_runs)
+        self.shape = self.nn.get_img_size()
+        self.startup_stage("nn loaded")
 
-    def launch_inference(self, img):
-        """
-        This method launches inference using the invoke call
-        :param img: the image to be inferenced
-        """
-        # add N dim
-        input_data = np.expand_dims(img, axis=0)
+        # optional inference process exchanging frames and results through
+        # shared memory (camera preview mode only)
+        if args.split_process and args.image == "":
+            self.start_inference_process(self.nn)
+        # camera preview mode: warm-up in background behind the warm-up screen
+        self.warm_up_nn(self.nn, args.image == "")
 
-        if self._floating_model:
-            input_data = (np.float32(input_data) - self._input_mean) / self._input_std
+        # optional adaptation of the inference workload to the display fps
+        if args.target_fps is not None and args.image == "":
+            self.start_rate_controller(self.nn)
 
-        self._interpreter.set_tensor(self._input_details[0]['index'], input_data)
-        self._interpreter.invoke()
+        # optional switch to lighter models to meet the latency budget
+        if args.model_ladder is not None and args.image == "":
+            self.start_model_ladder(self.nn, self.load_nn)
 
-    def get_results(self):
-        # display output results
-        locations = self._interpreter.get_tensor(self._output_details[0]['index'])
-        classes   = self._interpreter.get_tensor(self._output_details[1]['index'])
-        scores    = self._interpreter.get_tensor(self._output_details[2]['index'])
-        return (locations, classes, scores)
+        # optional reload of the model while the pipeline runs
+        if args.hot_reload and args.image == "":
+            self.start_model_reloader(self.load_nn)
 
-class GstWidget(Gtk.Box):
-    """
-    Class that handles Gstreamer pipeline using gtksink and appsink
-    """
-    def __init__(self, window, nn):
-         super().__init__()
-         # connect the gtkwidget with the realize callback
-         self.connect('realize', self._on_realize)
-         self.instant_fps = 0
-         self.window = window
-         self.nn = nn
-
-    def _on_realize(self, widget):
-            """
-            creation of the gstreamer pipeline when gstwidget is created
-            """
-            # gstreamer pipeline creation
-            self.pipeline = Gst.Pipeline()
-
-            # creation of the source v4l2src
-            self.v4lsrc1 = Gst.ElementFactory.make("v4l2src", "source")
-            video_device = "/dev/video" + str(args.video_device)
-            self.v4lsrc1.set_property("device", video_device)
-
-            #creation of the v4l2src caps
-            if self.window.dcmipp_camera :
-                caps = "video/x-raw,format = RGB16, width=" + str(args.frame_width) +",height=" + str(args.frame_height) + ", framerate=" + str(args.framerate)+ "/1"
-            else:
-                caps = "video/x-raw, width=" + str(args.frame_width) +",height=" + str(args.frame_height) + ", framerate=" + str(args.framerate)+ "/1"
-            camera1caps = Gst.Caps.from_string(caps)
-            self.camerafilter1 = Gst.ElementFactory.make("capsfilter", "filter1")
-            self.camerafilter1.set_property("caps", camera1caps)
-
-            # creation of the videoconvert elements
-            self.videoformatconverter1 = Gst.ElementFactory.make("videoconvert", "video_convert1")
-            self.videoformatconverter2 = Gst.ElementFactory.make("videoconvert", "video_convert2")
-
-            self.tee = Gst.ElementFactory.make("tee", "tee")
-
-            # creation and configuration of the queue elements
-            self.queue1 = Gst.ElementFactory.make("queue", "queue-1")
-            self.queue2 = Gst.ElementFactory.make("queue", "queue-2")
-            self.queue1.set_property("max-size-buffers", 1)
-            self.queue1.set_property("leaky", 2)
-            self.queue2.set_property("max-size-buffers", 1)
-            self.queue2.set_property("leaky", 2)
-
-            # creation and configuration of the appsink element
-            self.appsink = Gst.ElementFactory.make("appsink", "appsink")
-            nn_caps = "video/x-raw, format = RGB, width=" + str(nn_input_width) + ",height=" + str(nn_input_height)
-            nncaps = Gst.Caps.from_string(nn_caps)
-            self.appsink.set_property("caps", nncaps)
-            self.appsink.set_property("emit-signals", True)
-            self.appsink.set_property("sync", False)
-            self.appsink.set_property("max-buffers", 1)
-            self.appsink.set_property("drop", True)
-            self.appsink.connect("new-sample", self.new_sample)
-
-            # creation of the gtksink element to handle the gestreamer video stream
-            self.gtksink = Gst.ElementFactory.make("gtksink")
-            self.pack_start(self.gtksink.props.widget, True, True, 0)
-            self.gtksink.props.widget.show()
-
-            # creation and configuration of the fpsdisplaysink element to measure display fps
-            self.fps_disp_sink = Gst.ElementFactory.make("fpsdisplaysink", "fpsmeasure1")
-            self.fps_disp_sink.set_property("signal-fps-measurements", True)
-            self.fps_disp_sink.set_property("fps-update-interval", 2000)
-            self.fps_disp_sink.set_property("text-overlay", False)
-            self.fps_disp_sink.set_property("video-sink", self.gtksink)
-            self.fps_disp_sink.connect("fps-measurements",self.get_fps_display)
-
-            # creation of the video rate and video scale elements
-            self.video_rate = Gst.ElementFactory.make("videorate", "video-rate")
-            self.video_scale = Gst.ElementFactory.make("videoscale", "video-scale")
-
-            # Add all elements to the pipeline
-            self.pipeline.add(self.v4lsrc1)
-            self.pipeline.add(self.camerafilter1)
-            self.pipeline.add(self.videoformatconverter1)
-            self.pipeline.add(self.videoformatconverter2)
-            self.pipeline.add(self.tee)
-            self.pipeline.add(self.queue1)
-            self.pipeline.add(self.queue2)
-            self.pipeline.add(self.appsink)
-            self.pipeline.add(self.fps_disp_sink)
-            self.pipeline.add(self.video_rate)
-            self.pipeline.add(self.video_scale)
-
-            # linking elements together
-            #                              -> queue 1 -> videoconvert -> fpsdisplaysink
-            # v4l2src -> video rate -> tee
-            #                              -> queue 2 -> videoconvert -> video scale -> appsink
-            self.v4lsrc1.link(self.video_rate)
-            self.video_rate.link(self.camerafilter1)
-            self.camerafilter1.link(self.tee)
-            self.queue1.link(self.videoformatconverter1)
-            self.videoformatconverter1.link(self.fps_disp_sink)
-            self.queue2.link(self.videoformatconverter2)
-            self.videoformatconverter2.link(self.video_scale)
-            self.video_scale.link(self.appsink)
-            self.tee.link(self.queue1)
-            self.tee.link(self.queue2)
-
-            # set pipeline playing mode
-            self.pipeline.set_state(Gst.State.PLAYING)
-            # getting pipeline bus
-            self.bus = self.pipeline.get_bus()
-            self.bus.add_signal_watch()
-            self.bus.connect('message::error', self.msg_error_cb)
-            self.bus.connect('message::eos', self.msg_eos_cb)
-            self.bus.connect('message::info', self.msg_info_cb)
-            self.bus.connect('message::application', self.msg_application_cb)
-
-            Gst.debug_bin_to_dot_file(self.pipeline, Gst.DebugGraphDetails.ALL,
-                                           "pipeline")
-
-    def msg_eos_cb(self, bus, message):
-        print('eos message -> {}'.format(message))
-
-    def msg_info_cb(self, bus, message):
-        print('info message -> {}'.format(message))
-
-    def msg_error_cb(self, bus, message):
-        print('error message -> {}'.format(message.parse_error()))
-
-    def msg_application_cb(self, bus, message):
-        if message.get_structure().get_name() == 'inference-done':
-            self.window.update_camera_preview()
-            self.window.queue_draw()
-
-    def gst_to_opencv(self,sample):
-        """
-        convertion of the gstreamer frame buffer into numpy array
-        """
-        buf = sample.get_buffer()
-        caps = sample.get_caps()
-        arr = np.ndarray(
-            (caps.get_structure(0).get_value('height'),
-             caps.get_structure(0).get_value('width'),
-             3),
-            buffer=buf.extract_dup(0, buf.get_size()),
-            dtype=np.uint8)
-        return arr
-
-    def new_sample(self,*data):
-        """
-        recover video frame from appsink
-        and run inference
-        """
-        global image_arr
-        sample = self.appsink.emit("pull-sample")
-        arr = self.gst_to_opencv(sample)
-        if arr is not None :
-            start_time = timer()
-            self.nn.launch_inference(arr)
-            stop_time = timer()
-            self.window.nn_inference_time = stop_time - start_time
-            self.window.nn_inference_fps = (1000/(self.window.nn_inference_time*1000))
-            self.window.nn_result_locations[:, :, :], self.window.nn_result_classes[:, :], self.window.nn_result_scores[:, :] = self.nn.get_results()
-            struc = Gst.Structure.new_empty("inference-done")
-            msg = Gst.Message.new_application(None, struc)
-            self.bus.post(msg)
-        return Gst.FlowReturn.OK
-
-    def get_fps_display(self,fpsdisplaysink,fps,droprate,avgfps):
-        """
-        measure and recover display fps
-        """
-        self.instant_fps = fps
-        return self.instant_fps
-
-class MainUIWindow(Gtk.Window):
-    def __init__(self, args):
-        """
-        Setup instances of class and shared variables
-        usefull for the application
-        """
-        Gtk.Window.__init__(self)
-
-        # initialize NeuralNetwork object
-        self.nn = NeuralNetwork(args.model_file, args.label_file, float(args.input_mean), float(args.input_std), args.edgetpu, args.perf, args.ext_delegate)
-        self.shape = self.nn.get_img_size()
-        global nn_input_width
-        global nn_input_height
-        global nn_input_channel
-        nn_input_width = self.shape[1]
-        nn_input_height = self.shape[0]
-        nn_input_channel = self.shape[2]
+        # optional reuse of the results while the scene does not change
+        if args.scene_gate is not None and args.image == "":
+            self.start_scene_gate()
 
         #define shared variables
         self.nn_inference_time = 0.0
         self.nn_inference_fps = 0.0
+        self.label_scheduler = LabelUpdateScheduler(self.render_label_preview, args.ui_refresh_rate)
+        self.connect("destroy", self.stop_label_scheduler)
+
+        # optional streaming of the inference results out of the application
+        if args.export is not None:
+            self.exporter = result_export.create_exporter(args.export, self.nn.get_labels(), args.threshold)
+            self.connect("destroy", self.close_exporter)
+
+        # optional replay of the results of the pictures already inferred
+        # (still picture mode only)
+        if args.prediction_cache is not None and args.image != "":
+            if self.cascade is not None:
+                # the classification of the objects depends on the
+                # classifier and on the detection threshold
+                self.start_prediction_cache(self.nn, [args.model_file, args.cascade_model],
+                                            {"cascade": self.cascade.classifier.get_config(),
+                                             "cascade_max_crops": self.cascade.max_crops,
+                                             "threshold": args.threshold})
+            else:
+                self.start_prediction_cache(self.nn, [args.model_file])
+
+        # optional accuracy evaluation against the .json files of the
+        # pictures (still picture mode only)
+        self.evaluator = None
+        if args.evaluate is not None and args.image != "":
+            self.evaluator = detection_eval.DetectionEvaluator()
         self.nn_result_label = 0
 
         self.nn_result_locations = np.reshape(np.zeros((args.maximum_detection, 4)), (1, 10, 4))
         self.nn_result_classes = np.reshape(np.zeros(args.maximum_detection), (1, 10))
         self.nn_result_scores = np.reshape(np.zeros(args.maximum_detection), (1, 10))
+        self.nn_result_crop_classes = np.full((1, args.maximum_detection), -1, dtype=np.int32)
+        self.nn_result_crop_scores = np.zeros((1, args.maximum_detection), dtype=np.float32)
 
         self.exit_app = False
-        self.dcmipp_camera = False
         self.first_call = True
-
-        # initialize the list of the file to be processed (used with the
-        # --image parameter)
-        self.files = []
         self.label_to_display = ""
 
         # initialize the list of inference/display time to process the average
@@ -416,7 +231,8 @@ class MainUIWindow(Gtk.Window):
         if args.image == "":
             print("camera preview mode activate")
             self.enable_camera_preview = True
-            self.check_video_device()
+            if not args.videotestsrc:
+                self.check_video_device()
         else:
             print("still picture mode activate")
             self.enable_camera_preview = False
@@ -424,39 +240,22 @@ class MainUIWindow(Gtk.Window):
 
         #waiting for the ui cration before launching the main function
         ui_launched = self.main_ui_creation()
+        self.startup_stage("ui created")
         if ui_launched :
             self.main(args)
 
-    def setup_dcmipp(self):
-        config_cam = "media-ctl -d /dev/media0 --set-v4l2 \"\'ov5640 1-003c\':0[fmt:RGB565_2X8_LE/" + str(args.frame_width)  + "x" + str(args.frame_height) + "@1/" + str(args.framerate) + " field:none]\""
-        os.system(config_cam)
-
-        config_dcmipp_parallel = "media-ctl -d /dev/media0 --set-v4l2 \"\'dcmipp_parallel\':0[fmt:RGB565_2X8_LE/" + str(args.frame_width) + "x" + str(args.frame_height) + "]\""
-        os.system(config_dcmipp_parallel)
-
-        config_dcmipp_dump_postproc0 = "media-ctl -d /dev/media0 --set-v4l2 \"\'dcmipp_dump_postproc\':0[fmt:RGB565_2X8_LE/" + str(args.frame_width) + "x" + str(args.frame_height) +"]\"";
-        os.system(config_dcmipp_dump_postproc0)
-
-        config_dcmipp_dump_postproc1 = "media-ctl -d /dev/media0 --set-v4l2 \"\'dcmipp_dump_postproc\':1[fmt:RGB565_2X8_LE/" + str(args.frame_width) + "x" + str(args.frame_height) +"]\"";
-        os.system(config_dcmipp_dump_postproc1)
-
-        config_dcmipp_dump_postproc_crop = "media-ctl -d /dev/media0 --set-v4l2 \"\'dcmipp_dump_postproc\':1[crop:(0,0)/" + str(args.frame_width) + "x" + str(args.frame_height) + "]\"";
-        os.system(config_dcmipp_dump_postproc_crop)
-        self.dcmipp_camera = True
-        print("dcmipp congiguration passed ")
-
-    def check_video_device (self):
-        #Check the camera type to configure it if necessary
-        cmd = "cat /sys/class/video4linux/video" + str(args.video_device) + "/name"
-        camera_type = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE).communicate()[0]
-        dcmipp = 'dcmipp_dump_capture'
-        found = re.search(dcmipp,str(camera_type))
-        if found :
-            #dcmipp camera found
-            self.setup_dcmipp();
-            return True
-        else :
-            return False
+    def load_nn(self, model_file):
+        """
+        :return: NeuralNetwork of another model of the task, in camera
+                 preview mode (model ladder, hot reload)
+        """
+        if args.inference_server is not None:
+            nn = self.connect_inference_server(model_file, self.nn.get_postprocess())
+            if nn is not None:
+                return nn
+        return NeuralNetwork(model_file, args.label_file, float(args.input_mean), float(args.input_std),
+                             args.edgetpu, args.perf, args.ext_delegate, args.num_threads,
+                             True, self.nn.get_postprocess(), args.warmup_runs)
 
     def main_ui_creation(self):
         """
@@ -485,6 +284,26 @@ class MainUIWindow(Gtk.Window):
         self.connect('destroy', Gtk.main_quit)
         self.set_ui_param()
 
+        # pre-rendered texts and boxes drawn on top of the video preview
+        self.loading_text = TextCache(self.ui_cairo_font_size_label*1.5)
+        self.boxes_overlay = DetectionOverlay(self.ui_cairo_font_size_label,
+                                              self.ui_cairo_font_size/2,
+                                              int((args.maximum_detection)/2))
+        # boxes drawn inside the pipeline, on the frames at the camera
+        # resolution, the fonts are scaled accordingly
+        self.pipeline_overlay = None
+        if self.enable_camera_preview and args.overlay_mode == "gtk" and args.display_sink != "gtk":
+            # the drawing area is only stacked over a gtksink video
+            print("the " + args.display_sink + " display sink draws the boxes inside the pipeline")
+            args.overlay_mode = "pipeline"
+        if self.enable_camera_preview and args.overlay_mode == "pipeline":
+            scale = float(args.frame_height) / self.screen_height
+            sub_labels = self.cascade.get_labels() if self.cascade is not None else None
+            self.pipeline_overlay = PipelineOverlay(self.results, self.nn.get_labels(), args.threshold,
+                                                    max(8, self.ui_cairo_font_size_label * scale),
+                                                    max(4, self.ui_cairo_font_size / 2 * scale),
+                                                    int((args.maximum_detection)/2), sub_labels)
+
         # setup info_box containing inference results and ST_logo which is a
         # "next inference" button in still picture mode
         if self.enable_camera_preview == True:
@@ -542,7 +361,7 @@ class MainUIWindow(Gtk.Window):
             self.info_box.pack_start(self.inf_time,False,False,20)
 
         # setup video box containing gst stream in camera previex mode
-        # and a openCV picture in still picture mode
+        # and the still picture painted in the drawing area in still picture mode
         # An overlay is used to keep a gtk drawing area on top of the video stream
         self.video_box = Gtk.HBox()
         self.video_box.set_css_name("gui_main_video")
@@ -551,12 +370,8 @@ class MainUIWindow(Gtk.Window):
         self.overlay = Gtk.Overlay()
         if self.enable_camera_preview == True:
             # camera preview => gst stream
-            self.video_widget = GstWidget(self,self.nn)
+            self.video_widget = GstWidget(self, self.nn, args, self.pipeline_overlay)
             self.overlay.add_overlay(self.video_widget)
-        else :
-            # still picture => openCV picture
-            self.image = Gtk.Image()
-            self.overlay.add_overlay(self.image)
         self.overlay.add_overlay(self.drawing_area)
         self.video_box.pack_start(self.overlay, True, True, 0)
 
@@ -579,13 +394,6 @@ class MainUIWindow(Gtk.Window):
         self.add(self.main_box)
         return True
 
-    def exit_icon_cb(self,eventbox, event):
-        """
-        Exit callback to close application
-        """
-        self.destroy()
-        Gtk.main_quit()
-
     def drawing(self, widget, cr):
         """
         Drawing callback used to draw with cairo on
@@ -595,132 +403,51 @@ class MainUIWindow(Gtk.Window):
             self.first_drawing_call = False
             self.drawing_width = widget.get_allocated_width()
             self.drawing_height = widget.get_allocated_height()
-            cr.set_font_size(self.ui_cairo_font_size_label)
             self.boxes_printed = True
+            if self.enable_camera_preview == True:
+                preview_ratio = float(args.frame_width)/float(args.frame_height)
+                preview_height = self.drawing_height
+                preview_width =  preview_ratio * preview_height
+                if preview_width >= self.drawing_width:
+                   preview_width = self.drawing_width
+                   offset = 0
+                else :
+                    offset = (self.drawing_width - preview_width)/2
+                self.boxes_overlay.set_geometry(preview_width, preview_height, offset)
             if self.enable_camera_preview == False :
                 self.still_picture_next = True
-                if args.validation:
+                if args.validation or self.evaluator is not None:
                     GLib.idle_add(self.process_picture)
                 else:
                     self.process_picture()
             return False
+        if self.enable_camera_preview == False:
+            # still picture painted under the texts and the boxes
+            self.draw_frame(cr)
         if (self.label_to_display == ""):
             # waiting screen
-            text = "Loading NN model"
-            cr.set_font_size(self.ui_cairo_font_size_label*1.5)
-            xbearing, ybearing, width, height, xadvance, yadvance = cr.text_extents(text)
-            cr.move_to((self.drawing_width/2-width/2),(self.drawing_height/2))
-            cr.text_path(text)
-            cr.set_source_rgb(0.235, 0.71, 0.90)
-            cr.fill_preserve()
-            cr.set_source_rgb(0.012, 0.137, 0.294)
-            cr.set_line_width(1)
-            cr.stroke()
+            text = self.loading_text.get(self.get_loading_text(), (0.235, 0.71, 0.90), (0.012, 0.137, 0.294))
+            text.paint_centered(cr, self.drawing_width/2, self.drawing_height/2)
             return True
         else :
-            cr.set_font_size(self.ui_cairo_font_size_label)
-            if self.enable_camera_preview == True:
-                preview_ratio = float(args.frame_width)/float(args.frame_height)
-                preview_height = self.drawing_height
-                preview_width =  preview_ratio * preview_height
-                if preview_width >= self.drawing_width:
-                   preview_width = self.drawing_width
-                   offset = 0
-                else :
-                    offset = (self.drawing_width - preview_width)/2
-            else :
-                preview_width = self.frame_width
-                preview_height = self.frame_height
-                if preview_width >= self.drawing_width:
-                    preview_width = self.drawing_width
-                    offset = 0
-                else :
-                    offset = (self.drawing_width - preview_width)/2
+            if self.enable_camera_preview == False:
                 self.boxes_printed = True
-                if args.validation:
+                if args.validation or self.evaluator is not None:
+                    # go through the pictures of the directory
                     self.still_picture_next = True
 
             # draw rectangle around the 5 first detected object with a score greater
-            # than the value determined in the threshold argument
-            MAX_PRINTED_BOXES = int((args.maximum_detection)/2)
-            for i in range (MAX_PRINTED_BOXES):
-                if i == 0:
-                    cr.set_source_rgb(1, 0, 0)
-                elif i == 1:
-                    cr.set_source_rgb(0, 1, 0)
-                elif i == 2:
-                    cr.set_source_rgb(0, 0, 1)
-                elif i == 3:
-                    cr.set_source_rgb(0.5, 0.5, 0)
-                elif i == 4:
-                    cr.set_source_rgb(0.5, 0, 0.5)
-                if self.nn_result_scores[0][i] > args.threshold:
-                    y0 = int(self.get_object_location_y0(i) * preview_height)
-                    x0 = int(self.get_object_location_x0(i) * preview_width)
-                    y1 = int(self.get_object_location_y1(i) * preview_height)
-                    x1 = int(self.get_object_location_x1(i) * preview_width)
-                    x = x0 + offset
-                    y = y0
-                    width = (x1 - x0)
-                    height = (y1 - y0)
-                    label = self.get_label(i)
-                    accuracy = self.nn_result_scores[0][i] * 100
-                    cr.rectangle(int(x),int(y),width,height)
-                    cr.stroke()
-                    cr.move_to(x , (y - (self.ui_cairo_font_size/2)))
-                    text_to_display = label + " " + str(int(accuracy)) + "%"
-                    cr.show_text(text_to_display)
-
+            # than the value determined in the threshold argument, the boxes
+            # are computed by update_overlay once per inference result
+            self.boxes_overlay.draw(cr)
             return True
-    def set_ui_param(self):
-        """
-        Setup all the UI parameter depending
-        on the screen size
-        """
-        self.ui_cairo_font_size_label = 35;
-        self.ui_cairo_font_size = 20;
-        self.ui_icon_exit_width = '50';
-        self.ui_icon_exit_height = '50';
-        self.ui_icon_st_width = '130';
-        self.ui_icon_st_height = '160';
-        if self.screen_height <= 272:
-               # Display 480x272 */
-               self.ui_cairo_font_size_label = 15;
-               self.ui_cairo_font_size = 7;
-               self.ui_icon_exit_width = '25';
-               self.ui_icon_exit_height = '25';
-               self.ui_icon_st_width = '42';
-               self.ui_icon_st_height = '52';
-        elif self.screen_height <= 480:
-               #Display 800x480 */
-               self.ui_cairo_font_size_label = 25;
-               self.ui_cairo_font_size = 13;
-               self.ui_icon_exit_width = '50';
-               self.ui_icon_exit_height = '50';
-               self.ui_icon_st_width = '65';
-               self.ui_icon_st_height = '80';
-
-    def valid_timeout_callback(self):
-        """
-        if timeout occurs that means that camera preview and the gtk is not
-        behaving as expected */
-        """
-        print("Timeout: camera preview and/or gtk is not behaving has expected\n");
-        self.destroy()
-        os._exit(1)
 
-    # Updating the labels and the inference infos displayed on the GUI interface - camera input
     def update_label_preview(self, label, inference_time, display_fps, inference_fps):
         """
         Updating the labels and the inference infos displayed on the GUI interface - camera input
         """
-        str_inference_time = str("{0:0.1f}".format(inference_time))
-        str_display_fps = str("{0:.1f}".format(display_fps))
-        str_inference_fps = str("{0:.1f}".format(inference_fps))
-
-        self.inf_time.set_markup("<span font=\'%d\' color='#FFFFFFFF'><b>%sms\n</b></span>" % (self.ui_cairo_font_size,str_inference_time))
-        self.inf_fps.set_markup("<span font=\'%d\' color='#FFFFFFFF'><b>%sfps\n</b></span>" % (self.ui_cairo_font_size,str_inference_fps))
-        self.disp_fps.set_markup("<span font=\'%d\' color='#FFFFFFFF'><b>%sfps\n</b></span>" % (self.ui_cairo_font_size,str_display_fps))
+        # the labels are refreshed at the --ui_refresh_rate rate by the scheduler
+        self.label_scheduler.submit(inference_time, display_fps, inference_fps)
         self.label_to_display = label
 
         if args.validation:
@@ -738,10 +465,39 @@ class MainUIWindow(Gtk.Window):
                 print("avg display fps= " + str(avg_prev_fps))
                 print("avg inference fps= " + str(avg_inf_fps))
                 print("avg inference time= " + str(avg_inf_time) + " ms")
+                print(self.metrics.summary())
+                print(self.label_scheduler.summary())
+                print(self.results.summary())
+                if self.video_widget.frame_sync is not None:
+                    print(self.video_widget.frame_sync.summary())
+                print(self.video_widget.rendering_summary())
+                print(self.nn.warm_up_summary())
+                if self.rate_controller is not None:
+                    print(self.rate_controller.summary())
+                if self.scene_gate is not None:
+                    print(self.scene_gate.summary())
+                if self.model_ladder is not None:
+                    print(self.model_ladder.summary())
+                if self.model_reloader is not None:
+                    print(self.model_reloader.summary())
+                if self.cascade is not None and self.inference_process is None:
+                    print(self.cascade.summary())
                 GLib.source_remove(self.valid_timeout_id)
                 self.destroy()
                 Gtk.main_quit()
 
+    def render_label_preview(self, inference_time, display_fps, inference_fps):
+        """
+        format the inference infos displayed on the GUI interface - camera input
+        """
+        str_inference_time = str("{0:0.1f}".format(inference_time))
+        str_display_fps = str("{0:.1f}".format(display_fps))
+        str_inference_fps = str("{0:.1f}".format(inference_fps))
+
+        return ((self.inf_time, "<span font=\'%d\' color='#FFFFFFFF'><b>%sms\n</b></span>" % (self.ui_cairo_font_size,str_inference_time)),
+                (self.inf_fps, "<span font=\'%d\' color='#FFFFFFFF'><b>%sfps\n</b></span>" % (self.ui_cairo_font_size,str_inference_fps)),
+                (self.disp_fps, "<span font=\'%d\' color='#FFFFFFFF'><b>%sfps\n</b></span>" % (self.ui_cairo_font_size,str_display_fps)))
+
     def update_label_still(self, label, inference_time):
         """
         update inference results in still picture mode
@@ -777,46 +533,43 @@ class MainUIWindow(Gtk.Window):
             return labels[int(self.nn_result_classes[0][idx])]
         return 0
 
-    def update_frame(self, frame):
+    def set_nn_results(self, results, pts):
         """
-        update frame in still picture mode
+        store the detection results of a frame, called on the GTK thread
+        which draws them
         """
-        img = Image.fromarray(frame)
-        data = img.tobytes()
-        data = GLib.Bytes.new(data)
-        pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(data,
-                                                 GdkPixbuf.Colorspace.RGB,
-                                                 False,
-                                                 8,
-                                                 frame.shape[1],
-                                                 frame.shape[0],
-                                                 frame.shape[2] * frame.shape[1])
-        self.image.set_from_pixbuf(pixbuf.copy())
-
-    # get random file in a directory
-    def getRandomFile(self, path):
+        self.nn_result_locations[:, :, :], self.nn_result_classes[:, :], self.nn_result_scores[:, :] = results[:3]
+        if self.cascade is not None:
+            self.nn_result_crop_classes[:, :], self.nn_result_crop_scores[:, :] = results[3:5]
+
+    def export_results(self, results, pts, source=None):
         """
-        Returns a random filename, chosen among the files of the given path.
+        stream the detection results of a frame out of the application if
+        requested
         """
-        if len(self.files) == 0:
-            self.files = os.listdir(path)
-
-        if len(self.files) == 0:
-            return '';
-
-        # remove .json file
-        item_to_remove = []
-        for item in self.files:
-            if item.endswith(".json"):
-                item_to_remove.append(item)
-
-        for item in item_to_remove:
-            self.files.remove(item)
+        if self.exporter is not None:
+            locations, classes, scores = results[:3]
+            self.exporter.publish_detection(pts, locations[0], classes[0],
+                                            scores[0], source=source)
 
-        index = random.randrange(0, len(self.files))
-        file_path = self.files[index]
-        self.files.pop(index)
-        return file_path
+    def update_overlay(self):
+        """
+        compute the boxes of the last inference result and invalidate
+        the areas covered by the previous and the new boxes
+        """
+        labels = self.nn.get_labels()
+        sub_labels = None
+        if self.cascade is not None:
+            # label of the second stage classification of each object
+            cascade_labels = self.cascade.get_labels()
+            sub_labels = [cascade_labels[c] if c >= 0 else None
+                          for c in self.nn_result_crop_classes[0]]
+        dirty = self.boxes_overlay.update(self.nn_result_locations[0],
+                                          self.nn_result_classes[0],
+                                          self.nn_result_scores[0],
+                                          labels, args.threshold, sub_labels)
+        for x, y, width, height in dirty:
+            self.drawing_area.queue_draw_area(x, y, width, height)
 
     def load_valid_results_from_json_file(self, json_file):
         """
@@ -828,7 +581,7 @@ class MainUIWindow(Gtk.Window):
         y0 = []
         x1 = []
         y1 = []
-        with open(args.image + "/" + json_file) as json_file:
+        with open(self.get_image_path(json_file)) as json_file:
             data = json.load(json_file)
             for obj in data['objects_info']:
                 name.append(obj['name'])
@@ -839,10 +592,37 @@ class MainUIWindow(Gtk.Window):
 
         return name, x0, y0, x1, y1
 
+    def evaluate_picture(self, rfile):
+        """
+        add the raw predictions of a picture to the evaluation, print the
+        evaluation report once all the pictures have been processed
+        """
+        json_path = self.get_image_path(os.path.splitext(rfile)[0] + '.json')
+        try:
+            gt_labels, gt_boxes = detection_eval.load_ground_truth(json_path)
+        except (OSError, ValueError, KeyError) as error:
+            print("WARNING: " + rfile + " skipped, no ground truth (" + str(error) + ")")
+        else:
+            labels = self.nn.get_labels()
+            names = [labels[c] if 0 <= c < len(labels) else str(c)
+                     for c in self.nn_result_classes[0].astype(int)]
+            # y0, x0, y1, x1 locations to x0, y0, x1, y1 boxes
+            boxes = self.nn_result_locations[0][:, [1, 0, 3, 2]]
+            self.evaluator.add(rfile, boxes, names, self.nn_result_scores[0],
+                               gt_boxes, gt_labels, self.nn_inference_time)
+
+        if len(self.files) == 0:
+            thresholds = sorted(set(np.round(np.arange(0.1, 1.0, 0.1), 2)) | {args.threshold})
+            print(self.evaluator.report(thresholds))
+            if args.evaluate != "":
+                self.evaluator.save(args.evaluate)
+                print("raw predictions stored in " + args.evaluate)
+            self.exit_app = True
+
     def update_camera_preview(self):
         """
-        if the last inference is done grab a new frame from appsink
-        and update the inference results
+        update the UI with the last inference result, called by
+        results_ready_cb once per new result
         """
         # write information on the GTK UI
         labels = self.nn.get_labels()
@@ -855,7 +635,13 @@ class MainUIWindow(Gtk.Window):
             self.valid_preview_fps.append(round(self.video_widget.instant_fps))
             self.valid_inference_time.append(round(self.nn_inference_time * 1000, 4))
 
+        loading_screen = (self.label_to_display == "")
         self.update_label_preview(str(label), inference_time, display_fps, inference_fps)
+        if loading_screen:
+            # remove the waiting screen
+            self.drawing_area.queue_draw()
+        if self.pipeline_overlay is None:
+            self.update_overlay()
         return True
 
     def still_picture(self,  widget, event):
@@ -878,7 +664,7 @@ class MainUIWindow(Gtk.Window):
         if self.still_picture_next and self.boxes_printed:
             # get randomly a picture in the directory
             rfile = self.getRandomFile(args.image)
-            img = Image.open(args.image + "/" + rfile)
+            img = Image.open(self.get_image_path(rfile))
             picture_width, picture_height = img.size
             # display the picture in the screen
             frame_ratio = picture_width/picture_height
@@ -886,19 +672,28 @@ class MainUIWindow(Gtk.Window):
             self.frame_width = int(frame_ratio * self.frame_height)
             if self.frame_width > self.drawing_width:
                 self.frame_width = self.drawing_width
-            prev_frame = cv2.resize(np.array(img), (self.frame_width, self.frame_height))
+                offset = 0
+            else :
+                offset = (self.drawing_width - self.frame_width)/2
+            self.boxes_overlay.set_geometry(self.frame_width, self.frame_height, offset)
+            # single copy of the picture shared by the preview and the inference
+            img_array = np.asarray(img)
+            prev_frame = cv2.resize(img_array, (self.frame_width, self.frame_height))
             # update the preview frame
             self.update_frame(prev_frame)
             self.boxes_printed = False
-            # execute the inference
-            nn_frame = cv2.resize(np.array(img), (nn_input_width, nn_input_height))
-            start_time = timer()
-            self.nn.launch_inference(nn_frame)
-            stop_time = timer()
+            # execute the inference, or replay its results from the
+            # prediction cache
+            results, self.nn_inference_time = self.infer_picture(self.nn, img_array,
+                                                                 self.get_image_path(rfile))
             self.still_picture_next = False;
-            self.nn_inference_time = stop_time - start_time
             self.nn_inference_fps = (1000/(self.nn_inference_time*1000))
-            self.nn_result_locations[:, :, :], self.nn_result_classes[:, :], self.nn_result_scores[:, :] = self.nn.get_results()
+            self.set_nn_results(results, -1)
+            self.export_results(results, -1, source=rfile)
+            self.first_result_done()
+            self.update_overlay()
+            if self.evaluator is not None:
+                self.evaluate_picture(rfile)
             # write information on the GTK UI
             inference_time = self.nn_inference_time * 1000
             labels = self.nn.get_labels()
@@ -912,7 +707,7 @@ class MainUIWindow(Gtk.Window):
                 #  get file path without extension
                 file_name_no_ext = os.path.splitext(rfile)[0]
 
-                print("\nInput file: " + args.image + "/" + rfile)
+                print("\nInput file: " + self.get_image_path(rfile))
 
                 # retreive associated JSON file information
                 expected_label, expected_x0, expected_y0, expected_x1, expected_y1 = self.load_valid_results_from_json_file(file_name_no_ext)
@@ -977,8 +772,9 @@ class MainUIWindow(Gtk.Window):
 
                 # store the inference time in a list so that we can compute the
                 # average later on
-                if self.first_call :
-                    #skip first inference time to avoid warmup time in EdgeTPU mode
+                if self.first_call and args.warmup_runs <= 0 :
+                    #without warm-up phase, skip first inference time to avoid
+                    #warmup time in EdgeTPU mode
                     self.first_call = False
                 else :
                     self.valid_inference_time.append(round(self.nn_inference_time * 1000, 4))
@@ -1006,6 +802,12 @@ class MainUIWindow(Gtk.Window):
             self.valid_timeout_id = GLib.timeout_add(35000,
                                                      self.valid_timeout_callback)
 
+        if args.metrics_port is not None and self.enable_camera_preview:
+            self.start_metrics_server()
+
+        if self.enable_camera_preview:
+            self.label_scheduler.start()
+
         if self.enable_camera_preview == False:
             # still picture
             # Check if image directory is empty
@@ -1030,28 +832,13 @@ if __name__ == '__main__':
     # add signal to catch CRTL+C
     signal.signal(signal.SIGINT, signal.SIG_DFL)
 
-    #Tensorflow Lite NN intitalisation
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--image", default="", help="image directory with image to be classified")
-    parser.add_argument("-v", "--video_device", default=0, help="video device (default /dev/video0)")
-    parser.add_argument("--frame_width", default=320, help="width of the camera frame (default is 320)")
-    parser.add_argument("--frame_height", default=240, help="height of the camera frame (default is 240)")
-    parser.add_argument("--framerate", default=15, help="framerate of the camera (default is 15fps)")
-    parser.add_argument("-m", "--model_file", default="", help=".tflite model to be executed")
-    parser.add_argument("-l", "--label_file", default="", help="name of file containing labels")
-    parser.add_argument("-e", "--ext_delegate",default = None, help="external_delegate_library path")
-    parser.add_argument("-p", "--perf", default='std', choices= ['std', 'max'], help="[EdgeTPU ONLY] Select the performance of the Coral EdgeTPU")
-    parser.add_argument("--edgetpu", action='store_true', help="enable Coral EdgeTPU acceleration")
-    parser.add_argument("--input_mean", default=127.5, help="input mean")
-    parser.add_argument("--input_std", default=127.5, help="input standard deviation")
-    parser.add_argument("--validation", action='store_true', help="enable the validation mode")
-    parser.add_argument("--num_threads", default=None, help="Select the number of threads used by tflite interpreter to run inference")
-    parser.add_argument("--maximum_detection", default=10, type=int, help="Adjust the maximum number of object detected in a frame accordingly to your NN model (default is 10)")
-    parser.add_argument("--threshold", default=0.60, type=float, help="threshold of accuracy above which the boxes are displayed (default 0.60)")
-    args = parser.parse_args()
+    #init gstreamer
+    Gst.init(None)
+    startup.mark("modules imported")
+
 
     try:
-        win = MainUIWindow(args)
+        win = MainUIWindow(args, startup)
         win.connect("delete-event", Gtk.main_quit)
         win.connect("destroy", destroy_window)
         win.show_all()